@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Query and update throughput of :class:`pyfarm.core.agents.AgentIndex`
+with 100,000 agents compared to filtering a list of agents.
+"""
+
+from __future__ import print_function
+
+import random
+
+from common import header, timed, timed_once
+
+from pyfarm.core.enums import (
+    DBAgentState, DBOperatingSystem, DBUseAgentAddress, StateSet,
+    _UseAgentAddress)
+from pyfarm.core.agents import AgentIndex
+
+AGENTS = 100000
+
+
+def main():
+    random.seed(0)
+    states = list(DBAgentState)
+    systems = list(DBOperatingSystem)
+    addresses = list(DBUseAgentAddress)
+    agents = [
+        (agent_id, random.choice(states), random.choice(systems),
+         random.choice(addresses))
+        for agent_id in range(AGENTS)]
+
+    index = AgentIndex()
+    for agent in agents:
+        index.add(*agent)
+
+    not_passive = ~StateSet(_UseAgentAddress, ["passive"])
+    header("%d agents" % AGENTS)
+    timed("query(online, linux, not passive)",
+          lambda: index.query(
+              state=DBAgentState.ONLINE, os=DBOperatingSystem.LINUX,
+              address=not_passive), 1000, "query")
+    timed("count(online, linux, not passive)",
+          lambda: index.count(
+              state=DBAgentState.ONLINE, os=DBOperatingSystem.LINUX,
+              address=not_passive), 100000, "query")
+    timed("counts('state')", lambda: index.counts("state"), 100000, "query")
+
+    passive = DBUseAgentAddress.PASSIVE
+    timed("reference: list comprehension",
+          lambda: set(
+              agent[0] for agent in agents
+              if agent[1] == DBAgentState.ONLINE and
+              agent[2] == DBOperatingSystem.LINUX and agent[3] != passive),
+          20, "query")
+
+    updates = [
+        (random.randrange(AGENTS), random.choice(states))
+        for _ in range(100000)]
+    update = index.update
+
+    def apply_updates():
+        for agent_id, state in updates:
+            update(agent_id, state=state)
+    timed_once("update(state=...)", apply_updates, len(updates), "update")
+
+
+if __name__ == "__main__":
+    main()
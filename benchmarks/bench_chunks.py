@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Splitting a job with millions of frames into task batches with
+:func:`pyfarm.core.utility.chunk_frames` compared to building the list
+of frames and slicing it.
+"""
+
+from __future__ import division, print_function
+
+import tracemalloc
+from itertools import islice
+
+from common import header, timed, timed_once
+
+from pyfarm.core.utility import FrameCost, FrameSet, chunk_frames
+
+EXPRESSION = "1-10000000"
+COSTS = FrameCost({"1-2000000": 4.0, "5000000-5500000": 20.0})
+
+
+def slice_list(expression, size):
+    """What a caller has to do today, slice a list of every frame"""
+    start, end = map(int, expression.split("-"))
+    frames = list(range(start, end + 1))
+    return [frames[index:index + size]
+            for index in range(0, len(frames), size)]
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def consume(chunks):
+    count = 0
+    for _ in chunks:
+        count += 1
+    return count
+
+
+def main():
+    frames = FrameSet(EXPRESSION)
+    length = len(frames)
+
+    header("%s, %d frames" % (EXPRESSION, length))
+    timed("first batch, size=100",
+          lambda: next(chunk_frames(frames, size=100)), 10000, "job")
+    timed("first 10 batches, count=1000",
+          lambda: list(islice(chunk_frames(frames, count=1000), 10)),
+          1000, "job")
+    timed("first 10 batches, max_cost=4000 with FrameCost",
+          lambda: list(islice(
+              chunk_frames(frames, max_cost=4000, cost=COSTS), 10)),
+          1000, "job")
+
+    header("every batch")
+    for label, kwargs in (
+            ("size=100", {"size": 100}),
+            ("count=1000", {"count": 1000}),
+            ("count=1000 with FrameCost", {"count": 1000, "cost": COSTS}),
+            ("max_cost=4000 with FrameCost",
+             {"max_cost": 4000, "cost": COSTS})):
+        count = timed_once(
+            label, lambda: consume(chunk_frames(frames, **kwargs)),
+            1, "job")
+        print("    %d batches, peak memory %d bytes" % (
+            count, peak_memory(
+                lambda: consume(chunk_frames(frames, **kwargs)))))
+
+    function = COSTS.__call__
+    timed_once("count=1000 with a cost function",
+               lambda: consume(
+                   chunk_frames(frames, count=1000, cost=function)),
+               1, "job")
+    timed_once("reference: slice a list, size=100",
+               lambda: slice_list(EXPRESSION, 100), 1, "job")
+    print("    peak memory %.0fMB" % (
+        peak_memory(lambda: slice_list(EXPRESSION, 100)) / 1024 / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Rendering per-frame command lines with
+:class:`pyfarm.core.commands.CommandTemplate` compared to building a
+:class:`string.Template` and calling
+:meth:`string.Template.safe_substitute` for every frame, which is what
+:meth:`pyfarm.core.config.Configuration._expandvars` does.
+"""
+
+from __future__ import division, print_function
+
+import os
+from string import Template
+
+from common import header, timed, timed_once
+
+from pyfarm.core.commands import CommandTemplate
+from pyfarm.core.utility import FrameSet
+
+COMMAND = ("$renderer -r $engine -s $start -e $end -rd $output "
+           "-im ${shot}_$frame -proj $project $scene")
+ARGUMENTS = ("$renderer", "-r", "$engine", "-s", "$start", "-e", "$end",
+             "-rd", "$output", "-im", "${shot}_$frame", "-proj", "$project",
+             "$scene")
+CONFIG = {
+    "renderer": "/opt/maya/bin/Render", "engine": "arnold",
+    "output": "$project/images/$shot", "project": "/projects/show",
+    "shot": "sh010", "scene": "$project/scenes/$shot.ma"}
+FRAMES = 1000000
+
+
+def values():
+    template_values = dict(os.environ)
+    template_values.update(CONFIG)
+    return template_values
+
+
+def substitute(frames, template_values):
+    """What a caller has to do today, every frame parses the template"""
+    start, end = frames[0], frames[-1]
+    commands = []
+    for frame in frames:
+        value = COMMAND
+        for _ in range(10):
+            expanded = Template(value).safe_substitute(
+                template_values, frame=frame, start=start, end=end)
+            if expanded == value:
+                break
+            value = expanded
+        commands.append(value)
+    return commands
+
+
+def substitute_once(frames, template_values):
+    """A single safe_substitute per frame with a Template built once"""
+    start, end = frames[0], frames[-1]
+    template = Template(COMMAND)
+    return [template.safe_substitute(
+        template_values, frame=frame, start=start, end=end)
+        for frame in frames]
+
+
+def main():
+    template_values = values()
+    frames = FrameSet("1-%d" % FRAMES)
+    frame_list = list(frames)
+    template = CommandTemplate(COMMAND, template_values)
+    arguments = CommandTemplate(ARGUMENTS, template_values)
+
+    header("compile, %d variables available" % len(template_values))
+    timed("CommandTemplate(command, values)",
+          lambda: CommandTemplate(COMMAND, template_values), 10000, "op")
+
+    header("%d frames" % FRAMES)
+    timed_once("reference: Template.safe_substitute until expanded",
+               lambda: substitute(frame_list, template_values),
+               FRAMES, "frame")
+    timed_once("reference: one Template.safe_substitute",
+               lambda: substitute_once(frame_list, template_values),
+               FRAMES, "frame")
+    timed_once("CommandTemplate.render",
+               lambda: [template.render(frame, 1, FRAMES)
+                        for frame in frame_list],
+               FRAMES, "frame")
+    timed_once("CommandTemplate.render_many, FrameSet",
+               lambda: template.render_many(frames), FRAMES, "frame")
+    timed_once("CommandTemplate.render_many, arguments",
+               lambda: arguments.render_many(frames), FRAMES, "frame")
+
+    assert template.render_many(frame_list[:1000]) == \
+        substitute(frame_list[:1000], template_values)
+
+
+if __name__ == "__main__":
+    main()
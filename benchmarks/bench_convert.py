@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Converting 10M row columns with the batch conversions in
+:class:`pyfarm.core.utility.convert` compared to calling the scalar
+version for every row.
+"""
+
+from __future__ import division, print_function
+
+import random
+
+from common import header, timed_once
+
+from pyfarm.core.utility import convert
+
+ROWS = 10000000
+
+# Calling the scalar functions for every row of a 10M row column takes
+# minutes for convert.ston(), they're timed on the start of the column.
+SCALAR_ROWS = 1000000
+
+
+def column(choices):
+    random.seed(0)
+    return [random.choice(choices) for _ in range(ROWS)]
+
+
+def scalar(func, values):
+    """Calls ``func`` for each value the way callers do today"""
+    results = []
+    for value in values:
+        try:
+            results.append(func(value))
+        except (TypeError, ValueError):
+            results.append(None)
+    return results
+
+
+def main():
+    tests = (
+        ("bool", convert.bool, convert.bools,
+         ["yes", "no", "True", "false", "1", "0", "Y", "n", "bad"]),
+        ("none", convert.none, convert.nones,
+         ["null", "None", "", "NONE", "value"]),
+        ("ston", convert.ston, convert.stons,
+         [str(number) for number in range(1000)] + ["1.5", "x"]),
+        ("list", convert.list, convert.lists,
+         ["a,b", "render, linux", "a,,b", "gpu"]))
+
+    for name, one, many, choices in tests:
+        values = column(choices)
+        header("%s, %d rows of %d distinct values" % (
+            name, ROWS, len(choices)))
+        timed_once("convert.%s() per row, first %d rows" % (
+            name, SCALAR_ROWS),
+            lambda: scalar(one, values[:SCALAR_ROWS]), SCALAR_ROWS, "row")
+        timed_once("convert.%ss()" % name,
+                   lambda: many(values), ROWS, "row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmarks for comparison, membership and coercion of the
+values in :mod:`pyfarm.core.enums` and for :class:`StateSet`.
+"""
+
+from __future__ import print_function
+
+from array import array
+
+from common import header, timed, timed_once
+
+from pyfarm.core.enums import (
+    WorkState, DBWorkState, StateSet, _WorkState)
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+NUMBER = 1000000
+TASKS = 10000000
+
+
+def main():
+    running = _WorkState.RUNNING
+    failed = _WorkState.FAILED
+
+    header("Values comparison")
+    timed("Values == str", lambda: running == "running", NUMBER)
+    timed("Values == int", lambda: running == 105, NUMBER)
+    timed("Values == Values", lambda: running == failed, NUMBER)
+    timed("Values != str", lambda: running != "done", NUMBER)
+    timed("Values < int", lambda: running < 107, NUMBER)
+    timed("Values < Values", lambda: running < failed, NUMBER)
+    timed("hash(Values)", lambda: hash(running), NUMBER)
+
+    header("Membership")
+    timed("str in WorkState (hit)", lambda: "running" in WorkState, NUMBER)
+    timed("str in WorkState (miss)", lambda: "foo" in WorkState, NUMBER)
+    timed("int in DBWorkState (hit)", lambda: 105 in DBWorkState, NUMBER)
+    timed("int in DBWorkState (miss)", lambda: 42 in DBWorkState, NUMBER)
+    timed("Values in WorkState", lambda: running in WorkState, NUMBER)
+
+    header("Coercion")
+    timed("WorkState._cast(int)", lambda: WorkState._cast(105), NUMBER)
+    timed("DBWorkState._cast(str)", lambda: DBWorkState._cast("done"), NUMBER)
+    timed("DBWorkState._cast(Values)",
+          lambda: DBWorkState._cast(running), NUMBER)
+    timed("WorkState._member(str)",
+          lambda: WorkState._member("failed"), NUMBER)
+
+    # Used as a reference point for the above
+    header("Reference")
+    table = {105: "running"}
+    timed("dict lookup", lambda: table[105], NUMBER)
+
+
+
+def state_sets():
+    finished = StateSet(_WorkState, ["done", "failed"])
+    python_set = set(["done", "failed", 106, 107])
+
+    header("StateSet")
+    timed("str in StateSet", lambda: "done" in finished, NUMBER)
+    timed("int in StateSet", lambda: 105 in finished, NUMBER)
+    timed("reference: str in set", lambda: "done" in python_set, NUMBER)
+    timed("StateSet | StateSet", lambda: finished | finished, NUMBER)
+
+    codes = array("i", [100, 105, 106, 107]) * (TASKS // 4)
+    timed_once("StateSet.isin(array), %d codes" % len(codes),
+               lambda: finished.isin(codes), len(codes), "code")
+
+    if numpy is not None:
+        numpy_codes = numpy.frombuffer(codes, dtype=numpy.int32)
+        timed_once("StateSet.isin(numpy), %d codes" % len(codes),
+                   lambda: finished.isin(numpy_codes), len(codes), "code")
+
+
+if __name__ == "__main__":
+    main()
+    state_sets()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Building task environments with
+:class:`pyfarm.core.environment.EnvironmentBuilder` compared to copying
+every layer into a new :class:`dict` for each task.
+"""
+
+from __future__ import division, print_function
+
+import tracemalloc
+
+from common import header, timed_once
+
+from pyfarm.core.environment import EnvironmentBuilder
+
+VARIABLES = 200
+JOBS = 10
+TASKS = 10000
+
+BASE = dict(("AGENT_VAR_%d" % index, "/opt/value/%d" % index)
+            for index in range(VARIABLES))
+CONFIG = dict(("CONFIG_VAR_%d" % index, "config-%d" % index)
+              for index in range(20))
+JOB = dict(("JOB_VAR_%d" % index, "job-%d" % index) for index in range(10))
+
+
+def copy_layers(job, task):
+    """What a caller has to do today, copy every layer for each task"""
+    environment = dict(BASE)
+    environment.update(CONFIG)
+    environment.update(job)
+    environment.update(task)
+    return environment
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    tasks = [(job_id, {"PYFARM_FRAME": str(frame)})
+             for job_id in range(JOBS) for frame in range(TASKS // JOBS)]
+
+    def builder():
+        builder = EnvironmentBuilder(BASE, CONFIG)
+        for job_id in range(JOBS):
+            builder.set_job(job_id, JOB)
+        return builder
+
+    header("%d tasks in %d jobs, %d variables" % (
+        len(tasks), JOBS, VARIABLES + len(CONFIG) + len(JOB) + 1))
+
+    timed_once("reference: copy layers into a dict per task",
+               lambda: [copy_layers(JOB, task) for _, task in tasks],
+               len(tasks), "task")
+    shared = builder()
+    timed_once("EnvironmentBuilder.environment",
+               lambda: [shared.environment(job_id, task)
+                        for job_id, task in tasks],
+               len(tasks), "task")
+
+    header("held until spawn, peak memory")
+    reference, _ = peak_memory(
+        lambda: [copy_layers(JOB, task) for _, task in tasks])
+    print("reference: dict per task              %8.1fMB" % (
+        reference / 1024 / 1024))
+    environments, _ = peak_memory(
+        lambda: (lambda b: [b.environment(job_id, task)
+                            for job_id, task in tasks])(builder()))
+    print("EnvironmentBuilder.environment        %8.1fMB" % (
+        environments / 1024 / 1024))
+
+    header("at spawn time")
+    timed_once("EnvironmentBuilder.environ",
+               lambda: [shared.environ(job_id, task)
+                        for job_id, task in tasks],
+               len(tasks), "task")
+    timed_once("EnvironmentBuilder.envp",
+               lambda: [shared.envp(job_id, task)
+                        for job_id, task in tasks],
+               len(tasks), "task")
+    timed_once("dict(EnvironmentBuilder.environment)",
+               lambda: [dict(shared.environment(job_id, task).items())
+                        for job_id, task in tasks],
+               len(tasks), "task")
+
+    shared.set_layers(BASE, CONFIG, {"NEW": "1"})
+    timed_once("first environ per job after set_layers",
+               lambda: [shared.environ(job_id) for job_id in range(JOBS)],
+               JOBS, "job")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Parsing, membership, set operations and compression with
+:class:`pyfarm.core.utility.FrameSet` for jobs with millions of frames
+compared to materializing the frames with :meth:`convert.list` and a
+:class:`set`.
+"""
+
+from __future__ import division, print_function
+
+import random
+import tracemalloc
+
+from common import header, timed, timed_once
+
+from pyfarm.core.utility import FrameSet, convert
+
+EXPRESSION = "1-5000000x2,6000000,7000000-9000000"
+OTHER = "1-3000000x4,4000000-8000000"
+
+# Operations whose results can't be represented by a few runs, steps
+# which don't divide each other or removing every Nth frame for N > 2,
+# the overlapping frames are enumerated to build the result.
+FRAGMENTING = (("|", "1-9000000x3"), ("-", "1-9000000x4"))
+
+
+def expand(expression):
+    """What a caller has to do today, every frame in a set"""
+    frames = set()
+    for token in convert.list(expression):
+        start, _, rest = token.partition("-")
+        end, _, step = rest.partition("x")
+        frames.update(range(int(start), int(end or start) + 1, int(step or 1)))
+    return frames
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    frames = FrameSet(EXPRESSION)
+    other = FrameSet(OTHER)
+    expanded = expand(EXPRESSION)
+    expanded_other = expand(OTHER)
+
+    header("%s, %d frames" % (EXPRESSION, len(frames)))
+    timed("FrameSet(expression)", lambda: FrameSet(EXPRESSION), 10000, "parse")
+    timed_once("reference: expand into a set", lambda: expand(EXPRESSION),
+               1, "parse")
+    print("FrameSet peak memory: %d bytes" % peak_memory(
+        lambda: FrameSet(EXPRESSION)))
+    print("set peak memory: %.0fMB" % (
+        peak_memory(lambda: expand(EXPRESSION)) / 1024 / 1024))
+
+    header("membership")
+    random.seed(0)
+    probes = [random.randrange(10000000) for _ in range(100000)]
+    timed_once("frame in FrameSet",
+               lambda: [probe in frames for probe in probes],
+               len(probes), "lookup")
+    timed_once("frame in set",
+               lambda: [probe in expanded for probe in probes],
+               len(probes), "lookup")
+
+    header("set operations with %s" % OTHER)
+    for label, operation, reference in (
+            ("|", frames.union, expanded.union),
+            ("&", frames.intersection, expanded.intersection),
+            ("-", frames.difference, expanded.difference)):
+        timed("FrameSet %s" % label, lambda: operation(other), 1000, "op")
+        timed_once("reference: set %s" % label,
+                   lambda: reference(expanded_other), 1, "op")
+
+    for label, expression in FRAGMENTING:
+        fragmenting = FrameSet(expression)
+        operation = frames.union if label == "|" else frames.difference
+        result = timed_once(
+            "FrameSet %s %s" % (label, expression),
+            lambda: operation(fragmenting), 1, "op")
+        print("    %d runs" % len(result.runs))
+
+    header("compression")
+    random.seed(0)
+    frame_list = sorted(random.sample(range(1000000), 200000) +
+                        list(range(2000000, 3000000)))
+    timed_once("FrameSet(frames) + str(), %d frames" % len(frame_list),
+               lambda: str(FrameSet(frame_list)), len(frame_list), "frame")
+    print("frames to %d runs" % len(FrameSet(frame_list).runs))
+    timed_once("iterate %d frames" % len(frames),
+               lambda: sum(1 for _ in frames), len(frames), "frame")
+
+
+if __name__ == "__main__":
+    main()
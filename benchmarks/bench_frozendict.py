@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of deriving per-task environments from a shared 200 variable base
+with :class:`pyfarm.core.utility.FrozenDict` compared to copying a
+:class:`dict` or :class:`pyfarm.core.utility.ImmutableDict`, and the
+memory each derived environment holds on to.
+"""
+
+from __future__ import division, print_function
+
+import tracemalloc
+
+from common import header, timed, timed_once
+
+from pyfarm.core.utility import FrozenDict, ImmutableDict
+
+VARIABLES = 200
+TASKS = 100000
+KEPT = 10000
+
+
+def task_env(frame):
+    return {"PYFARM_FRAME": str(frame), "PYFARM_START": str(frame),
+            "PYFARM_END": str(frame + 1)}
+
+
+def derive_dict(base, frame):
+    env = dict(base)
+    env.update(task_env(frame))
+    return env
+
+
+def derive_immutable(base, frame):
+    return ImmutableDict(base, **task_env(frame))
+
+
+def derive_frozen(base, frame):
+    return base.merge(task_env(frame))
+
+
+def derive_frozen_set(base, frame):
+    frame = str(frame)
+    return base.set("PYFARM_FRAME", frame).set(
+        "PYFARM_START", frame).set("PYFARM_END", str(int(frame) + 1))
+
+
+def retained(derive, base):
+    """Returns the bytes held by KEPT environments derived from ``base``"""
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        kept = [derive(base, frame) for frame in range(KEPT)]
+        return tracemalloc.get_traced_memory()[0] - start
+    finally:
+        del kept
+        tracemalloc.stop()
+
+
+def main():
+    variables = dict(
+        ("VARIABLE_%03d" % index, "/some/path/%d" % index)
+        for index in range(VARIABLES))
+    bases = {
+        "dict": variables, "ImmutableDict": ImmutableDict(variables),
+        "FrozenDict": FrozenDict(variables)}
+    tests = (
+        ("dict copy + update()", derive_dict, "dict"),
+        ("ImmutableDict(base, **task)", derive_immutable, "ImmutableDict"),
+        ("FrozenDict.merge()", derive_frozen, "FrozenDict"),
+        ("FrozenDict.set() x3", derive_frozen_set, "FrozenDict"))
+
+    header("derive %d task environments, %d variables" % (TASKS, VARIABLES))
+    for label, derive, base in tests:
+        base = bases[base]
+        timed_once(
+            label, lambda: [derive(base, frame) for frame in range(TASKS)],
+            TASKS, "env")
+
+    header("derive and hash as a cache key")
+    base = bases["FrozenDict"]
+    hash(base)
+    timed_once(
+        "FrozenDict.set() x3 + hash()",
+        lambda: [hash(derive_frozen_set(base, frame))
+                 for frame in range(TASKS)], TASKS, "env")
+    timed_once(
+        "reference: frozenset(dict.items()) + hash()",
+        lambda: [hash(frozenset(derive_dict(variables, frame).items()))
+                 for frame in range(TASKS)], TASKS, "env")
+
+    header("lookups")
+    frozen = bases["FrozenDict"]
+    timed("dict[key]", lambda: variables["VARIABLE_100"], 1000000, "lookup")
+    timed("FrozenDict[key]", lambda: frozen["VARIABLE_100"], 1000000, "lookup")
+
+    header("memory held by %d derived environments" % KEPT)
+    for label, derive, base in tests:
+        print("%-30s %8.0f bytes/env" % (
+            label, retained(derive, bases[base]) / KEPT))
+
+
+if __name__ == "__main__":
+    main()
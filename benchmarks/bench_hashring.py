@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Lookup and bulk partitioning throughput of
+:class:`pyfarm.core.hashring.HashRing` with 50 masters along with the
+size of the ring in memory and when serialized with
+:meth:`pyfarm.core.hashring.HashRing.to_dict`.
+"""
+
+from __future__ import print_function
+
+import json
+
+from common import header, timed, timed_once
+
+from pyfarm.core.hashring import HashRing, numpy
+
+MASTERS = 50
+JOBS = 1000000
+
+
+def main():
+    nodes = ["master%02d.example.com" % index for index in range(MASTERS)]
+    header("%d masters" % MASTERS)
+    ring = timed_once("HashRing(%d masters)" % MASTERS,
+                      lambda: HashRing(nodes), MASTERS, "node")
+    ring_bytes = (
+        len(ring._points) * ring._points.itemsize +
+        len(ring._owners) * ring._owners.itemsize)
+    print("virtual nodes: %d" % len(ring._points))
+    print("points in memory: %d bytes" % ring_bytes)
+    print("to_dict() as JSON: %d bytes" % len(json.dumps(ring.to_dict())))
+
+    jobs = list(range(JOBS))
+    timed("get(job_id)", lambda: ring.get(123456), 100000, "lookup")
+    timed_once("get_many(list)", lambda: ring.get_many(jobs), JOBS, "job")
+    timed_once("partition(list)", lambda: ring.partition(jobs), JOBS, "job")
+    if numpy is not None:
+        job_array = numpy.arange(JOBS)
+        timed_once("partition(ndarray)",
+                   lambda: ring.partition(job_array), JOBS, "job")
+
+    names = ["job-%d" % job for job in range(JOBS // 10)]
+    timed_once("get_many(str)", lambda: ring.get_many(names), len(names),
+               "job")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of :meth:`pyfarm.core.agents.HeartbeatTracker.expire` as the number
+of tracked agents grows from 1,000 to 1,000,000 compared to scanning a
+dictionary of last heartbeat times.  The clock advances one second per
+sweep and the same number of agents expire in each sweep at every size
+so the time per sweep for the timing wheel should stay flat while the
+scan grows with the number of agents.
+"""
+
+from __future__ import division, print_function
+
+from timeit import default_timer
+
+from common import header, timed_once
+
+from pyfarm.core.agents import HeartbeatTracker
+
+TIMEOUT = 120
+SWEEPS = 100
+EXPIRING = 10  # agents which expire per sweep
+
+
+def sweep_wheel(agents):
+    now = [0.0]
+    tracker = HeartbeatTracker(TIMEOUT, clock=lambda: now[0])
+
+    # The first EXPIRING * SWEEPS agents expire in batches of EXPIRING,
+    # one batch per sweep, everyone else stays alive for every sweep.
+    for agent_id in range(agents):
+        if agent_id < EXPIRING * SWEEPS:
+            tracker.heartbeat(agent_id, timeout=agent_id // EXPIRING + 1)
+        else:
+            tracker.heartbeat(agent_id)
+
+    start = default_timer()
+    for second in range(1, SWEEPS + 1):
+        now[0] = second
+        tracker.expire()
+    return default_timer() - start
+
+
+def sweep_scan(agents):
+    last_seen = dict.fromkeys(range(agents), 0.0)
+    start = default_timer()
+    for second in range(1, 11):
+        dead = [agent_id for agent_id, seen in last_seen.items()
+                if second - seen >= TIMEOUT]
+        for agent_id in dead:
+            del last_seen[agent_id]
+    return (default_timer() - start) * SWEEPS / 10
+
+
+def main():
+    header("HeartbeatTracker.expire() (%d sweeps)" % SWEEPS)
+    print("%10s %18s %18s" % ("agents", "wheel us/sweep", "scan us/sweep"))
+    for agents in (1000, 10000, 100000, 1000000):
+        wheel = sweep_wheel(agents)
+        scan = sweep_scan(agents)
+        print("%10d %18.1f %18.1f" % (
+            agents, wheel / SWEEPS * 1e6, scan / SWEEPS * 1e6))
+
+    tracker = HeartbeatTracker(TIMEOUT, clock=lambda: 0.0)
+    agents = range(1000000)
+
+    def heartbeats():
+        for agent_id in agents:
+            tracker.heartbeat(agent_id)
+
+    header("HeartbeatTracker.heartbeat()")
+    timed_once("heartbeat() x 1M (insert)", heartbeats, len(agents), "call")
+    timed_once("heartbeat() x 1M (move)", heartbeats, len(agents), "call")
+
+
+if __name__ == "__main__":
+    main()
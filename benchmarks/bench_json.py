@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Throughput and peak memory of :func:`pyfarm.core.utility.dumps` and the
+streaming :func:`pyfarm.core.utility.dump` for a job/task payload of
+roughly 200MB of JSON.
+"""
+
+from __future__ import division, print_function
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+from common import header, timed_once
+
+from pyfarm.core.enums import _WorkState
+from pyfarm.core.utility import dump, dumps
+
+PAYLOAD_MB = 200
+
+# Approximate size of one task in the output
+TASK_BYTES = 160
+
+
+def payload():
+    random.seed(0)
+    states = list(_WorkState)
+    jobs = []
+    tasks = PAYLOAD_MB * 1024 * 1024 // TASK_BYTES
+    for job_id in range(tasks // 1000):
+        jobs.append({
+            "id": job_id, "state": random.choice(states),
+            "title": "job %d" % job_id,
+            "tasks": [
+                {"id": job_id * 1000 + index, "frame": float(index),
+                 "state": random.choice(states),
+                 "agent": "render%04d.example.com" % random.randrange(5000),
+                 "attempts": random.randrange(3),
+                 "time_started": 1400000000.5 + index,
+                 "time_finished": 1400000100.5 + index}
+                for index in range(1000)]})
+    return {"jobs": jobs}
+
+
+def peak_memory(func):
+    """Returns the peak memory allocated while running ``func``"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    data = payload()
+    size = len(dumps(data))
+    tasks = sum(len(job["tasks"]) for job in data["jobs"])
+    tempdir = tempfile.mkdtemp()
+    path = os.path.join(tempdir, "payload.json")
+
+    def to_file():
+        with open(path, "w") as stream:
+            dump(data, stream)
+
+    try:
+        header("%d tasks, %.0fMB of JSON" % (tasks, size / 1024 / 1024))
+        timed_once("dumps()", lambda: dumps(data), tasks, "task")
+        timed_once("dump() to a file", to_file, tasks, "task")
+        timed_once("reference: json.dumps(), Values as arrays",
+                   lambda: json.dumps(data), tasks, "task")
+
+        header("peak memory")
+        print("dumps(): %.0fMB" % (
+            peak_memory(lambda: dumps(data)) / 1024 / 1024))
+        print("dump() to a file: %.1fMB" % (
+            peak_memory(to_file) / 1024 / 1024))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == "__main__":
+    main()
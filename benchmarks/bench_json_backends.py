@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Encoding and decoding throughput of each available
+:class:`pyfarm.core.utility.JSONBackend` for a payload of job and task
+dictionaries, with and without restoring enums in
+:meth:`pyfarm.core.utility.JSONBackend.loads`.
+"""
+
+from __future__ import division, print_function
+
+import random
+
+from common import header, timed_once
+
+from pyfarm.core.enums import _WorkState
+from pyfarm.core.utility import JSON_BACKENDS
+
+JOBS = 100
+TASKS_PER_JOB = 1000
+
+
+def payload():
+    random.seed(0)
+    states = list(_WorkState)
+    return {"jobs": [
+        {"id": job_id, "state": random.choice(states),
+         "title": "job %d" % job_id,
+         "tasks": [
+             {"id": job_id * TASKS_PER_JOB + index, "frame": float(index),
+              "state": random.choice(states),
+              "agent": "render%04d.example.com" % random.randrange(5000),
+              "attempts": random.randrange(3),
+              "time_started": 1400000000.5 + index,
+              "time_finished": 1400000100.5 + index}
+             for index in range(TASKS_PER_JOB)]}
+        for job_id in range(JOBS)]}
+
+
+def main():
+    data = payload()
+    tasks = JOBS * TASKS_PER_JOB
+    enums = {"state": _WorkState}
+
+    for backend in JSON_BACKENDS:
+        if not backend.available:
+            print("%s: not installed" % backend.name)
+            continue
+
+        backend = backend()
+        encoded = backend.dumps(data)
+        header("%s, %.0fMB of JSON" % (
+            backend.name, len(encoded) / 1024 / 1024))
+        timed_once("dumps()", lambda: backend.dumps(data), tasks, "task")
+        timed_once("loads()", lambda: backend.loads(encoded), tasks, "task")
+        timed_once("loads(enums=...)",
+                   lambda: backend.loads(encoded, enums=enums), tasks, "task")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Placement rate and packing efficiency of
+:class:`pyfarm.core.placement.ResourceMatcher` with 10,000 agents and
+1,000,000 tasks compared to a linear best-fit scan over the agents.
+"""
+
+from __future__ import division, print_function
+
+import random
+from collections import deque
+
+from common import header, timed_once
+
+from pyfarm.core.placement import ResourceMatcher
+
+AGENTS = 10000
+TASKS = 1000000
+
+
+def build(agents):
+    matcher = ResourceMatcher()
+    for agent_id, cpus, ram in agents:
+        matcher.add_agent(agent_id, cpus, ram)
+    return matcher
+
+
+def efficiency(matcher):
+    cpus, ram, free_cpus, free_ram = matcher.capacity()
+    return "cpu %.1f%% ram %.1f%% used" % (
+        100 * (cpus - free_cpus) / cpus, 100 * (ram - free_ram) / ram)
+
+
+def main():
+    random.seed(0)
+    agents = [
+        (agent_id, random.choice((8, 16, 32, 64)),
+         random.choice((16, 32, 64, 128, 256)) * 1024)
+        for agent_id in range(AGENTS)]
+    tasks = [
+        (task_id, random.choice((1, 1, 2, 4, 8)),
+         random.randint(1, 32) * 512)
+        for task_id in range(TASKS)]
+
+    for decreasing in (False, True):
+        matcher = build(agents)
+        header("assign_many(), %d agents, %d tasks, decreasing=%s" % (
+            AGENTS, TASKS, decreasing))
+        assigned, _ = timed_once(
+            "assign_many()",
+            lambda: matcher.assign_many(tasks, decreasing=decreasing),
+            TASKS, "task")
+        print("%d tasks placed, %s" % (len(assigned), efficiency(matcher)))
+
+    # Steady state, once the farm is full every new task waits for the
+    # oldest running task to finish.
+    matcher = build(agents)
+    running = deque()
+
+    def stream():
+        assign = matcher.assign
+        release = matcher.release
+        for task_id, cpus, ram in tasks:
+            while assign(task_id, cpus, ram) is None:
+                release(running.popleft())
+            running.append(task_id)
+
+    header("assign() + release() stream, %d agents" % AGENTS)
+    timed_once("assign() + release()", stream, TASKS, "task")
+    print("%d tasks running, %s" % (len(running), efficiency(matcher)))
+
+    free = dict((agent_id, [cpus, ram]) for agent_id, cpus, ram in agents)
+
+    def best_fit():
+        for _, cpus, ram in tasks[:1000]:
+            fits = [
+                (agent[0] - cpus, agent[1] - ram, agent_id)
+                for agent_id, agent in free.items()
+                if agent[0] >= cpus and agent[1] >= ram]
+            if fits:
+                agent = free[min(fits)[2]]
+                agent[0] -= cpus
+                agent[1] -= ram
+
+    header("reference")
+    timed_once("linear best-fit scan (1000 tasks)", best_fit, 1000, "task")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Memory and construction/lookup cost of 1M per-task metadata records
+built by :func:`pyfarm.core.utility.record_type` compared to
+:class:`pyfarm.core.utility.ImmutableDict`, :class:`dict` and
+:class:`pyfarm.core.utility.FrozenDict`.
+"""
+
+from __future__ import division, print_function
+
+import gc
+import tracemalloc
+
+from common import header, timed, timed_once
+
+from pyfarm.core.utility import FrozenDict, ImmutableDict, record_type
+
+COUNT = 1000000
+KEYS = ("job", "frame", "state", "agent", "attempts", "priority")
+
+TaskInfo = record_type("TaskInfo", KEYS)
+
+
+def rows():
+    # Small ints and a shared string so only the containers are measured
+    return [(index // 1000, index % 1000, "queued", None, 0, 50)
+            for index in range(COUNT)]
+
+
+def build_immutable(data):
+    return [ImmutableDict(zip(KEYS, row)) for row in data]
+
+
+def build_dict(data):
+    return [dict(zip(KEYS, row)) for row in data]
+
+
+def build_frozen(data):
+    return [FrozenDict(zip(KEYS, row)) for row in data]
+
+
+def build_record(data):
+    return [TaskInfo._make(row) for row in data]
+
+
+def measure(build, data):
+    """Returns the bytes per instance held by the result of ``build``"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        result = build(data)
+        used = tracemalloc.get_traced_memory()[0] - start
+        # The list holding the instances isn't part of the instance cost
+        return (used - len(result) * 8) / COUNT
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    data = rows()
+    tests = (
+        ("ImmutableDict", build_immutable), ("dict", build_dict),
+        ("FrozenDict", build_frozen), ("record_type()", build_record))
+
+    header("memory, %d instances with %d keys" % (COUNT, len(KEYS)))
+    results = dict((label, measure(build, data)) for label, build in tests)
+    for label, _ in tests:
+        print("%-30s %6.0f bytes/instance  (%.0f%% of ImmutableDict)" % (
+            label, results[label],
+            results[label] / results["ImmutableDict"] * 100))
+
+    header("construction")
+    for label, build in tests:
+        timed_once(label, lambda: build(data), COUNT, "instance")
+
+    header("lookup")
+    record = TaskInfo._make(data[0])
+    immutable = ImmutableDict(zip(KEYS, data[0]))
+    timed("ImmutableDict[key]", lambda: immutable["state"], COUNT, "lookup")
+    timed("record[key]", lambda: record["state"], COUNT, "lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Throughput of :mod:`pyfarm.core.rollup` over 10 million task states and
+of :class:`pyfarm.core.rollup.JobStateAggregator` applying task state
+changes compared to rebuilding the job state after every change.
+"""
+
+from __future__ import print_function
+
+import random
+from array import array
+
+from common import header, timed_once
+
+from pyfarm.core.enums import DBWorkState
+from pyfarm.core.rollup import (
+    STATE_CODES, JobStateAggregator, rollup, rollup_jobs, numpy)
+
+TASKS = 10000000
+JOBS = 1000
+EVENTS = 1000000
+JOB_SIZE = 100000
+
+
+def main():
+    random.seed(0)
+    codes = array("i", STATE_CODES) * (TASKS // len(STATE_CODES))
+    job_ids = array("i", [random.randrange(JOBS) for _ in range(len(codes))])
+
+    header("array.array, %d tasks" % len(codes))
+    timed_once("rollup", lambda: rollup(codes), len(codes), "task")
+    timed_once("rollup_jobs (%d jobs)" % JOBS,
+               lambda: rollup_jobs(job_ids, codes), len(codes), "task")
+
+    # Reference point, what a loop over the tasks in Python costs
+    def python_loop():
+        counts = {}
+        for code in codes:
+            counts[code] = counts.get(code, 0) + 1
+        return counts
+    timed_once("reference: python loop", python_loop, len(codes), "task")
+
+    if numpy is None:
+        print("numpy is not installed, skipping")
+        return
+
+    numpy_codes = numpy.frombuffer(codes, dtype=numpy.int32)
+    numpy_job_ids = numpy.frombuffer(job_ids, dtype=numpy.int32)
+    header("numpy.ndarray, %d tasks" % len(codes))
+    timed_once("rollup", lambda: rollup(numpy_codes), len(codes), "task")
+    timed_once("rollup_jobs (%d jobs)" % JOBS,
+               lambda: rollup_jobs(numpy_job_ids, numpy_codes),
+               len(codes), "task")
+
+
+
+def aggregator():
+    header("JobStateAggregator, %d events" % EVENTS)
+    events = [(job_id, None, DBWorkState.RUNNING)
+              for job_id in range(EVENTS // 2)]
+    events += [(job_id, DBWorkState.RUNNING, DBWorkState.DONE)
+               for job_id in range(EVENTS // 2)]
+
+    def setup():
+        instance = JobStateAggregator()
+        for job_id in range(EVENTS // 2):
+            instance.add(job_id)
+        return instance
+
+    instance = setup()
+    apply_ = instance.apply
+
+    def apply_each():
+        for job_id, old_state, new_state in events:
+            apply_(job_id, old_state, new_state)
+    timed_once("apply", apply_each, len(events), "event")
+
+    instance = setup()
+    timed_once("apply_many", lambda: instance.apply_many(events),
+               len(events), "event")
+
+    # Reference point, recomputing a single job of JOB_SIZE
+    # tasks after each event
+    states = array("i", [DBWorkState.DONE]) * JOB_SIZE
+    timed_once("reference: rollup of a %d task job" % JOB_SIZE,
+               lambda: [rollup(states) for _ in range(10)], 10, "event")
+
+
+if __name__ == "__main__":
+    main()
+    aggregator()
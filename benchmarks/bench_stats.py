@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of recording task durations in
+:class:`pyfarm.core.stats.JobStatistics` and of the ETA and percentile
+queries compared to recomputing them from every finished task.
+"""
+
+from __future__ import division, print_function
+
+import random
+
+from common import header, timed, timed_once
+
+from pyfarm.core.stats import JobStatistics
+
+TASKS = 1000000
+JOBS = 100
+
+
+def main():
+    random.seed(0)
+    systems = ("linux", "windows", "mac")
+    tasks = [
+        (random.randrange(JOBS), random.lognormvariate(4, 1),
+         random.choice(systems))
+        for _ in range(TASKS)]
+
+    now = [0.0]
+    stats = JobStatistics(clock=lambda: now[0])
+
+    def record():
+        add = stats.add
+        for index, (job_id, duration, os) in enumerate(tasks):
+            add(job_id, duration, os=os, now=index / 100)
+    now[0] = TASKS / 100
+
+    header("%d tasks, %d jobs" % (TASKS, JOBS))
+    timed_once("add(job_id, duration, os)", record, TASKS, "task")
+    timed("eta(job_id, remaining)", lambda: stats.eta(1, 5000), 100000,
+          "query")
+    timed("quantile(job_id, 0.95)", lambda: stats.quantile(1, 0.95), 10000,
+          "query")
+    timed("mean(job_id, os)", lambda: stats.mean(1, os="linux"), 100000,
+          "query")
+
+    durations = [duration for job_id, duration, _ in tasks if job_id == 1]
+    timed("reference: sorted() for p95",
+          lambda: sorted(durations)[int(0.95 * (len(durations) - 1))], 100,
+          "query")
+
+    other = JobStatistics()
+    for job_id, duration, os in tasks[:TASKS // 10]:
+        other.add(job_id, duration, os=os, now=0)
+    timed_once("merge() %d jobs x %d systems" % (JOBS, len(systems)),
+               lambda: stats.merge(other), JOBS * (len(systems) + 1), "key")
+
+
+if __name__ == "__main__":
+    main()
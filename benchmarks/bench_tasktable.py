@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Memory per task and filter throughput of
+:class:`pyfarm.core.tasktable.TaskTable` with a 1,000,000 frame job
+compared to one Python object per task.
+"""
+
+from __future__ import division, print_function
+
+import random
+import tracemalloc
+
+from common import header, timed, timed_once
+
+from pyfarm.core.enums import DBWorkState
+from pyfarm.core.tasktable import TaskTable
+
+FRAMES = 1000000
+
+
+class Task(object):
+    __slots__ = ("frame", "state", "agent", "attempts", "start", "end")
+
+    def __init__(self, frame):
+        self.frame = float(frame)
+        self.state = 0
+        self.agent = -1
+        self.attempts = 0
+        self.start = None
+        self.end = None
+
+
+def allocated(func):
+    """Returns the result of ``func`` and the bytes it allocated"""
+    tracemalloc.start()
+    try:
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def main():
+    random.seed(0)
+    rows = random.sample(range(FRAMES), FRAMES // 10)
+    agents = [random.randrange(100) for _ in rows]
+
+    header("%d frames" % FRAMES)
+    table, table_bytes = allocated(
+        lambda: timed_once(
+            "TaskTable.extend()",
+            lambda: (lambda table: table.extend(range(FRAMES)) or table)(
+                TaskTable()),
+            FRAMES, "task"))
+    tasks, object_bytes = allocated(
+        lambda: [Task(frame) for frame in range(FRAMES)])
+    print("TaskTable: %.1f bytes/task (bytes_per_task() = %.1f)" % (
+        table_bytes / FRAMES, table.bytes_per_task()))
+    print("objects with __slots__: %.1f bytes/task" % (
+        object_bytes / FRAMES))
+
+    timed_once("update() 100k failed rows",
+               lambda: table.update(
+                   rows, state=DBWorkState.FAILED, agent=agents),
+               len(rows), "row")
+    for row, agent in zip(rows, agents):
+        tasks[row].state = DBWorkState.FAILED
+        tasks[row].agent = agent
+
+    timed("where(state=FAILED, agent=7)",
+          lambda: table.where(state=DBWorkState.FAILED, agent=7), 20,
+          "query")
+    timed("reference: list comprehension",
+          lambda: [task for task in tasks
+                   if task.state == DBWorkState.FAILED and task.agent == 7],
+          5, "query")
+    timed("rollup()", table.rollup, 20, "query")
+
+    table.delete(rows[:FRAMES // 100])
+    timed_once("compact()", table.compact, FRAMES, "row")
+    print("%d rows after compact(), %.1f bytes/task" % (
+        len(table), table.bytes_per_task()))
+
+
+if __name__ == "__main__":
+    main()
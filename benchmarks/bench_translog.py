@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Write throughput and file size of :class:`pyfarm.core.translog.TransitionLog`
+along with the cost of time range queries and replaying the log.
+"""
+
+from __future__ import division, print_function
+
+import os
+import random
+import shutil
+import tempfile
+
+from common import header, timed, timed_once
+
+from pyfarm.core.enums import DBWorkState
+from pyfarm.core.rollup import JobStateAggregator
+from pyfarm.core.translog import DTYPE, TransitionLog, numpy
+
+RECORDS = 1000000
+TASKS = 100000
+
+
+def main():
+    random.seed(0)
+    tempdir = tempfile.mkdtemp()
+    try:
+        run(tempdir)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def run(tempdir):
+    running = DBWorkState.RUNNING
+    records = [
+        (index / 1000, index % TASKS, None, running, index % 500)
+        for index in range(RECORDS)]
+
+    header("%d records" % RECORDS)
+    with TransitionLog(os.path.join(tempdir, "append.log")) as log:
+        def append():
+            for record in records:
+                log.append(*record)
+            log.flush()
+        timed_once("append()", append, RECORDS, "record")
+
+    with TransitionLog(os.path.join(tempdir, "extend.log")) as log:
+        def extend():
+            log.extend(records)
+            log.flush()
+        timed_once("extend(tuples)", extend, RECORDS, "record")
+        print("file size: %.1f MB per million transitions" % (
+            os.path.getsize(log.path) / 1024 / 1024 * 1000000 / RECORDS))
+
+    if numpy is not None:
+        array = numpy.zeros(RECORDS, dtype=DTYPE)
+        array["time"] = numpy.arange(RECORDS) / 1000
+        array["task"] = numpy.arange(RECORDS) % TASKS
+        array["new"] = running
+        array["agent"] = numpy.arange(RECORDS) % 500
+        with TransitionLog(os.path.join(tempdir, "numpy.log")) as log:
+            def extend_numpy():
+                log.extend(array)
+                log.flush()
+            timed_once("extend(ndarray)", extend_numpy, RECORDS, "record")
+
+    log = timed_once(
+        "open (builds sparse index)",
+        lambda: TransitionLog(os.path.join(tempdir, "extend.log")),
+        RECORDS, "record")
+    timed("seek(time)", lambda: log.seek(random.uniform(0, RECORDS / 1000)),
+          10000, "seek")
+    timed("records(start, end) 1000 records",
+          lambda: list(log.records(start=500, end=501)), 1000, "query")
+    if numpy is not None:
+        timed("read(start, end) 1000 records",
+              lambda: log.read(start=500, end=501), 10000, "query")
+
+    aggregator = JobStateAggregator()
+    aggregator.add("job", count=TASKS)
+    job_of = dict((task, "job") for task in range(TASKS))
+    timed_once("replay() first %d records" % TASKS,
+               lambda: log.replay(aggregator, job_of, end=TASKS / 1000),
+               TASKS, "record")
+    log.close()
+
+
+if __name__ == "__main__":
+    main()
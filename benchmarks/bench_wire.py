@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Size and encode/decode throughput of :func:`pyfarm.core.utility.pack`
+compared to each JSON backend for agent status updates from a fleet of
+render nodes.
+"""
+
+from __future__ import division, print_function
+
+import random
+
+from common import header, timed_once
+
+from pyfarm.core.enums import _AgentState, _OperatingSystem, _WorkState
+from pyfarm.core.utility import JSON_BACKENDS, pack, unpack
+
+AGENTS = 5000
+TASKS_PER_AGENT = 4
+ROUNDS = 5
+
+
+def status_update(agent_id):
+    """One agent's status update with the tasks it's running"""
+    return {
+        "id": agent_id,
+        "hostname": "render%04d.example.com" % agent_id,
+        "state": random.choice(list(_AgentState)),
+        "os": _OperatingSystem.LINUX,
+        "ram": 65536, "free_ram": random.randrange(65536),
+        "cpus": 32, "load": random.random() * 32,
+        "time_offset": random.randrange(-5, 5),
+        "tasks": [
+            {"id": random.randrange(10 ** 9),
+             "job": random.randrange(10 ** 6),
+             "frame": float(random.randrange(1000)),
+             "state": random.choice(list(_WorkState)),
+             "attempts": random.randrange(3),
+             "progress": random.random()}
+            for _ in range(TASKS_PER_AGENT)]}
+
+
+def main():
+    random.seed(0)
+    fleet = [status_update(agent_id) for agent_id in range(AGENTS)]
+    messages = AGENTS * ROUNDS
+
+    def encode_all(func):
+        for _ in range(ROUNDS):
+            for message in fleet:
+                func(message)
+
+    def decode_all(func, encoded):
+        for _ in range(ROUNDS):
+            for message in encoded:
+                func(message)
+
+    packed = [pack(message) for message in fleet]
+    header("pack(), %d status updates" % AGENTS)
+    print("size: %.0f bytes/message" % (
+        sum(map(len, packed)) / AGENTS))
+    timed_once("pack()", lambda: encode_all(pack), messages, "message")
+    timed_once("unpack()", lambda: decode_all(unpack, packed),
+               messages, "message")
+
+    for backend in JSON_BACKENDS:
+        if not backend.available:
+            print("%s: not installed" % backend.name)
+            continue
+
+        backend = backend()
+        encoded = [backend.dumps(message) for message in fleet]
+        header("%s backend" % backend.name)
+        print("size: %.0f bytes/message" % (
+            sum(len(message.encode("utf-8")) for message in encoded) / AGENTS))
+        timed_once("dumps()", lambda: encode_all(backend.dumps),
+                   messages, "message")
+        timed_once("loads()", lambda: decode_all(backend.loads, encoded),
+                   messages, "message")
+
+
+if __name__ == "__main__":
+    main()
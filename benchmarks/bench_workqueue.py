@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Dispatch decisions per second from :class:`pyfarm.core.workqueue.WorkQueue`
+with 1,000,000 queued tasks spread over 1,000 jobs compared to sorting
+scanning every queued task for each decision.
+"""
+
+from __future__ import print_function
+
+import random
+
+from common import header, timed, timed_once
+
+from pyfarm.core.enums import DBWorkState
+from pyfarm.core.workqueue import WorkQueue
+
+TASKS = 1000000
+JOBS = 1000
+DECISIONS = 100000
+
+
+def main():
+    random.seed(0)
+    tasks = [
+        (task_id, random.randrange(JOBS), random.randrange(5), random.random())
+        for task_id in range(TASKS)]
+
+    for fair_share in (False, True):
+        queue = WorkQueue(fair_share=fair_share)
+        header("%d tasks, %d jobs, fair_share=%s" % (TASKS, JOBS, fair_share))
+        timed_once("extend()", lambda: queue.extend(tasks), TASKS, "task")
+
+        def dispatch():
+            for _ in range(DECISIONS):
+                task_id, _ = queue.pop()
+                queue.update(task_id, state=DBWorkState.DONE)
+        timed_once("pop() + update(state=done)", dispatch, DECISIONS,
+                   "decision")
+
+        queued = [task[0] for task in tasks[DECISIONS:]]
+        changes = [
+            (random.choice(queued), random.randrange(5))
+            for _ in range(DECISIONS)]
+
+        def reprioritize():
+            for task_id, priority in changes:
+                queue.update(task_id, priority=priority)
+        timed_once("update(priority=...)", reprioritize, DECISIONS, "update")
+
+        paused = queued[:DECISIONS]
+
+        def pause():
+            for task_id in paused:
+                queue.update(task_id, state=DBWorkState.PAUSED)
+        timed_once("update(state=paused)", pause, DECISIONS, "update")
+
+    header("reference")
+    timed("min() over all tasks per decision",
+          lambda: min(tasks, key=lambda task: (-task[2], task[3])), 3,
+          "decision")
+
+
+if __name__ == "__main__":
+    main()
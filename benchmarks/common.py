@@ -0,0 +1,78 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Shared helpers for the benchmark scripts in this directory.  Each
+script can be run directly, for example::
+
+    python benchmarks/bench_enums.py
+"""
+
+from __future__ import division, print_function
+
+import gc
+import sys
+from timeit import default_timer
+
+
+def timed(label, func, number=1, unit="op"):
+    """
+    Calls ``func`` ``number`` times, prints the rate and returns the
+    total number of seconds it took.  Garbage collection is disabled
+    while ``func`` runs so results are more stable between runs.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = default_timer()
+        for _ in range(number):
+            func()
+        elapsed = default_timer() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    rate = number / elapsed if elapsed else float("inf")
+    print("%-48s %12.0f %s/s  (%.4fs)" % (label, rate, unit, elapsed))
+    sys.stdout.flush()
+    return elapsed
+
+
+def timed_once(label, func, count, unit="item"):
+    """
+    Calls ``func`` once, treating the call as processing ``count``
+    items, prints the rate and returns the result of ``func``.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = default_timer()
+        result = func()
+        elapsed = default_timer() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    rate = count / elapsed if elapsed else float("inf")
+    print("%-48s %12.0f %s/s  (%.4fs)" % (label, rate, unit, elapsed))
+    sys.stdout.flush()
+    return result
+
+
+def header(title):
+    print()
+    print(title)
+    print("-" * len(title))
@@ -0,0 +1,419 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Agents
+======
+
+In-memory structures for tracking large numbers of agents and
+detecting agents which have stopped sending heartbeats.
+"""
+
+from __future__ import division
+
+import time
+from collections import namedtuple
+from itertools import product
+from math import ceil
+
+from pyfarm.core.enums import (
+    STRING_TYPES, INTEGER_TYPES, Values, DBAgentState,
+    DBOperatingSystem, DBUseAgentAddress, range_)
+
+
+class AgentKey(namedtuple("AgentKey", ("state", "os", "address"))):
+    """
+    The indexed attributes of a single agent stored as
+    :const:`pyfarm.core.enums.DBAgentState`,
+    :const:`pyfarm.core.enums.DBOperatingSystem` and
+    :const:`pyfarm.core.enums.DBUseAgentAddress` values.
+    """
+    __slots__ = ()
+
+
+class AgentIndex(object):
+    """
+    Indexes agents by their :const:`pyfarm.core.enums.AgentState`,
+    :const:`pyfarm.core.enums.OperatingSystem` and
+    :const:`pyfarm.core.enums.UseAgentAddress`.  Agents are grouped into
+    one bucket per combination of the three so changing an agent's state is
+    a constant time move between two buckets and a query only has to visit
+    the buckets which match.  The number of agents with each value is
+    also kept up to date so counts never require a scan.
+
+    Values may be provided in their string, integer or
+    :class:`pyfarm.core.enums.Values` form.  Queries also accept any
+    iterable of values, including :class:`pyfarm.core.enums.StateSet`:
+
+    >>> from pyfarm.core.enums import (
+    ...     AgentState, OperatingSystem, UseAgentAddress, StateSet,
+    ...     _UseAgentAddress)
+    >>> index = AgentIndex()
+    >>> index.add("a", AgentState.ONLINE, OperatingSystem.LINUX,
+    ...           UseAgentAddress.REMOTE)
+    >>> index.add("b", AgentState.ONLINE, OperatingSystem.LINUX,
+    ...           UseAgentAddress.PASSIVE)
+    >>> not_passive = ~StateSet(_UseAgentAddress, ["passive"])
+    >>> index.query(state="online", os="linux", address=not_passive) == set("a")
+    True
+    """
+    def __init__(self):
+        self._agents = {}
+        self._buckets = {}
+        self._counts = AgentKey({}, {}, {})
+
+    def __contains__(self, agent_id):
+        return agent_id in self._agents
+
+    def __len__(self):
+        return len(self._agents)
+
+    def __iter__(self):
+        return iter(self._agents)
+
+    def _values(self, enum, value):
+        """
+        Returns a tuple of the distinct integer values for a query
+        argument which may be ``None``, a single value or an iterable of
+        values.  Repeated values are dropped so no bucket is visited
+        twice.
+        """
+        if value is None:
+            return enum
+        elif isinstance(value, (Values, STRING_TYPES, INTEGER_TYPES)):
+            return (enum._cast(value), )
+        return tuple(set(enum._cast(item) for item in value))
+
+    def _insert(self, agent_id, key):
+        self._agents[agent_id] = key
+
+        try:
+            self._buckets[key].add(agent_id)
+        except KeyError:
+            self._buckets[key] = set([agent_id])
+
+        for counts, value in zip(self._counts, key):
+            counts[value] = counts.get(value, 0) + 1
+
+    def _discard(self, agent_id):
+        key = self._agents.pop(agent_id)
+        bucket = self._buckets[key]
+        bucket.discard(agent_id)
+        if not bucket:
+            del self._buckets[key]
+
+        for counts, value in zip(self._counts, key):
+            counts[value] -= 1
+
+        return key
+
+    def add(self, agent_id, state, os, address):
+        """
+        Adds a new agent to the index
+
+        :raises ValueError:
+            Raised if ``agent_id`` is already in the index or if any of
+            the values are invalid
+        """
+        if agent_id in self._agents:
+            raise ValueError("agent %r is already indexed" % (agent_id, ))
+
+        self._insert(agent_id, AgentKey(
+            DBAgentState._cast(state),
+            DBOperatingSystem._cast(os),
+            DBUseAgentAddress._cast(address)))
+
+    def update(self, agent_id, state=None, os=None, address=None):
+        """
+        Changes any of the provided values for an agent which is already
+        in the index.
+
+        :raises KeyError:
+            Raised if ``agent_id`` is not in the index
+        """
+        old_key = self._agents[agent_id]
+        key = AgentKey(
+            old_key.state if state is None
+            else DBAgentState._cast(state),
+            old_key.os if os is None
+            else DBOperatingSystem._cast(os),
+            old_key.address if address is None
+            else DBUseAgentAddress._cast(address))
+
+        if key != old_key:
+            self._discard(agent_id)
+            self._insert(agent_id, key)
+
+    def remove(self, agent_id):
+        """
+        Removes an agent from the index
+
+        :raises KeyError:
+            Raised if ``agent_id`` is not in the index
+        """
+        self._discard(agent_id)
+
+    def get(self, agent_id, default=None):
+        """Returns the :class:`AgentKey` for ``agent_id``"""
+        return self._agents.get(agent_id, default)
+
+    def _buckets_for(self, state, os, address):
+        buckets = self._buckets
+        keys = product(
+            self._values(DBAgentState, state),
+            self._values(DBOperatingSystem, os),
+            self._values(DBUseAgentAddress, address))
+
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket:
+                yield bucket
+
+    def iter_query(self, state=None, os=None, address=None):
+        """
+        Same as :meth:`query` but yields the agent ids instead of building
+        a set.  The index must not be modified while iterating.
+        """
+        for bucket in self._buckets_for(state, os, address):
+            for agent_id in bucket:
+                yield agent_id
+
+    def query(self, state=None, os=None, address=None):
+        """
+        Returns a set of ids for agents matching all of the provided
+        values.  Each argument may be ``None`` to match any value, a single
+        value or an iterable of values to match any one of.
+        """
+        result = set()
+        for bucket in self._buckets_for(state, os, address):
+            result.update(bucket)
+        return result
+
+    def count(self, state=None, os=None, address=None):
+        """
+        Returns the number of agents :meth:`query` would return for the
+        same arguments without building the result.
+        """
+        return sum(map(len, self._buckets_for(state, os, address)))
+
+    def counts(self, field):
+        """
+        Returns a dictionary of value to the number of agents with that
+        value for ``field`` which is one of ``state``, ``os`` or
+        ``address``.  Values with no agents are not included.
+        """
+        counts = getattr(self._counts, field)
+        return dict(
+            (value, count) for value, count in counts.items() if count)
+
+
+class HeartbeatTracker(object):
+    """
+    Tracks the last time each agent was heard from using a hierarchical
+    timing wheel and reports agents which have not been heard from within
+    ``timeout`` seconds so they can be marked
+    :const:`pyfarm.core.enums.AgentState.OFFLINE`.
+
+    Recording a heartbeat moves the agent between two slots of the wheel
+    and each call to :meth:`expire` only visits the slots for the ticks
+    which have passed since the previous call so the cost of checking for
+    dead agents does not depend on the number of agents being tracked.
+
+    >>> now = [0]
+    >>> tracker = HeartbeatTracker(10, clock=lambda: now[0])
+    >>> tracker.heartbeat("agent")
+    >>> now[0] = 9
+    >>> tracker.expire()
+    []
+    >>> now[0] = 10
+    >>> tracker.expire()
+    ['agent']
+
+    :param timeout:
+        The number of seconds after a heartbeat before an agent is
+        considered offline
+
+    :param resolution:
+        The number of seconds each tick of the wheel covers.  Agents
+        expire at most this many seconds after their deadline.
+
+    :param int slots:
+        The number of slots in each level of the wheel, this must
+        be a power of two.
+
+    :param int levels:
+        The number of levels in the wheel.  Deadlines further in the
+        future than ``resolution * slots ** levels`` seconds are held in
+        the top level and moved down once they're in range.
+
+    :param clock:
+        Callable which returns the current time in seconds.  Defaults
+        to :func:`time.time`.
+
+    :param callback:
+        If provided, called by :meth:`expire` with the list of agents
+        which expired whenever the list is not empty.
+
+    :param AgentIndex index:
+        If provided, agents in the index are updated to
+        :const:`pyfarm.core.enums.AgentState.OFFLINE` when they expire.
+    """
+    def __init__(self, timeout, resolution=1.0, slots=256, levels=3,
+                 clock=time.time, callback=None, index=None):
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError("`slots` must be a power of two")
+
+        if levels < 1:
+            raise ValueError("`levels` must be at least 1")
+
+        self.timeout = timeout
+        self.resolution = resolution
+        self.clock = clock
+        self.callback = callback
+        self.index = index
+
+        # log2(slots), int.bit_length() is not available on Python 2.6
+        self._bits = len(bin(slots)) - 3
+        self._mask = slots - 1
+        self._max_delta = (1 << (self._bits * levels)) - 1
+        self._wheel = [[set() for _ in range_(slots)] for _ in range_(levels)]
+        self._deadlines = {}
+        self._slots = {}
+
+        # The next tick which has not been processed by expire()
+        self._tick = self._to_tick(clock())
+
+    def __contains__(self, agent_id):
+        return agent_id in self._deadlines
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def _to_tick(self, seconds):
+        """Returns the first tick which starts at or after ``seconds``"""
+        return int(ceil(seconds / self.resolution))
+
+    def _place(self, agent_id, deadline):
+        delta = min(max(deadline - self._tick, 0), self._max_delta)
+        tick = self._tick + delta
+
+        level = 0
+        while delta >> (self._bits * (level + 1)):
+            level += 1
+
+        bucket = self._wheel[level][(tick >> (self._bits * level)) & self._mask]
+        bucket.add(agent_id)
+        self._slots[agent_id] = bucket
+
+    def heartbeat(self, agent_id, timeout=None):
+        """
+        Records a heartbeat for ``agent_id`` at the current time.  If
+        provided, ``timeout`` overrides the default timeout for this
+        heartbeat.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        bucket = self._slots.get(agent_id)
+        if bucket is not None:
+            bucket.discard(agent_id)
+
+        deadline = self._to_tick(self.clock() + timeout)
+        self._deadlines[agent_id] = deadline
+        self._place(agent_id, deadline)
+
+    def remove(self, agent_id):
+        """
+        Stops tracking ``agent_id``
+
+        :raises KeyError:
+            Raised if ``agent_id`` is not being tracked
+        """
+        del self._deadlines[agent_id]
+        self._slots.pop(agent_id).discard(agent_id)
+
+    def deadline(self, agent_id):
+        """
+        Returns the time, rounded up to the next tick, at which
+        ``agent_id`` will expire.
+        """
+        return self._deadlines[agent_id] * self.resolution
+
+    def _cascade(self, tick):
+        """
+        Moves the entries from the higher levels of the wheel which are
+        due within the next rotation of the level below.
+        """
+        for level in range_(len(self._wheel) - 1, 0, -1):
+            if tick & ((1 << (self._bits * level)) - 1):
+                continue
+
+            bucket = self._wheel[level][(tick >> (self._bits * level)) & self._mask]
+            if bucket:
+                entries = list(bucket)
+                bucket.clear()
+                for agent_id in entries:
+                    self._place(agent_id, self._deadlines[agent_id])
+
+    def expire(self, now=None):
+        """
+        Processes every tick up to ``now``, which defaults to the current
+        time from ``clock``, and returns the agents which expired in
+        those ticks.  Expired agents are no longer tracked until their
+        next heartbeat.
+        """
+        if now is None:
+            now = self.clock()
+
+        end = int(now // self.resolution)
+        expired = []
+
+        # Nothing to expire, skip directly to the end
+        if not self._deadlines:
+            self._tick = max(self._tick, end + 1)
+
+        level_zero = self._wheel[0]
+        deadlines = self._deadlines
+        slots = self._slots
+        while self._tick <= end and deadlines:
+            tick = self._tick
+            if not tick & self._mask:
+                self._cascade(tick)
+
+            bucket = level_zero[tick & self._mask]
+            if bucket:
+                for agent_id in bucket:
+                    del deadlines[agent_id]
+                    del slots[agent_id]
+                expired.extend(bucket)
+                bucket.clear()
+
+            self._tick += 1
+
+        if not deadlines:
+            self._tick = max(self._tick, end + 1)
+
+        if expired:
+            if self.index is not None:
+                for agent_id in expired:
+                    if agent_id in self.index:
+                        self.index.update(
+                            agent_id, state=DBAgentState.OFFLINE)
+
+            if self.callback is not None:
+                self.callback(expired)
+
+        return expired
@@ -0,0 +1,243 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Command Templates
+=================
+
+Builds the command line for each task or frame from a template.
+Templates use the same ``$name`` and ``${name}`` syntax as
+:class:`string.Template` but are parsed once by :class:`CommandTemplate`
+instead of once per frame.  Configuration and environment variables are
+substituted when the template is compiled so only the frame variables
+are left to fill in when rendering.
+
+:const FRAME_VARIABLES:
+    The variables which are provided when a command is rendered
+    instead of when it's compiled.  ``$frame`` is the frame being
+    rendered, ``$start`` and ``$end`` are the first and last frames of
+    the task.
+
+:const MAX_EXPANSION_RECURSION:
+    How many levels of variables inside of the values of other variables
+    will be expanded, the same limit used by
+    :meth:`pyfarm.core.config.Configuration._expandvars`
+"""
+
+from operator import itemgetter
+from string import Template
+
+from pyfarm.core.enums import STRING_TYPES
+
+FRAME_VARIABLES = ("frame", "start", "end")
+MAX_EXPANSION_RECURSION = 10
+
+_FRAME_INDEXES = dict(
+    (name, index) for index, name in enumerate(FRAME_VARIABLES))
+_PATTERN = Template.pattern
+
+
+def _tokenize(text, values, unresolved, depth=0):
+    """
+    Returns ``text`` as a list of tokens, either a string or the index
+    of a name in :const:`FRAME_VARIABLES`.  Any variable which is not a
+    frame variable or in ``values`` is kept as it was written, the same
+    as :meth:`string.Template.safe_substitute`, and added to
+    ``unresolved``.
+    """
+    tokens = []
+    position = 0
+    for match in _PATTERN.finditer(text):
+        tokens.append(text[position:match.start()])
+        position = match.end()
+        name = match.group("named") or match.group("braced")
+
+        if name is None:  # $$ or a $ which does not start a name
+            tokens.append("$")
+        elif name in _FRAME_INDEXES:
+            tokens.append(_FRAME_INDEXES[name])
+        elif name in values and depth < MAX_EXPANSION_RECURSION:
+            value = values[name]
+            if isinstance(value, STRING_TYPES):
+                tokens.extend(_tokenize(value, values, unresolved, depth + 1))
+            else:
+                tokens.append("%s" % (value, ))
+        else:
+            unresolved.add(name)
+            tokens.append(match.group())
+
+    tokens.append(text[position:])
+    return _join(tokens)
+
+
+def _join(tokens):
+    """Concatenates neighboring strings in ``tokens``"""
+    joined = []
+    for token in tokens:
+        if not isinstance(token, int):
+            if not token:
+                continue
+            elif joined and not isinstance(joined[-1], int):
+                joined[-1] += token
+                continue
+        joined.append(token)
+    return joined
+
+
+def _format(tokens):
+    """
+    Returns a ``%`` format string for ``tokens`` along with the indexes
+    of the frame variables for each of its ``%s`` fields.  If there are
+    no frame variables the string itself is returned instead.
+    """
+    if all(not isinstance(token, int) for token in tokens):
+        return "".join(tokens), ()
+
+    parts = []
+    fields = []
+    for token in tokens:
+        if isinstance(token, int):
+            parts.append("%s")
+            fields.append(token)
+        else:
+            parts.append(token.replace("%", "%%"))
+    return "".join(parts), tuple(fields)
+
+
+class CommandTemplate(object):
+    """
+    A command template compiled into a program of constant strings and
+    frame variables.  The template can either be a single string or a
+    sequence of arguments, in which case each render is a list with one
+    string per argument.
+
+    >>> template = CommandTemplate(
+    ...     "$renderer -s $start -e $end -o ${out}_$frame.exr $$HOME",
+    ...     {"renderer": "/opt/render", "out": "/shots/$shot", "shot": "a"})
+    >>> template.render(5, start=1, end=10)
+    '/opt/render -s 1 -e 10 -o /shots/a_5.exr $HOME'
+    >>> template.render_many([1, 2])
+    ['/opt/render -s 1 -e 2 -o /shots/a_1.exr $HOME', \
+'/opt/render -s 1 -e 2 -o /shots/a_2.exr $HOME']
+
+    :param template:
+        The command, either a string or a list of argument strings
+
+    :param values:
+        A mapping of variable names to values which are substituted when
+        the template is compiled, typically built from the environment
+        and configuration.  String values may contain variables of their
+        own, including frame variables.
+
+    :var program:
+        The compiled template, for each argument a tuple of tokens where
+        each token is either a constant string or the name of a frame
+        variable
+
+    :var unresolved:
+        The names of variables which were not frame variables or
+        in ``values``.  They're left in the output as they were written.
+    """
+    def __init__(self, template, values=None):
+        self.template = template
+        self.single = isinstance(template, STRING_TYPES)
+        arguments = [template] if self.single else list(template)
+        unresolved = set()
+        self._tokens = tuple(
+            _tokenize(argument, values or {}, unresolved)
+            for argument in arguments)
+        self.unresolved = frozenset(unresolved)
+        self.program = tuple(
+            tuple(FRAME_VARIABLES[token] if isinstance(token, int) else token
+                  for token in tokens)
+            for tokens in self._tokens)
+
+        self._formats = []
+        for tokens in self._tokens:
+            format_, fields = _format(tokens)
+            getter = itemgetter(*fields) if fields else None
+            self._formats.append((format_, getter))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.template)
+
+    def render(self, frame=None, start=None, end=None):
+        """
+        Returns the command for a single ``frame`` or, if ``frame``
+        is not provided, for a task covering ``start`` to ``end``.
+        ``start`` and ``end`` default to ``frame`` and ``frame``
+        defaults to ``start``.
+        """
+        if frame is None:
+            frame = start
+        if start is None:
+            start = frame
+        if end is None:
+            end = frame
+        variables = (frame, start, end)
+
+        rendered = [
+            format_ % getter(variables) if getter is not None else format_
+            for format_, getter in self._formats]
+        return rendered[0] if self.single else rendered
+
+    def _bind(self, start, end):
+        """
+        Returns a ``%`` format string, or a constant string, for each
+        argument with ``start`` and ``end`` substituted.  Each is paired
+        with the number of ``%s`` fields ``$frame`` fills in.
+        """
+        bound = []
+        for tokens in self._tokens:
+            tokens = _join(
+                "%s" % ((start, end)[token - 1], )
+                if isinstance(token, int) and token else token
+                for token in tokens)
+            format_, fields = _format(tokens)
+            bound.append((format_, len(fields)))
+        return bound
+
+    def render_many(self, frames, start=None, end=None):
+        """
+        Returns a list with the command for each frame in ``frames``.
+        The constant parts of the command, including ``$start`` and
+        ``$end``, are only built once.  ``start`` and ``end`` default to
+        the first and last frame in ``frames``.
+        """
+        if start is None or end is None:
+            if not hasattr(frames, "__getitem__"):
+                frames = list(frames)
+            if not len(frames):
+                return []
+            if start is None:
+                start = frames[0]
+            if end is None:
+                end = frames[-1]
+
+        bound = self._bind(start, end)
+        if self.single:
+            format_, fields = bound[0]
+            if not fields:
+                return [format_ for _ in frames]
+            elif fields == 1:
+                return list(map(format_.__mod__, frames))
+            return [format_ % ((frame, ) * fields) for frame in frames]
+
+        return [
+            [format_ % ((frame, ) * fields) if fields else format_
+             for format_, fields in bound]
+            for frame in frames]
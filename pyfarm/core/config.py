@@ -31,9 +31,11 @@ in various forms.
 """
 
 import os
+import threading
 from ast import literal_eval
 from errno import EEXIST
 from functools import partial
+from hashlib import sha1
 from pprint import pformat
 from string import Template
 from itertools import product
@@ -45,6 +47,12 @@ try:
 except ImportError:  # pragma: no cover
     from io import StringIO
 
+try:
+    from urllib2 import Request, HTTPError, URLError, urlopen
+except ImportError:  # pragma: no cover
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError, URLError
+
 from pkg_resources import (
     DistributionNotFound, get_distribution, resource_filename)
 
@@ -54,9 +62,15 @@ try:
 except ImportError:  # pragma: no cover
     from yaml.loader import Loader
 
+try:
+    from yaml.loader import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml.loader import SafeLoader
+
 from pyfarm.core.logger import getLogger
 from pyfarm.core.enums import (
     STRING_TYPES, NUMERIC_TYPES, NOTSET, LINUX, MAC, WINDOWS, range_)
+from pyfarm.core.commands import CommandTemplate
 
 logger = getLogger("core.config")
 
@@ -247,6 +261,241 @@ read_env_int = partial(read_env_strict_number, number_type=int)
 read_env_float = partial(read_env_strict_number, number_type=float)
 
 
+class HTTPConfigurationLayer(object):
+    """
+    A single configuration layer which is retrieved from a configuration
+    server over HTTP instead of from a file on disk.  The last payload
+    successfully retrieved from the server is stored on disk, along with the
+    ``ETag`` header the server sent with it, so that:
+
+        * :meth:`load` can return the cached data immediately at startup
+          instead of blocking on the network.
+        * Revalidation requests are sent with ``If-None-Match``.  When the
+          configuration has not changed the server only has to respond with
+          ``304 Not Modified`` which keeps a large number of agents starting
+          at once from all downloading the full configuration.
+
+    The payload itself is expected to be YAML (which includes JSON) in the
+    same form as the configuration files loaded by :class:`Configuration`.
+
+    :param string url:
+        The url to retrieve the configuration from
+
+    :param string cache_root:
+        The directory the cached payload and ``ETag`` will be
+        stored in.  This is typically :attr:`Configuration.tempdir`.
+
+    :param int timeout:
+        The number of seconds to wait on the server before giving up
+
+    :var string cache_path:
+        The path the last successfully retrieved payload is stored in
+
+    :var string etag_path:
+        The path the ``ETag`` for ``cache_path`` is stored in
+
+    :var threading.Thread thread:
+        The thread which was started by the last call to :meth:`load`
+        to revalidate the cache in the background or ``None`` if no
+        background revalidation was started.
+
+    :var bool from_cache:
+        True if the data returned by the last call to :meth:`load` came
+        from the cache rather than from the server
+    """
+    DEFAULT_TIMEOUT = 10
+    NOT_MODIFIED = 304
+
+    def __init__(self, url, cache_root, timeout=DEFAULT_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.etag = None
+        self.thread = None
+        self.from_cache = False
+        self.cache_path = join(
+            cache_root,
+            "remote-" + sha1(url.encode("utf-8")).hexdigest() +
+            Configuration.DEFAULT_FILE_EXTENSION)
+        self.etag_path = self.cache_path + ".etag"
+
+        # Only one request to the server should be running at a time
+        # for a given layer, otherwise two threads could race each other
+        # writing to the cache.
+        self._lock = threading.Lock()
+
+    def _parse(self, payload, source):
+        """
+        Parses ``payload`` and returns the resulting data or ``None``
+        if the payload could not be parsed.  Payloads come from the
+        network or a shared cache directory so only plain YAML types are
+        constructed, tags such as ``!!python/object`` are rejected.
+        """
+        try:
+            data = yaml.load(payload, Loader=SafeLoader)
+
+        except yaml.YAMLError as e:
+            logger.error("Failed to load %r: %s", source, e)
+            return None
+
+        if data is None:
+            return {}
+
+        if not isinstance(data, dict):
+            logger.error("Expected a mapping from %r", source)
+            return None
+
+        return data
+
+    def _write(self, path, data):
+        """
+        Writes ``data`` to ``path`` by writing to a temporary file
+        and renaming it.  This ensures a process reading the cache never
+        sees a partially written file.
+        """
+        temporary_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(temporary_path, "wb") as stream:
+            stream.write(data)
+
+        if WINDOWS and isfile(path):  # pragma: no cover
+            os.remove(path)
+
+        os.rename(temporary_path, path)
+
+    def cached(self):
+        """
+        Returns the data stored in the cache or ``None`` if the cache
+        does not exist or could not be parsed.
+        """
+        try:
+            with open(self.cache_path, "rb") as stream:
+                payload = stream.read()
+
+        except (OSError, IOError):
+            self.etag = None
+            return None
+
+        data = self._parse(payload, self.cache_path)
+
+        # The ETag is only useful to us if the payload it
+        # belongs to could be loaded.
+        if data is not None:
+            try:
+                with open(self.etag_path, "rb") as stream:
+                    self.etag = stream.read().decode("utf-8") or None
+
+            except (OSError, IOError):
+                self.etag = None
+        else:
+            self.etag = None
+
+        return data
+
+    def fetch(self):
+        """
+        Performs a conditional request to the server, sending the
+        current ``ETag`` if we have one.  If the server provides a new
+        payload it will be stored in the cache before the parsed data is
+        returned.  ``None`` will be returned if the data has not been
+        modified or if the request failed.
+        """
+        with self._lock:
+            request = Request(self.url)
+            request.add_header("Accept", "application/x-yaml, application/json")
+            if self.etag is not None:
+                request.add_header("If-None-Match", self.etag)
+
+            try:
+                response = urlopen(request, timeout=self.timeout)
+                try:
+                    payload = response.read()
+                    etag = response.info().get("ETag")
+                finally:
+                    response.close()
+
+            except HTTPError as e:
+                if e.code == self.NOT_MODIFIED:
+                    logger.debug("%s has not been modified", self.url)
+                else:
+                    logger.warning(
+                        "Failed to retrieve %s: HTTP %s", self.url, e.code)
+                return None
+
+            except (URLError, OSError, IOError) as e:
+                logger.warning("Failed to retrieve %s: %s", self.url, e)
+                return None
+
+            data = self._parse(payload, self.url)
+            if data is None:
+                return None
+
+            try:
+                self._write(self.cache_path, payload)
+                self._write(self.etag_path, (etag or "").encode("utf-8"))
+
+            except (OSError, IOError) as e:  # pragma: no cover
+                logger.warning(
+                    "Failed to cache %s in %r: %s", self.url, self.cache_path, e)
+
+            self.etag = etag
+            logger.info("Retrieved configuration from %s", self.url)
+            return data
+
+    def revalidate(self, callback=None):
+        """
+        Calls :meth:`fetch` and, if new data was retrieved, passes the
+        data along to ``callback``.
+        """
+        data = self.fetch()
+        if data is not None and callback is not None:
+            callback(data)
+        return data
+
+    def start_revalidation(self, callback=None):
+        """
+        Starts a background thread which calls :meth:`revalidate` with
+        ``callback`` and returns the thread.
+        """
+        self.thread = threading.Thread(
+            target=self.revalidate, args=(callback, ))
+        self.thread.daemon = True
+        self.thread.start()
+        return self.thread
+
+    def load(self, callback=None, revalidate=True):
+        """
+        Returns the configuration data for this layer.  If a cached
+        payload exists it will be returned immediately and, when
+        ``revalidate`` is True, a background thread will check the
+        server for a newer payload.  Without a cached payload this method
+        will block while the data is retrieved from the server.  ``None``
+        is returned when no data could be loaded from either source.
+
+        :param callable callback:
+            Called with the data being returned and then again with the
+            new data if the background revalidation retrieves a newer
+            payload from the server.  Calling ``callback`` before the
+            revalidation thread starts ensures the cached data can never
+            be applied after newer data from the server.
+        """
+        self.thread = None
+        data = self.cached()
+        self.from_cache = data is not None
+
+        if data is None:
+            data = self.fetch()
+            if data is not None and callback is not None:
+                callback(data)
+            return data
+
+        if callback is not None:
+            callback(data)
+
+        if revalidate:
+            self.start_revalidation(callback)
+
+        return data
+
+
 class Configuration(dict):
     """
     Main object responsible for finding, loading, and
@@ -375,6 +624,13 @@ class Configuration(dict):
         This allows for an non-standard configuration location to be loaded
         first for testing forced-override of the configuration.
 
+    :var string DEFAULT_ENVIRONMENT_URL_VARIABLE:
+        A environment variable to search for a configuration server url
+        in.  If the value defined here, which defaults to
+        ``PYFARM_CONFIG_URL``, is set when :class:`Configuration` is
+        instanced then an :class:`HTTPConfigurationLayer` will be added
+        for the url.  See :meth:`add_http_layer`.
+
     :var DEFAULT_TEMP_DIRECTORY_ROOT:
         The directory which will store any temporary files.
 
@@ -415,6 +671,7 @@ class Configuration(dict):
     DEFAULT_LOCAL_DIRECTORY_NAME = "etc"
     DEFAULT_PARENT_APPLICATION_NAME = "pyfarm"
     DEFAULT_ENVIRONMENT_PATH_VARIABLE = "PYFARM_CONFIG_ROOT"
+    DEFAULT_ENVIRONMENT_URL_VARIABLE = "PYFARM_CONFIG_URL"
     DEFAULT_TEMP_DIRECTORY_ROOT = join(
         gettempdir(), DEFAULT_PARENT_APPLICATION_NAME)
 
@@ -423,6 +680,15 @@ class Configuration(dict):
 
         self._name = name
         self.loaded = ()
+        self.layers = []
+
+        # Data from the layers is queued here, by the index of the layer,
+        # by the threads revalidating them and only applied to this
+        # instance by refresh().  The data last applied from each layer
+        # is kept so refresh() can apply the layers in order again.
+        self._pending = {}
+        self._layer_data = {}
+        self._pending_lock = threading.Lock()
         self.cwd = os.getcwd() if cwd is None else cwd
         self.file_extension = self.DEFAULT_FILE_EXTENSION
         self.system_root = self.DEFAULT_SYSTEM_ROOT
@@ -467,6 +733,12 @@ class Configuration(dict):
         else:
             logger.debug("Created %r", self.tempdir)
 
+        # Add the configuration server if one was
+        # provided in the environment.
+        url = read_env(self.DEFAULT_ENVIRONMENT_URL_VARIABLE, None)
+        if url:
+            self.add_http_layer(url)
+
         # Try to locate the package's built-in configuration
         # file.  This will be loaded before anything else
         # to provide the default values.
@@ -590,11 +862,76 @@ class Configuration(dict):
 
         return existing_files
 
+    def add_http_layer(self, url, **kwargs):
+        """
+        Adds an :class:`HTTPConfigurationLayer` for ``url`` which will be
+        loaded by :meth:`load` after the configuration files.  The cached
+        payload for the layer is stored in :attr:`tempdir`.  Any
+        additional keywords are passed along to
+        :class:`HTTPConfigurationLayer`.
+        """
+        layer = HTTPConfigurationLayer(url, self.tempdir, **kwargs)
+        self.layers.append(layer)
+        return layer
+
+    def _apply(self, data, environment=None):
+        """
+        Updates this instance with ``data``.  Any data present in the
+        ``env`` key will be used to update ``environment`` instead.
+        ``data`` itself is not modified.
+        """
+        if environment is not None and "env" in data:
+            config_environment = data["env"]
+            assert isinstance(config_environment, dict)
+            environment.update(config_environment)
+            data = dict(
+                (key, value) for key, value in data.items() if key != "env")
+
+        elif environment is None:
+            logger.warning(
+                "No environment was provided to be populated by the "
+                "configuration file(s)")
+
+        # Update this instance with the loaded data
+        self.update(data)
+
+    def _queue(self, index, data, environment=None):
+        """
+        Queues ``data`` from the layer at ``index`` in :attr:`layers` to
+        be applied by :meth:`refresh`
+        """
+        with self._pending_lock:
+            self._pending[index] = (data, environment)
+
+    def refresh(self):
+        """
+        Applies any data the layers in :attr:`layers` retrieved in the
+        background since :meth:`load` or the last call to this method.
+        Layers revalidate in their own threads but the data is only
+        applied by the thread calling this method so this instance never
+        changes while another thread is reading from it.  The layers are
+        applied in the order of :attr:`layers` starting from the first
+        layer with new data, so new data from one layer never overrides a
+        layer after it.  Returns True if any data was applied.
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return False
+
+        self._layer_data.update(pending)
+        for index in sorted(self._layer_data):
+            if index >= min(pending):
+                data, environment = self._layer_data[index]
+                self._apply(data, environment=environment)
+        return True
+
     def load(self, environment=None):
         """
-        Loads data from the configuration files.  Any data present
-        in the ``env`` key in the configuration files will update
-        ``environment``
+        Loads data from the configuration files followed by
+        any layers in :attr:`layers`.  Any data present in the ``env``
+        key in the configuration files will update ``environment``
 
         :param dict environment:
             A dictionary to load data in the ``env`` key from
@@ -620,18 +957,26 @@ class Configuration(dict):
             if not data:
                 continue
 
-            if environment is not None and "env" in data:
-                config_environment = data.pop("env")
-                assert isinstance(config_environment, dict)
-                environment.update(config_environment)
+            self._apply(data, environment=environment)
 
-            elif environment is None:
-                logger.warning(
-                    "No environment was provided to be populated by the "
-                    "configuration file(s)")
+        # Cached data for every layer is applied before any revalidation
+        # starts, newer data retrieved from the server in the background
+        # is applied by the next call to refresh().
+        with self._pending_lock:
+            self._pending = {}
+        self._layer_data = {}
+        for index, layer in enumerate(self.layers):
+            data = layer.load(revalidate=False)
+
+            if data is not None:
+                self._layer_data[index] = (data, environment)
+                self._apply(data, environment=environment)
+                loaded.append(layer.url)
 
-            # Update this instance with the loaded data
-            self.update(data)
+        for index, layer in enumerate(self.layers):
+            if layer.from_cache:
+                layer.start_revalidation(
+                    partial(self._queue, index, environment=environment))
 
         if loaded:
             self.loaded = tuple(loaded)
@@ -643,6 +988,27 @@ class Configuration(dict):
                 "No configuration files were loaded after searching %s",
                 pformat(self.files(validate=False)))
 
+    def _template_values(self):
+        """
+        Returns the values available to templates, see
+        :meth:`_expandvars` for the order they're applied in
+        """
+        template_values = {"temp": self.tempdir}
+        template_values.update(os.environ)
+        template_values.update(self.get("env", {}))
+        template_values.update(**self)
+        return template_values
+
+    def command_template(self, template):
+        """
+        Compiles ``template``, a command line string or list of
+        arguments, into a :class:`pyfarm.core.commands.CommandTemplate`.
+        Variables are expanded from the same sources as
+        :meth:`_expandvars` except for ``$frame``, ``$start`` and ``$end``
+        which are provided when each command is rendered.
+        """
+        return CommandTemplate(template, self._template_values())
+
     def _expandvars(self, value):
         """
         Performs variable expansion for ``value``. This method is run when
@@ -677,10 +1043,7 @@ class Configuration(dict):
                 "path": "/home/user/foo/bar/somevalue"
             }
         """
-        template_values = {"temp": self.tempdir}
-        template_values.update(os.environ)
-        template_values.update(self.get("env", {}))
-        template_values.update(**self)
+        template_values = self._template_values()
 
         # Do recursive variable expansion until we've either
         # reached MAX_EXPANSION_RECURSION or the resulting
@@ -233,7 +233,13 @@ class Values(namedtuple("Values", ("int", "str"))):
     Stores values to be used in an enum.  Each time this
     class is instanced it will ensure that the input values
     are of the correct type and unique.
+
+    Instances do not carry a ``__dict__`` and comparisons dispatch on the
+    exact type of the other object first so the common cases, comparing
+    against a plain ``str`` or ``int``, skip the :func:`isinstance` checks.
     """
+    __slots__ = ()
+
     # Numerical types which are specific to the enums
     # only.
     try:
@@ -256,8 +262,6 @@ class Values(namedtuple("Values", ("int", "str"))):
         else:
             self._integers.add(self.int)
 
-        self._values = set([self.int, self.str])
-
     def __hash__(self):
         return self.str.__hash__()
 
@@ -272,49 +276,61 @@ class Values(namedtuple("Values", ("int", "str"))):
             self.__class__.__name__, self.int, repr(self.str))
 
     def __contains__(self, item):
-        if isinstance(item, STRING_TYPES):
+        index = _VALUES_INDEX.get(item.__class__)
+        if index is not None:
+            return item == self[index]
+        elif isinstance(item, Values):
+            return item.str == self.str and item.int == self.int
+        elif isinstance(item, STRING_TYPES):
             return item == self.str
         elif isinstance(item, self.NUMERIC_TYPES):
             return item == self.int
-        elif isinstance(item, Values):
-            return item.str == self.str and item.int == self.int
         else:  # pragma: no cover
             return False
 
     def __eq__(self, other):
         return self.__contains__(other)
 
-    def __gt__(self, other):
-        if isinstance(other, self.NUMERIC_TYPES):
-            return other < self.int
+    def __ne__(self, other):
+        return not self.__contains__(other)
+
+    def _compared_int(self, other):
+        """
+        Returns the integer ``other`` should be compared to this
+        instance with or raises :class:`NotImplementedError` if the two
+        can't be compared.
+        """
+        if other.__class__ is int:
+            return other
         elif isinstance(other, Values):
-            return other.int < self.int
+            return other.int
+        elif isinstance(other, self.NUMERIC_TYPES):
+            return other
         else:
             raise NotImplementedError("Cannot compare against %s" % type(other))
 
+    def __gt__(self, other):
+        return self.int > self._compared_int(other)
+
     def __ge__(self, other):
-        if isinstance(other, self.NUMERIC_TYPES):
-            return other <= self.int
-        elif isinstance(other, Values):
-            return other.int <= self.int
-        else:
-            raise NotImplementedError("Cannot compare against %s" % type(other))
+        return self.int >= self._compared_int(other)
 
     def __lt__(self, other):
-        if isinstance(other, self.NUMERIC_TYPES):
-            return other > self.int
-        elif isinstance(other, Values):
-            return other.int > self.int
-        else:
-            raise NotImplementedError("Cannot compare against %s" % type(other))
+        return self.int < self._compared_int(other)
 
     def __le__(self, other):
-        if isinstance(other, self.NUMERIC_TYPES):
-            return other >= self.int
-        elif isinstance(other, Values):
-            return other.int >= self.int
-        else:
-            raise NotImplementedError("Cannot compare against %s" % type(other))
+        return self.int <= self._compared_int(other)
+
+
+# Maps the exact type of an object being compared to an instance
+# of Values to the index of the field it should be compared against.
+_VALUES_INDEX = {int: 0, str: 1}
+if PY2:  # pragma: no cover
+    _VALUES_INDEX.update({long: 0, unicode: 1})
+
+
+# Results of cast_enum(), see the docstring for more information.
+_CAST_ENUM_REGISTRY = {}
 
 
 def cast_enum(enum, enum_type):
@@ -330,43 +346,348 @@ def cast_enum(enum, enum_type):
     >>> assert Foo.A == 1
     >>> assert Foo._map == {"A": 1, 1: "A"}
 
-    .. warning::
-        This function does not perform any kind of caching.  For the most
-        efficient usage it should only be called once per process or
-        module for a given enum and enum_type combination.
+    Along with the fields of ``enum`` the resulting object provides
+    lookup tables which are built once here so membership tests and
+    conversions between the integer, string and :class:`Values` forms
+    are all single dictionary lookups:
+
+    >>> assert "1" in Foo and 1 in Foo and FooBase.A in Foo
+    >>> assert Foo._cast("1") == 1
+    >>> assert Foo._member(1) is FooBase.A
+
+    Results are stored in a registry so casting an enum, or another enum
+    with the same name and members, to the same ``enum_type`` again
+    returns the object which was built the first time:
+
+    >>> assert cast_enum(FooBase, int) is Foo
     """
+    if enum_type is int:
+        field = "int"
+    elif enum_type is str:
+        field = "str"
+    else:
+        raise TypeError("Valid values for `enum_type` are int or str")
+
+    registry_key = (
+        enum.__class__.__name__, enum._fields, tuple(enum), enum_type)
+    try:
+        return _CAST_ENUM_REGISTRY[registry_key]
+    except KeyError:
+        pass
+
     enum_data = {}
     reverse_map = {}
+    members = {}
+    casts = {}
 
-    # construct the reverse mapping and push
-    # the request type into enum_data
+    # construct the reverse mapping, the lookup tables
+    # and push the request type into enum_data
     for key, value in enum._asdict().items():
         reverse_map[value.int] = value.str
         reverse_map[value.str] = value.int
-
-        if enum_type is int:
-            enum_data[key] = value.int
-        elif enum_type is str:
-            enum_data[key] = value.str
-        else:
-            raise TypeError("Valid values for `enum_type` are int or str")
+        members[value.int] = members[value.str] = value
+        casts[value.int] = casts[value.str] = getattr(value, field)
+        enum_data[key] = getattr(value, field)
 
     class MappedEnum(
         namedtuple(
             enum.__class__.__name__, enum_data.keys())):  # pragma: no cover
+        __slots__ = ()
         _map = reverse_map
         _enum = enum
+        _type = enum_type
+        _members = members
+        _casts = casts
+        _enum_name = enum.__class__.__name__
 
         def __contains__(self, item):
-            if item in self._map:
-                return True
-            else:
-                for key, value in self._enum._asdict().items():
-                    if item in value:
-                        return True
+            try:
+                member = self._members.get(item)
+            except TypeError:  # unhashable
+                return False
+
+            # Values hash the same as their string so a member from
+            # another enum could share a key, compare the whole value.
+            if member is None:
+                return False
+            elif isinstance(item, Values):
+                return item.int == member.int
+            return True
+
+        def _member(self, value):
+            """
+            Returns the :class:`Values` instance for ``value`` which may be
+            the integer, string or :class:`Values` form of a member.
+
+            :raises ValueError:
+                Raised if ``value`` is not a member of this enum
+            """
+            if value not in self:
+                raise ValueError(
+                    "%r is not a member of %s" % (value, self._enum_name))
+            return self._members[value]
+
+        def _cast(self, value):
+            """
+            Converts ``value``, which may be the integer, string or
+            :class:`Values` form of a member, into the type this enum
+            was cast to.
+
+            :raises ValueError:
+                Raised if ``value`` is not a member of this enum
+            """
+            if value not in self:
+                raise ValueError(
+                    "%r is not a member of %s" % (value, self._enum_name))
+            return self._casts[value]
+
+    # setdefault() so that if two threads race to build the
+    # same enum they both end up with the same object.
+    return _CAST_ENUM_REGISTRY.setdefault(
+        registry_key, MappedEnum(**enum_data))
+
+
+class StateSet(object):
+    """
+    An immutable set of members from a single enum which is stored as a
+    bitmask over the members' positions in the enum, ordered by their
+    integer values.  Membership tests accept the integer, string or
+    :class:`Values` form of a member and set operations are bitwise
+    operations on the masks.
+
+    >>> Light = Enum("Light", ON=Values(1, "on"), OFF=Values(2, "off"))
+    >>> lights = StateSet(Light, ["on"])
+    >>> "on" in lights and 1 in lights and Light.ON in lights
+    True
+    >>> list(lights | StateSet(Light, [2]))
+    ['on', 'off']
+    >>> list(~StateSet(Light, ["on"], int))
+    [2]
+
+    :param enum:
+        The enum, built from :class:`Values`, the members of
+        the set come from
+
+    :param states:
+        The initial members of the set
+
+    :param enum_type:
+        The type, either ``str`` or ``int``, members will be returned
+        as when iterating over the set.  This has no effect on
+        membership tests.
+
+    :raises ValueError:
+        Raised if any of the ``states`` are not members of ``enum``
+    """
+    __slots__ = ("enum", "enum_type", "mask", "_bits", "_values")
+    _tables = {}
+
+    def __init__(self, enum, states=(), enum_type=str):
+        if enum_type is not int and enum_type is not str:
+            raise TypeError("Valid values for `enum_type` are int or str")
+
+        self.enum = enum
+        self.enum_type = enum_type
+        self._bits, self._values = self._table(enum)
+
+        mask = 0
+        for state in states:
+            bit = self._bits.get(state)
+            if bit is None:
+                raise ValueError(
+                    "%r is not a member of %s" % (
+                        state, enum.__class__.__name__))
+            mask |= bit
+        self.mask = mask
+
+    @classmethod
+    def _table(cls, enum):
+        """
+        Returns a mapping of each member's integer and string value to its
+        bit along with a tuple of the members in bit order.  The result is
+        built once per enum.
+        """
+        try:
+            return cls._tables[enum]
+        except KeyError:
+            values = tuple(sorted(enum, key=int))
+            bits = {}
+            for ordinal, value in enumerate(values):
+                bits[value.int] = bits[value.str] = 1 << ordinal
+            cls._tables[enum] = bits, values
+            return bits, values
+
+    def _from_mask(self, mask):
+        state_set = StateSet.__new__(StateSet)
+        state_set.enum = self.enum
+        state_set.enum_type = self.enum_type
+        state_set._bits = self._bits
+        state_set._values = self._values
+        state_set.mask = mask
+        return state_set
+
+    def _other_mask(self, other):
+        if isinstance(other, StateSet):
+            if other.enum != self.enum:
+                raise TypeError("Cannot combine sets from different enums")
+            return other.mask
+        return StateSet(self.enum, other).mask
+
+    def __contains__(self, item):
+        try:
+            return self.mask & self._bits.get(item, 0) != 0
+        except TypeError:  # unhashable
             return False
 
-    return MappedEnum(**enum_data)
+    def __iter__(self):
+        field = 0 if self.enum_type is int else 1
+        mask = self.mask
+        for ordinal, value in enumerate(self._values):
+            if mask >> ordinal & 1:
+                yield value[field]
+
+    def __len__(self):
+        return bin(self.mask).count("1")
+
+    def __bool__(self):
+        return self.mask != 0
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "%s(%s, %r)" % (
+            self.__class__.__name__, self.enum.__class__.__name__, list(self))
+
+    def __hash__(self):
+        # The same hash as a frozenset of the members, which compares
+        # equal to this set
+        return hash(frozenset(self))
+
+    def __eq__(self, other):
+        if isinstance(other, StateSet):
+            return (other.enum == self.enum and other.mask == self.mask and
+                    other.enum_type is self.enum_type)
+        elif isinstance(other, (set, frozenset)):
+            return set(self) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __or__(self, other):
+        return self._from_mask(self.mask | self._other_mask(other))
+
+    def __and__(self, other):
+        return self._from_mask(self.mask & self._other_mask(other))
+
+    def __sub__(self, other):
+        return self._from_mask(self.mask & ~self._other_mask(other))
+
+    def __xor__(self, other):
+        return self._from_mask(self.mask ^ self._other_mask(other))
+
+    # Operations with a plain set on the left return a set of the same
+    # type, anything in the set which is not a member of the enum is
+    # kept rather than raising an error.
+    def __ror__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        return type(other)(list(other) + list(self))
+
+    def __rand__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        return type(other)(item for item in other if item in self)
+
+    def __rsub__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        return type(other)(item for item in other if item not in self)
+
+    def __rxor__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        other_mask = 0
+        for item in other:
+            other_mask |= self._bits.get(item, 0)
+        return type(other)(
+            [item for item in other if item not in self] +
+            list(self._from_mask(self.mask & ~other_mask)))
+
+    def __invert__(self):
+        return self._from_mask(~self.mask & ((1 << len(self._values)) - 1))
+
+    def issubset(self, other):
+        return self.mask & ~self._other_mask(other) == 0
+
+    def issuperset(self, other):
+        return self._other_mask(other) & ~self.mask == 0
+
+    def isin(self, states):
+        """
+        Tests every state in ``states`` for membership.  If ``states`` is
+        a :class:`numpy.ndarray` of integer states the test is done in one
+        vectorized pass and an array of booleans is returned, otherwise a
+        list of booleans is returned.
+        """
+        # numpy is not imported here unless something else already has,
+        # if it's not imported then `states` can't be an array.
+        numpy = sys.modules.get("numpy")
+        if numpy is not None and isinstance(states, numpy.ndarray) \
+                and self._values[0].int >= 0:
+            # Value N is stored at N + 1 so the first and last entries
+            # are always False and clipping handles anything outside of
+            # the table.
+            lookup = numpy.zeros(self._values[-1].int + 3, dtype=bool)
+            for value in self._values:
+                if value in self:
+                    lookup[value.int + 1] = True
+            return lookup.take(states + 1, mode="clip")
+
+        bits = self._bits
+        mask = self.mask
+        return [mask & bits.get(state, 0) != 0 for state in states]
+
+    def sql_in(self, column):
+        """
+        Returns a SQL expression which tests if the integer values
+        in ``column`` are members of this set
+
+        >>> StateSet(WorkState, ["done", "failed"]).sql_in("state")
+        'state IN (106, 107)'
+        """
+        codes = [value.int for value in self._values if value in self]
+        if not codes:
+            return "1 = 0"
+        return "%s IN (%s)" % (column, ", ".join(map(str, codes)))
+
+    def sql_mask(self, column):
+        """
+        Returns a SQL expression which tests if the integer values in
+        ``column`` are members of this set by shifting a bitmask of the
+        set's integer values, relative to the smallest value in the enum.
+
+        >>> StateSet(WorkState, ["done"]).sql_mask("state")
+        '(state BETWEEN 100 AND 107 AND (64 >> (state - 100)) & 1 = 1)'
+
+        :raises ValueError:
+            Raised if the integer values of the enum span too large of
+            a range to fit in a 63 bit mask
+        """
+        low = self._values[0].int
+        high = self._values[-1].int
+        if high - low > 62:
+            raise ValueError(
+                "the values of %s span too large of a range for a "
+                "mask" % self.enum.__class__.__name__)
+
+        mask = 0
+        for value in self._values:
+            if value in self:
+                mask |= 1 << (value.int - low)
+
+        return "(%s BETWEEN %d AND %d AND (%d >> (%s - %d)) & 1 = 1)" % (
+            column, low, high, mask, column, low)
 
 
 # 1xx - work states
@@ -405,30 +726,56 @@ _UseAgentAddress = Enum(
     HOSTNAME=Values(312, "hostname"),
     PASSIVE=Values(313, "passive"))
 
-# string versions of the enums above
-WorkState = cast_enum(_WorkState, str)
-AgentState = cast_enum(_AgentState, str)
-OperatingSystem = cast_enum(_OperatingSystem, str)
-UseAgentAddress = cast_enum(_UseAgentAddress, str)
+# Versions of the enums above which are built by cast_enum() the
+# first time they're accessed, see __getattr__ below.
+_CAST_ENUMS = {
+    # string versions of the enums above
+    "WorkState": ("_WorkState", str),
+    "AgentState": ("_AgentState", str),
+    "OperatingSystem": ("_OperatingSystem", str),
+    "UseAgentAddress": ("_UseAgentAddress", str),
+
+    # integer versions of the enums above, mainly declared for
+    # direct use within queries
+    "DBWorkState": ("_WorkState", int),
+    "DBAgentState": ("_AgentState", int),
+    "DBOperatingSystem": ("_OperatingSystem", int),
+    "DBUseAgentAddress": ("_UseAgentAddress", int)}
+
+
+def __getattr__(name):
+    """
+    Called by Python 3.7+ when ``name`` can't be found in this module (see
+    :pep:`562`).  This builds the enums in ``_CAST_ENUMS`` on first access
+    and stores them in the module so later access is a normal lookup.
+    """
+    try:
+        enum_name, enum_type = _CAST_ENUMS[name]
+    except KeyError:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+
+    value = globals()[name] = cast_enum(globals()[enum_name], enum_type)
+    return value
 
-# integer versions of the enums above, mainly declared for
-# direct use within queries
-DBWorkState = cast_enum(_WorkState, int)
-DBAgentState = cast_enum(_AgentState, int)
-DBOperatingSystem = cast_enum(_OperatingSystem, int)
-DBUseAgentAddress = cast_enum(_UseAgentAddress, int)
 
-RUNNING_WORK_STATES = set([
-    WorkState.RUNNING])
+def __dir__():
+    return sorted(set(globals()) | set(_CAST_ENUMS))
 
-DB_RUNNING_WORK_STATES = set([
-    DBWorkState.RUNNING])
 
-FAILED_WORK_STATES = set([
-    WorkState.FAILED])
+# Module level __getattr__ is not supported by older versions
+# of Python so the enums must be built now.
+if PY_VERSION < (3, 7):  # pragma: no cover
+    for _name in _CAST_ENUMS:
+        __getattr__(_name)
+    del _name
 
-DB_FAILED_WORK_STATES = set([
-    DBWorkState.FAILED])
+# sets of work states, the DB_ versions produce integers
+# when iterated over instead of strings
+RUNNING_WORK_STATES = StateSet(_WorkState, [_WorkState.RUNNING])
+DB_RUNNING_WORK_STATES = StateSet(_WorkState, [_WorkState.RUNNING], int)
+FAILED_WORK_STATES = StateSet(_WorkState, [_WorkState.FAILED])
+DB_FAILED_WORK_STATES = StateSet(_WorkState, [_WorkState.FAILED], int)
 
 
 def operating_system(plat=sys.platform):
@@ -452,8 +799,15 @@ INTERACTIVE_INTERPRETER = hasattr(sys, "ps1") or sys.gettrace() is not None
 
 # operating system information
 OS = operating_system()
-POSIX = OS in (OperatingSystem.LINUX, OperatingSystem.MAC)
-WINDOWS = OS == OperatingSystem.WINDOWS
-LINUX = OS == OperatingSystem.LINUX
-MAC = OS == OperatingSystem.MAC
-BSD = OS == OperatingSystem.BSD
+POSIX = OS in (_OperatingSystem.LINUX.str, _OperatingSystem.MAC.str)
+WINDOWS = OS == _OperatingSystem.WINDOWS.str
+LINUX = OS == _OperatingSystem.LINUX.str
+MAC = OS == _OperatingSystem.MAC.str
+BSD = OS == _OperatingSystem.BSD.str
+
+# Names exported by `from pyfarm.core.enums import *`.  This has to be
+# explicit because the enums in _CAST_ENUMS are not in the module's
+# globals until they're first accessed through __getattr__.
+__all__ = sorted(
+    set(name for name in globals() if not name.startswith("_")) |
+    set(_CAST_ENUMS))
@@ -0,0 +1,222 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Task Environments
+=================
+
+Builds the environment of each task process from layers, each one
+overriding the layers before it: the agent's own environment, the
+``env`` from the configuration, the job's environment and finally the
+task's.  Layers are stored as :class:`pyfarm.core.utility.FrozenDict`
+instances so every task in a job shares a single flattened copy of the
+layers below it instead of copying every variable.  A :class:`dict` or
+a list of ``NAME=value`` strings is only built when a process is about
+to be started.
+"""
+
+import os
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+from pyfarm.core.enums import STRING_TYPES
+from pyfarm.core.utility import FrozenDict
+
+
+def _layer_items(layer):
+    """
+    Returns the variables in ``layer``, a mapping or an iterable of
+    pairs, as a list of ``(name, value)`` pairs.  Values which are not
+    strings are converted to one except for ``None``.
+    """
+    if not layer:
+        return []
+    elif isinstance(layer, Mapping):
+        layer = layer.items()
+    return [
+        (name, value if value is None or isinstance(value, STRING_TYPES)
+         else "%s" % (value, ))
+        for name, value in layer]
+
+
+def merge_layer(environment, layer):
+    """
+    Returns a copy of ``environment``, a
+    :class:`pyfarm.core.utility.FrozenDict`, with the variables in
+    ``layer`` applied.  A variable set to ``None`` is removed and any
+    other value which is not a string is converted to one.  If ``layer``
+    sets a variable more than once the last value wins.
+    """
+    items = list(dict(_layer_items(layer)).items())
+    environment = environment.merge(
+        [item for item in items if item[1] is not None])
+    for name, value in items:
+        if value is None:
+            environment = environment.discard(name)
+    return environment
+
+
+class _JobEnvironment(object):
+    """The flattened environment of a job along with spawn time caches"""
+    __slots__ = ("generation", "mapping", "_dict", "_envp")
+
+    def __init__(self, generation, mapping):
+        self.generation = generation
+        self.mapping = mapping
+        self._dict = None
+        self._envp = None
+
+    def dict(self):
+        if self._dict is None:
+            self._dict = dict(self.mapping.items())
+        return self._dict
+
+    def envp(self):
+        if self._envp is None:
+            self._envp = [
+                (name, "%s=%s" % (name, value))
+                for name, value in self.mapping.items()]
+        return self._envp
+
+
+class EnvironmentBuilder(object):
+    """
+    Builds task environments from shared layers.  The base layers are
+    provided when the builder is created, or later with
+    :meth:`set_layers`, and each job's environment with :meth:`set_job`.
+    The base layers merged with a job's environment are flattened the
+    first time one of the job's tasks needs an environment and reused
+    until either the job or the base layers change.
+
+    >>> builder = EnvironmentBuilder(
+    ...     {"PATH": "/bin", "USER": "agent"}, {"RENDERER": "arnold"})
+    >>> builder.set_job(1, {"SHOT": "sh010"})
+    >>> environment = builder.environment(1, {"FRAME": 5, "USER": None})
+    >>> sorted(environment.items())
+    [('FRAME', '5'), ('PATH', '/bin'), ('RENDERER', 'arnold'), \
+('SHOT', 'sh010')]
+    >>> sorted(builder.envp(1, {"FRAME": 6}))
+    ['FRAME=6', 'PATH=/bin', 'RENDERER=arnold', 'SHOT=sh010', 'USER=agent']
+
+    :param layers:
+        The base layers, from lowest to highest priority.  Defaults to
+        :data:`os.environ`, typically this would be followed by the
+        environment populated by
+        :meth:`pyfarm.core.config.Configuration.load`.
+
+    :var generation:
+        Incremented each time the base layers change, the environment of
+        a job is only rebuilt when it was built for an older generation.
+    """
+    def __init__(self, *layers):
+        self.generation = 0
+        self.base = FrozenDict()
+        self._jobs = {}
+        self._cache = {}
+        self.set_layers(*(layers or (os.environ, )))
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def set_layers(self, *layers):
+        """
+        Replaces the base layers.  The environment of each job will be
+        rebuilt the next time it's requested.
+        """
+        base = FrozenDict()
+        for layer in layers:
+            base = merge_layer(base, layer)
+        self.base = base
+        self.generation += 1
+
+    def set_job(self, job_id, environment=None):
+        """
+        Sets the environment specific to ``job_id``, variables set to
+        ``None`` are removed from the base layers
+        """
+        self._jobs[job_id] = _layer_items(environment)
+        self._cache.pop(job_id, None)
+
+    def discard_job(self, job_id):
+        """Stops tracking ``job_id`` and drops its cached environment"""
+        self._jobs.pop(job_id, None)
+        self._cache.pop(job_id, None)
+
+    def _job(self, job_id):
+        cached = self._cache.get(job_id)
+        if cached is None or cached.generation != self.generation:
+            mapping = merge_layer(self.base, self._jobs[job_id])
+            cached = self._cache[job_id] = _JobEnvironment(
+                self.generation, mapping)
+        return cached
+
+    def environment(self, job_id, environment=None):
+        """
+        Returns the environment of a task in ``job_id`` as a
+        :class:`pyfarm.core.utility.FrozenDict`.  Without task specific
+        variables in ``environment`` this is the job's cached mapping.
+
+        :raises KeyError:
+            Raised if ``job_id`` was not added with :meth:`set_job`
+        """
+        return merge_layer(self._job(job_id).mapping, environment)
+
+    def environ(self, job_id, environment=None):
+        """
+        Returns the environment of a task in ``job_id`` as a new
+        :class:`dict`, for :class:`subprocess.Popen` or
+        :func:`os.execve`.  The dictionary is copied from one built
+        for the job rather than from the layers each time.
+
+        :raises KeyError:
+            Raised if ``job_id`` was not added with :meth:`set_job`
+        """
+        result = self._job(job_id).dict().copy()
+        for name, value in _layer_items(environment):
+            if value is None:
+                result.pop(name, None)
+            else:
+                result[name] = value
+        return result
+
+    def envp(self, job_id, environment=None):
+        """
+        Returns the environment of a task in ``job_id`` as a new list of
+        ``NAME=value`` strings, the form used by the ``envp`` argument
+        of ``execve``.  Strings for variables the task does not override
+        are shared with every other task in the job.
+
+        :raises KeyError:
+            Raised if ``job_id`` was not added with :meth:`set_job`
+        """
+        entries = self._job(job_id).envp()
+        if not environment:
+            return [entry for _, entry in entries]
+
+        # the last value for a variable wins, the same as environ()
+        overrides = dict(_layer_items(environment))
+        result = [entry for name, entry in entries if name not in overrides]
+        result.extend(
+            "%s=%s" % (name, value) for name, value in overrides.items()
+            if value is not None)
+        return result
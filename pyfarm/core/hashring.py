@@ -0,0 +1,275 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Hash Ring
+=========
+
+Consistent hashing of job ids to the master which owns them.  Each
+master is placed on a 64-bit ring at many points, its virtual nodes,
+and a job belongs to the master with the first point at or after the
+job's hash.  When a master joins it only takes jobs from its neighbours
+and when one leaves only its own jobs move, every other job keeps its
+owner.
+
+Integer job ids are hashed with the splitmix64 finalizer so large
+batches can be hashed by :mod:`numpy` when it's installed, other ids
+are hashed with MD5 of their string form.  Node points are always
+derived from MD5 of the node name so every process builds an identical
+ring from the output of :meth:`HashRing.to_dict`.
+"""
+
+from array import array
+from bisect import bisect_left
+from hashlib import md5
+from numbers import Integral
+from operator import index
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from pyfarm.core.enums import range_
+
+_MASK64 = (1 << 64) - 1
+
+try:
+    array("Q")
+    _POINT_TYPECODE = "Q"
+except ValueError:  # pragma: no cover
+    _POINT_TYPECODE = None
+
+
+def _md5_64(value):
+    if not isinstance(value, bytes):
+        value = value.encode("utf-8")
+    return int(md5(value).hexdigest()[:16], 16)
+
+
+def _mix64(value):
+    """splitmix64 finalizer for a single integer"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def _mix64_array(values):
+    """splitmix64 finalizer for an array of integers"""
+    uint64 = numpy.uint64
+    values = values.astype(uint64) + uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> uint64(30))) * uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> uint64(27))) * uint64(0x94D049BB133111EB)
+    return values ^ (values >> uint64(31))
+
+
+def key_hash(key):
+    """
+    Returns the 64-bit position of ``key`` on the ring.  Any integer,
+    including :mod:`numpy` integer scalars, hashes to the same position
+    as the equal Python integer.
+    """
+    if isinstance(key, Integral):
+        return _mix64(index(key))
+    return _md5_64(str(key))
+
+
+class HashRing(object):
+    """
+    Maps keys, usually job ids, to nodes using consistent hashing.
+
+    >>> ring = HashRing(["master1", "master2"])
+    >>> ring.get(42) in ("master1", "master2")
+    True
+    >>> ring == HashRing.from_dict(ring.to_dict())
+    True
+
+    :param nodes:
+        The initial nodes, either an iterable of names or a dictionary
+        of name to weight
+
+    :param int replicas:
+        The number of virtual nodes each node with a weight of 1 is
+        placed at on the ring.  More virtual nodes spread keys more evenly
+        at the cost of a larger ring.
+    """
+    def __init__(self, nodes=(), replicas=160):
+        if replicas < 1:
+            raise ValueError("`replicas` must be at least 1")
+
+        self.replicas = replicas
+        self._weights = {}
+        self._nodes = []
+        self._points = []
+        self._owners = array("I")
+        self._numpy_points = None
+
+        if isinstance(nodes, dict):
+            nodes = nodes.items()
+        else:
+            nodes = ((node, 1) for node in nodes)
+
+        for node, weight in nodes:
+            self._add(node, weight)
+        self._build()
+
+    def __len__(self):
+        return len(self._weights)
+
+    def __contains__(self, node):
+        return node in self._weights
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __eq__(self, other):
+        if not isinstance(other, HashRing):
+            return NotImplemented
+        return (self.replicas == other.replicas and
+                self._weights == other._weights)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return "%s(%r, replicas=%r)" % (
+            self.__class__.__name__, self._weights, self.replicas)
+
+    def _add(self, node, weight):
+        if node in self._weights:
+            raise ValueError("node %r is already in the ring" % (node, ))
+        if weight <= 0:
+            raise ValueError("`weight` must be greater than zero")
+        self._weights[node] = weight
+
+    def _build(self):
+        """Rebuilds the sorted points of every node"""
+        self._nodes = sorted(self._weights, key=str)
+        pairs = []
+        for ordinal, node in enumerate(self._nodes):
+            name = str(node)
+            replicas = max(1, int(round(self.replicas * self._weights[node])))
+            for replica in range_(replicas):
+                pairs.append((_md5_64("%s-%d" % (name, replica)), ordinal))
+        pairs.sort()
+
+        points = [point for point, _ in pairs]
+        if _POINT_TYPECODE is not None:
+            points = array(_POINT_TYPECODE, points)
+        self._points = points
+        self._owners = array("I", [ordinal for _, ordinal in pairs])
+        self._numpy_points = None
+
+    def add(self, node, weight=1):
+        """
+        Adds ``node`` to the ring.  A node with a ``weight`` of 2 is
+        expected to own twice as many keys as a node with a weight of 1.
+
+        :raises ValueError:
+            Raised if ``node`` is already in the ring
+        """
+        self._add(node, weight)
+        self._build()
+
+    def remove(self, node):
+        """
+        Removes ``node`` from the ring
+
+        :raises KeyError:
+            Raised if ``node`` is not in the ring
+        """
+        del self._weights[node]
+        self._build()
+
+    def _owner(self, position):
+        points = self._points
+        index = bisect_left(points, position)
+        if index == len(points):
+            index = 0
+        return self._nodes[self._owners[index]]
+
+    def get(self, key):
+        """
+        Returns the node which owns ``key``
+
+        :raises ValueError:
+            Raised if the ring is empty
+        """
+        if not self._points:
+            raise ValueError("the ring is empty")
+        return self._owner(key_hash(key))
+
+    def get_many(self, keys):
+        """
+        Returns the node which owns each of ``keys``, in order.  If
+        :mod:`numpy` is installed and the keys are integers they're
+        hashed and looked up in a single pass.
+
+        :raises ValueError:
+            Raised if the ring is empty
+        """
+        if not self._points:
+            raise ValueError("the ring is empty")
+
+        if numpy is not None:
+            keys_array = numpy.asarray(keys)
+            if keys_array.dtype.kind in "iub" and keys_array.ndim == 1:
+                if self._numpy_points is None:
+                    self._numpy_points = (
+                        numpy.array(self._points, dtype=numpy.uint64),
+                        numpy.array(self._owners, dtype=numpy.intp))
+                points, owners = self._numpy_points
+                indexes = points.searchsorted(_mix64_array(keys_array))
+                indexes[indexes == len(points)] = 0
+                nodes = self._nodes
+                return [nodes[ordinal] for ordinal in owners[indexes].tolist()]
+
+        owner = self._owner
+        return [owner(key_hash(key)) for key in keys]
+
+    def partition(self, keys):
+        """
+        Splits ``keys`` into a dictionary of node to the list of keys it
+        owns.  Nodes which don't own any of the keys are not included.
+        """
+        nodes = self.get_many(keys)
+        if numpy is not None and isinstance(keys, numpy.ndarray):
+            keys = keys.tolist()
+
+        results = {}
+        for key, node in zip(keys, nodes):
+            try:
+                results[node].append(key)
+            except KeyError:
+                results[node] = [key]
+        return results
+
+    def to_dict(self):
+        """
+        Returns everything needed to rebuild the ring with
+        :meth:`from_dict`.  Only the nodes and their weights are included,
+        not the points, so the result stays small regardless of the
+        number of virtual nodes.
+        """
+        return {"replicas": self.replicas, "nodes": dict(self._weights)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a ring from the output of :meth:`to_dict`"""
+        return cls(data["nodes"], replicas=data["replicas"])
@@ -0,0 +1,263 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Task Placement
+==============
+
+Matches the CPU and memory a task requires to agents with enough free
+capacity.  Agents are grouped into buckets by the number of free CPUs
+and each bucket is kept sorted by free memory, so finding the best agent
+for a task is a binary search in each bucket with enough CPUs instead of
+a scan over every agent.  Free capacity is updated incrementally as
+tasks are assigned to and released from agents.
+
+Memory is expressed in megabytes, the same unit
+:meth:`pyfarm.core.utility.convert.bytetomb` produces.
+"""
+
+from bisect import bisect_left, insort
+from itertools import count
+
+
+class ResourceMatcher(object):
+    """
+    Tracks the free CPUs and memory of each agent and assigns tasks to
+    the agent they fit best.  The best fit is the agent which will have
+    the fewest CPUs left over once the task is assigned and, among those,
+    the least memory left over.
+
+    >>> matcher = ResourceMatcher()
+    >>> matcher.add_agent("big", cpus=16, ram=65536)
+    >>> matcher.add_agent("small", cpus=4, ram=8192)
+    >>> matcher.assign("render", cpus=2, ram=4096)
+    'small'
+    >>> matcher.assign("sim", cpus=4, ram=16384)
+    'big'
+    >>> matcher.free("big")
+    (12, 49152)
+    >>> matcher.release("sim")
+    'big'
+    """
+    def __init__(self):
+        # agent id -> [cpus, ram, free cpus, free ram, sequence]
+        self._agents = {}
+
+        # task id -> (agent id, cpus, ram)
+        self._assignments = {}
+
+        # agent id -> set of the task ids assigned to it
+        self._agent_tasks = {}
+
+        # free cpus -> sorted list of (free ram, sequence, agent id), the
+        # sequence keeps agent ids from ever being compared
+        self._buckets = {}
+        self._levels = []
+        self._sequence = count()
+
+    def __contains__(self, agent_id):
+        return agent_id in self._agents
+
+    def __len__(self):
+        return len(self._agents)
+
+    def _insert(self, agent):
+        free_cpus = agent[2]
+        try:
+            bucket = self._buckets[free_cpus]
+        except KeyError:
+            bucket = self._buckets[free_cpus] = []
+            insort(self._levels, free_cpus)
+        insort(bucket, tuple(agent[3:]))
+
+    def _discard(self, agent):
+        free_cpus = agent[2]
+        bucket = self._buckets[free_cpus]
+        del bucket[bisect_left(bucket, tuple(agent[3:]))]
+        if not bucket:
+            del self._buckets[free_cpus]
+            del self._levels[bisect_left(self._levels, free_cpus)]
+
+    def add_agent(self, agent_id, cpus, ram):
+        """
+        Starts tracking an agent with ``cpus`` and ``ram`` free
+
+        :raises ValueError:
+            Raised if ``agent_id`` is already being tracked
+        """
+        if agent_id in self._agents:
+            raise ValueError("agent %r already exists" % (agent_id, ))
+        agent = self._agents[agent_id] = [
+            cpus, ram, cpus, ram, next(self._sequence), agent_id]
+        self._agent_tasks[agent_id] = set()
+        self._insert(agent)
+
+    def remove_agent(self, agent_id):
+        """
+        Stops tracking ``agent_id``.  Tasks which were assigned to the
+        agent are forgotten as well.
+
+        :raises KeyError:
+            Raised if ``agent_id`` is not being tracked
+        """
+        self._discard(self._agents.pop(agent_id))
+        for task_id in self._agent_tasks.pop(agent_id):
+            del self._assignments[task_id]
+
+    def free(self, agent_id):
+        """Returns the free ``(cpus, ram)`` of ``agent_id``"""
+        agent = self._agents[agent_id]
+        return agent[2], agent[3]
+
+    def capacity(self):
+        """
+        Returns the total and free capacity of all agents as
+        ``(cpus, ram, free_cpus, free_ram)``
+        """
+        totals = [0, 0, 0, 0]
+        for agent in self._agents.values():
+            for index in range(4):
+                totals[index] += agent[index]
+        return tuple(totals)
+
+    def find(self, cpus, ram):
+        """
+        Returns the id of the agent ``cpus`` and ``ram`` fit best or
+        ``None`` if no agent has enough free capacity.  Nothing is
+        assigned.
+        """
+        levels = self._levels
+        buckets = self._buckets
+        key = (ram, )
+        for index in range(bisect_left(levels, cpus), len(levels)):
+            bucket = buckets[levels[index]]
+            position = bisect_left(bucket, key)
+            if position < len(bucket):
+                return bucket[position][2]
+        return None
+
+    def reserve(self, agent_id, cpus, ram):
+        """
+        Removes ``cpus`` and ``ram`` from the free capacity of
+        ``agent_id``
+
+        :raises ValueError:
+            Raised if the agent does not have enough free capacity
+        """
+        agent = self._agents[agent_id]
+        if agent[2] < cpus or agent[3] < ram:
+            raise ValueError(
+                "agent %r does not have %s cpu(s) and %sMB free" % (
+                    agent_id, cpus, ram))
+        self._discard(agent)
+        agent[2] -= cpus
+        agent[3] -= ram
+        self._insert(agent)
+
+    def unreserve(self, agent_id, cpus, ram):
+        """Returns ``cpus`` and ``ram`` to the free capacity of ``agent_id``"""
+        agent = self._agents[agent_id]
+        self._discard(agent)
+        agent[2] = min(agent[2] + cpus, agent[0])
+        agent[3] = min(agent[3] + ram, agent[1])
+        self._insert(agent)
+
+    def assign(self, task_id, cpus, ram):
+        """
+        Assigns ``task_id`` to the agent it fits best and returns the
+        agent's id, or ``None`` if it does not fit anywhere.
+
+        :raises ValueError:
+            Raised if ``task_id`` is already assigned
+        """
+        if task_id in self._assignments:
+            raise ValueError("task %r is already assigned" % (task_id, ))
+
+        agent_id = self.find(cpus, ram)
+        if agent_id is not None:
+            self.reserve(agent_id, cpus, ram)
+            self._assignments[task_id] = (agent_id, cpus, ram)
+            self._agent_tasks[agent_id].add(task_id)
+        return agent_id
+
+    def assign_many(self, tasks, decreasing=True):
+        """
+        Assigns a batch of ``(task_id, cpus, ram)`` tasks and returns a
+        dictionary of task id to agent id along with a list of the tasks
+        which did not fit.  When ``decreasing`` is True the largest tasks
+        are placed first, best-fit decreasing, which usually packs the
+        agents more tightly than placing them in the order given.
+
+        :raises ValueError:
+            Raised if a task id appears more than once in ``tasks`` or is
+            already assigned.  No task is placed if this is raised.
+        """
+        if decreasing:
+            tasks = sorted(
+                tasks, key=lambda task: (task[1], task[2]), reverse=True)
+        else:
+            tasks = list(tasks)
+
+        task_ids = set()
+        for task in tasks:
+            task_id = task[0]
+            if task_id in task_ids or task_id in self._assignments:
+                raise ValueError("task %r is already assigned" % (task_id, ))
+            task_ids.add(task_id)
+
+        assigned = {}
+        unassigned = []
+        assign = self.assign
+
+        # Free capacity only shrinks during the batch so a task which
+        # needs at least as much as a task that did not fit can't fit
+        # either.  Maps cpus to the least ram a task which did not fit
+        # with that many cpus required.
+        failed = {}
+
+        for task_id, cpus, ram in tasks:
+            for failed_cpus, failed_ram in failed.items():
+                if failed_cpus <= cpus and failed_ram <= ram:
+                    agent_id = None
+                    break
+            else:
+                agent_id = assign(task_id, cpus, ram)
+                if agent_id is None:
+                    failed[cpus] = min(failed.get(cpus, ram), ram)
+
+            if agent_id is None:
+                unassigned.append(task_id)
+            else:
+                assigned[task_id] = agent_id
+        return assigned, unassigned
+
+    def release(self, task_id):
+        """
+        Returns the capacity used by ``task_id`` to its agent and returns
+        the agent's id
+
+        :raises KeyError:
+            Raised if ``task_id`` is not assigned
+        """
+        agent_id, cpus, ram = self._assignments.pop(task_id)
+        self._agent_tasks[agent_id].discard(task_id)
+        self.unreserve(agent_id, cpus, ram)
+        return agent_id
+
+    def agent(self, task_id):
+        """Returns the agent ``task_id`` is assigned to"""
+        return self._assignments[task_id][0]
@@ -0,0 +1,403 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Job State Rollup
+================
+
+Builds job states from the states of their tasks.  Task states are
+provided as compact sequences of :const:`pyfarm.core.enums.DBWorkState`
+codes, either an :class:`array.array`, a list or, if :mod:`numpy` is
+installed, a :class:`numpy.ndarray`.  Counting is done by C code in a
+single pass (:meth:`array.array.count` or :func:`numpy.bincount`)
+instead of looping over task objects in Python.
+
+:const QUEUED:
+    The code used in a task state array for a task which does not
+    have a state yet.  Any code which is not a
+    :const:`pyfarm.core.enums.DBWorkState` value is counted as queued.
+"""
+
+from __future__ import division
+
+from array import array
+from collections import namedtuple
+
+try:
+    from collections import Counter
+except ImportError:  # pragma: no cover
+    Counter = None
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from pyfarm.core.enums import DBWorkState
+
+QUEUED = 0
+
+# The order of the states in JobRollup, index 0 (queued)
+# is used for any code that's not listed here.
+STATE_CODES = (
+    QUEUED, DBWorkState.PAUSED, DBWorkState.RUNNING,
+    DBWorkState.DONE, DBWorkState.FAILED)
+_ORDINALS = dict((code, index) for index, code in enumerate(STATE_CODES))
+
+if numpy is not None:
+    # Lookup table from code to index in JobRollup.  The last entry
+    # is always 0 so numpy.take(mode="clip") will map any code
+    # outside of the table to queued.
+    _ORDINAL_TABLE = numpy.zeros(max(STATE_CODES) + 2, dtype=numpy.intp)
+    for _code, _index in _ORDINALS.items():
+        _ORDINAL_TABLE[_code] = _index
+    del _code, _index
+
+
+def job_state(queued, paused, running, done, failed):
+    """
+    Returns the :const:`pyfarm.core.enums.DBWorkState` value a job
+    with the given number of tasks in each state should be in, or
+    ``None`` if the job has not started yet.
+
+        * ``RUNNING`` if any task is running
+        * ``DONE`` if every task is done
+        * ``FAILED`` if every task is either done or failed
+        * ``PAUSED`` if every task which is not finished is paused
+        * ``None`` otherwise, the job still has queued work
+    """
+    if running:
+        return DBWorkState.RUNNING
+
+    total = queued + paused + done + failed
+    if not total:
+        return None
+    elif done == total:
+        return DBWorkState.DONE
+    elif failed and not queued and not paused:
+        return DBWorkState.FAILED
+    elif paused and not queued:
+        return DBWorkState.PAUSED
+    return None
+
+
+class JobRollup(namedtuple(
+        "JobRollup", ("queued", "paused", "running", "done", "failed"))):
+    """
+    The number of tasks in each state for a single job along with
+    the job's state and progress derived from those counts.
+    """
+    __slots__ = ()
+
+    @property
+    def total(self):
+        return sum(self)
+
+    @property
+    def state(self):
+        """The job's state, see :func:`job_state`"""
+        return job_state(*self)
+
+    @property
+    def progress(self):
+        """The fraction of tasks which are done, from 0.0 to 1.0"""
+        total = self.total
+        return self.done / total if total else 0.0
+
+
+def _ordinals(states):
+    """Maps an array of state codes to indexes in :class:`JobRollup`"""
+    return _ORDINAL_TABLE.take(numpy.asarray(states), mode="clip")
+
+
+def rollup(states):
+    """
+    Counts the tasks in each state and returns a :class:`JobRollup`.
+
+    >>> from array import array
+    >>> from pyfarm.core.enums import DBWorkState
+    >>> result = rollup(array("i", [DBWorkState.DONE, DBWorkState.RUNNING]))
+    >>> result.state == DBWorkState.RUNNING
+    True
+    >>> result.progress
+    0.5
+
+    :param states:
+        The :const:`pyfarm.core.enums.DBWorkState` code of each task as an
+        :class:`array.array`, list or :class:`numpy.ndarray`
+    """
+    if numpy is not None and isinstance(states, numpy.ndarray):
+        counts = numpy.bincount(_ordinals(states), minlength=len(STATE_CODES))
+        return JobRollup._make(counts.tolist())
+
+    counts = [states.count(code) for code in STATE_CODES[1:]]
+    return JobRollup(len(states) - sum(counts), *counts)
+
+
+def rollup_jobs(job_ids, states):
+    """
+    Counts the tasks in each state for many jobs at once and returns
+    a dictionary of job id to :class:`JobRollup`.  Jobs without any tasks
+    will not be present in the result.
+
+    :param job_ids:
+        The id of the job each task belongs to
+
+    :param states:
+        The :const:`pyfarm.core.enums.DBWorkState` code of each task, in
+        the same order as ``job_ids``
+
+    :raises ValueError:
+        Raised if ``job_ids`` and ``states`` are not the same length
+    """
+    if len(job_ids) != len(states):
+        raise ValueError("`job_ids` and `states` must be the same length")
+
+    width = len(STATE_CODES)
+
+    if numpy is not None and (
+            isinstance(job_ids, numpy.ndarray) or
+            isinstance(states, numpy.ndarray)):
+        job_ids = numpy.asarray(job_ids)
+        if not len(job_ids):
+            return {}
+
+        # Integer job ids that fall in a range no larger than the number
+        # of tasks can index the counts directly, anything else has to
+        # be sorted by numpy.unique first.
+        low = high = None
+        if job_ids.dtype.kind in "iu":
+            low, high = int(job_ids.min()), int(job_ids.max())
+
+        if low is not None and high - low < len(job_ids):
+            size = high - low + 1
+            counts = numpy.bincount(
+                (job_ids.astype(numpy.intp) - low) * width + _ordinals(states),
+                minlength=size * width).reshape(size, width)
+            present = counts.any(axis=1).nonzero()[0]
+            jobs = present + low
+            counts = counts[present]
+        else:
+            jobs, job_index = numpy.unique(job_ids, return_inverse=True)
+            counts = numpy.bincount(
+                job_index.ravel() * width + _ordinals(states),
+                minlength=len(jobs) * width).reshape(len(jobs), width)
+
+        return dict(zip(jobs.tolist(), map(JobRollup._make, counts.tolist())))
+
+    if Counter is not None:
+        pairs = Counter(zip(job_ids, states))
+    else:  # pragma: no cover
+        pairs = {}
+        for pair in zip(job_ids, states):
+            pairs[pair] = pairs.get(pair, 0) + 1
+
+    results = {}
+    for (job_id, code), count in pairs.items():
+        try:
+            counts = results[job_id]
+        except KeyError:
+            counts = results[job_id] = [0] * width
+        counts[_ORDINALS.get(code, 0)] += count
+
+    return dict(
+        (job_id, JobRollup._make(counts)) for job_id, counts in results.items())
+
+
+# Maps each form a task state may be provided in to its index
+# in JobRollup.  None is how a queued task's state is stored.
+_STATE_ORDINALS = dict(_ORDINALS)
+_STATE_ORDINALS[None] = 0
+for _code in STATE_CODES[1:]:
+    _STATE_ORDINALS[DBWorkState._map[_code]] = _ORDINALS[_code]
+del _code
+
+
+class JobStateAggregator(object):
+    """
+    Keeps a live count of the tasks in each state for many jobs so the
+    state of a job can be queried at any time without looking at all
+    of its tasks.  Tasks are added with :meth:`add` and each change in a
+    task's state is provided to :meth:`apply` which only has to adjust
+    two counters.
+
+    Task states may be given as :const:`pyfarm.core.enums.DBWorkState`
+    codes, :const:`pyfarm.core.enums.WorkState` strings, or ``None`` /
+    :const:`QUEUED` for a task which is queued.
+
+    >>> from pyfarm.core.enums import DBWorkState, WorkState
+    >>> aggregator = JobStateAggregator()
+    >>> aggregator.add(1, count=2)
+    >>> aggregator.apply(1, None, WorkState.RUNNING) == DBWorkState.RUNNING
+    True
+    >>> aggregator.apply(1, WorkState.RUNNING, WorkState.DONE) is None
+    True
+    >>> aggregator.progress(1)
+    0.5
+    """
+    def __init__(self):
+        self._counts = {}
+
+    def __contains__(self, job_id):
+        return job_id in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __iter__(self):
+        return iter(self._counts)
+
+    def _ordinal(self, state):
+        try:
+            return _STATE_ORDINALS[state]
+        except (KeyError, TypeError):
+            raise ValueError("%r is not a valid task state" % (state, ))
+
+    def _rollup(self, states):
+        """
+        :func:`rollup` for ``states`` in any of the forms :meth:`add`
+        accepts.  Arrays of codes are passed straight to :func:`rollup`.
+        """
+        if isinstance(states, array) or (
+                numpy is not None and isinstance(states, numpy.ndarray) and
+                states.dtype.kind in "iu"):
+            return rollup(states)
+
+        if Counter is not None:
+            states = Counter(states)
+        else:  # pragma: no cover
+            totals = {}
+            for state in states:
+                totals[state] = totals.get(state, 0) + 1
+            states = totals
+
+        counts = [0] * len(STATE_CODES)
+        for state, count in states.items():
+            counts[self._ordinal(state)] += count
+        return JobRollup._make(counts)
+
+    def add(self, job_id, state=None, count=1):
+        """Adds ``count`` tasks in ``state`` to ``job_id``"""
+        try:
+            counts = self._counts[job_id]
+        except KeyError:
+            counts = self._counts[job_id] = [0] * len(STATE_CODES)
+        counts[self._ordinal(state)] += count
+
+    def remove(self, job_id, state=None, count=1):
+        """
+        Removes ``count`` tasks in ``state`` from ``job_id``
+
+        :raises ValueError:
+            Raised if ``job_id`` does not have ``count`` tasks in ``state``
+        """
+        counts = self._counts[job_id]
+        ordinal = self._ordinal(state)
+        if counts[ordinal] < count:
+            raise ValueError(
+                "job %r does not have %s task(s) in state %r" % (
+                    job_id, count, state))
+        counts[ordinal] -= count
+
+    def discard(self, job_id):
+        """Stops tracking ``job_id``"""
+        self._counts.pop(job_id, None)
+
+    def load(self, job_id, states):
+        """
+        Replaces the counts for ``job_id`` with counts built from
+        ``states``, see :func:`rollup`.
+
+        :raises ValueError:
+            Raised if ``states`` is not an array of codes and one of
+            the states is invalid
+        """
+        self._counts[job_id] = list(self._rollup(states))
+
+    def apply(self, job_id, old_state, new_state):
+        """
+        Moves a single task in ``job_id`` from ``old_state`` to
+        ``new_state`` and returns the job's state afterwards.
+
+        :raises KeyError:
+            Raised if ``job_id`` is not being tracked
+
+        :raises ValueError:
+            Raised if either state is invalid or ``job_id`` does not
+            have any tasks in ``old_state``.  The counts are not changed
+            if this is raised.
+        """
+        counts = self._counts[job_id]
+        old = self._ordinal(old_state)
+        new = self._ordinal(new_state)
+
+        if not counts[old]:
+            raise ValueError(
+                "job %r does not have any tasks in state %r" % (
+                    job_id, old_state))
+
+        counts[old] -= 1
+        counts[new] += 1
+        return job_state(*counts)
+
+    def apply_many(self, events):
+        """
+        Applies an iterable of ``(job_id, old_state, new_state)`` events
+        in order.  Events which can't be applied are skipped instead of
+        stopping the batch and their indexes in ``events`` are returned.
+        """
+        failed = []
+        all_counts = self._counts
+        ordinals = _STATE_ORDINALS
+
+        for index, (job_id, old_state, new_state) in enumerate(events):
+            try:
+                counts = all_counts[job_id]
+                old = ordinals[old_state]
+                new = ordinals[new_state]
+            except (KeyError, TypeError):
+                failed.append(index)
+                continue
+
+            if not counts[old]:
+                failed.append(index)
+                continue
+
+            counts[old] -= 1
+            counts[new] += 1
+
+        return failed
+
+    def counts(self, job_id):
+        """Returns the :class:`JobRollup` for ``job_id``"""
+        return JobRollup._make(self._counts[job_id])
+
+    def state(self, job_id):
+        """Returns the state of ``job_id``, see :func:`job_state`"""
+        return job_state(*self._counts[job_id])
+
+    def progress(self, job_id):
+        """Returns the fraction of tasks in ``job_id`` which are done"""
+        return self.counts(job_id).progress
+
+    def verify(self, job_id, states):
+        """
+        Returns True if the counts for ``job_id`` match the counts
+        built from the full list of task ``states``.  This is meant for
+        periodic consistency checks, the result of :func:`rollup` is not
+        stored.
+        """
+        return self.counts(job_id) == self._rollup(states)
@@ -0,0 +1,388 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Statistics
+==========
+
+Streaming statistics for task durations which are updated in constant
+time as each task finishes instead of being rebuilt from every finished
+task.  Each structure can be merged with another of the same kind so
+statistics gathered separately, per agent for example, can be combined
+on the master.
+"""
+
+from __future__ import division
+
+import time
+from math import ceil, exp, log, sqrt
+
+from pyfarm.core.enums import DBOperatingSystem
+
+
+class RunningStats(object):
+    """
+    Count, mean, variance, minimum and maximum of a stream of values
+    using Welford's algorithm.
+
+    >>> stats = RunningStats()
+    >>> for value in (2, 4, 4, 4, 5, 5, 7, 9):
+    ...     stats.add(value)
+    >>> stats.mean, stats.stddev
+    (5.0, 2.0)
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.minimum = None
+        self.maximum = None
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """Adds the values ``other`` has seen to this instance"""
+        if not other.count:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += (
+            other._m2 + delta * delta * self.count * other.count / count)
+        self.mean += delta * other.count / count
+        self.count = count
+
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+
+    @property
+    def variance(self):
+        """The population variance"""
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def stddev(self):
+        """The population standard deviation"""
+        return sqrt(self.variance)
+
+
+class QuantileSketch(object):
+    """
+    Estimates quantiles of a stream of positive values by counting them
+    in logarithmically sized buckets.  Any quantile is returned within
+    ``accuracy`` of the true value, relative to the value, and the
+    number of buckets only grows with the range of the values, not the
+    number of values.
+
+    >>> sketch = QuantileSketch()
+    >>> for value in range(1, 101):
+    ...     sketch.add(value)
+    >>> abs(sketch.quantile(0.95) - 95) <= 95 * sketch.accuracy
+    True
+
+    :param float accuracy:
+        The relative accuracy of the quantiles
+    """
+    def __init__(self, accuracy=0.01):
+        if not 0 < accuracy < 1:
+            raise ValueError("`accuracy` must be between 0 and 1")
+        self.accuracy = accuracy
+        self.count = 0
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = log(self._gamma)
+        self._buckets = {}
+        self._zero = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value, count=1):
+        """Adds ``value`` ``count`` times, values <= 0 are counted as 0"""
+        self.count += count
+        if value <= 0:
+            self._zero += count
+            return
+
+        index = int(ceil(log(value) / self._log_gamma))
+        self._buckets[index] = self._buckets.get(index, 0) + count
+
+    def merge(self, other):
+        """
+        Adds the values ``other`` has seen to this instance
+
+        :raises ValueError:
+            Raised if the sketches have a different ``accuracy``
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError("cannot merge sketches with different accuracy")
+        self.count += other.count
+        self._zero += other._zero
+        buckets = self._buckets
+        for index, count in other._buckets.items():
+            buckets[index] = buckets.get(index, 0) + count
+
+    def quantile(self, q):
+        """
+        Returns the estimated value at quantile ``q``, between 0 and 1,
+        or ``None`` if no values have been added
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("`q` must be between 0 and 1")
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self._zero
+        if rank < seen:
+            return 0.0
+
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                break
+
+        # midpoint of the bucket, relative to its bounds
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+
+class DecayingRate(object):
+    """
+    Exponentially weighted rate of events per second.  Older events
+    count for less the longer ago they happened, an event ``halflife``
+    seconds ago counts half as much as one now.
+
+    :param float halflife:
+        The number of seconds it takes for an event's weight to halve
+
+    :param clock:
+        Callable which returns the current time in seconds.  Defaults
+        to :func:`time.time`.
+    """
+    def __init__(self, halflife=300, clock=time.time):
+        if halflife <= 0:
+            raise ValueError("`halflife` must be greater than zero")
+        self.halflife = halflife
+        self.clock = clock
+        self._tau = halflife / log(2)
+        self._value = 0.0
+        self._time = None
+        self._start = None
+
+    def _decayed(self, now):
+        if self._time is None:
+            return 0.0
+        return self._value * exp(-max(now - self._time, 0) / self._tau)
+
+    def add(self, count=1, now=None):
+        """Records ``count`` events at ``now``"""
+        if now is None:
+            now = self.clock()
+        if self._start is None:
+            self._start = now
+        self._value = self._decayed(now) + count
+        self._time = max(now, self._time) if self._time is not None else now
+
+    def merge(self, other):
+        """Adds the events ``other`` has seen to this instance"""
+        if other._time is None:
+            return
+        now = max(other._time, self._time if self._time is not None else
+                  other._time)
+        self._value = self._decayed(now) + other._decayed(now)
+        self._time = now
+        self._start = min(
+            other._start,
+            self._start if self._start is not None else other._start)
+
+    def rate(self, now=None):
+        """Returns the rate of events per second at ``now``"""
+        if self._time is None:
+            return 0.0
+        if now is None:
+            now = self.clock()
+
+        # Until the rate has been observed for a while the decayed sum
+        # only covers the time since the first event.
+        elapsed = max(now - self._start, 0)
+        window = self._tau * (1 - exp(-elapsed / self._tau))
+        return self._decayed(now) / window if window else 0.0
+
+
+class DurationStats(object):
+    """
+    The :class:`RunningStats`, :class:`QuantileSketch` and
+    :class:`DecayingRate` for one stream of task durations.
+    """
+    def __init__(self, accuracy=0.01, halflife=300, clock=time.time):
+        self.stats = RunningStats()
+        self.sketch = QuantileSketch(accuracy)
+        self.rate = DecayingRate(halflife, clock=clock)
+
+    def add(self, duration, now=None):
+        self.stats.add(duration)
+        self.sketch.add(duration)
+        self.rate.add(now=now)
+
+    def merge(self, other):
+        """
+        Adds the durations ``other`` has seen to this instance
+
+        :raises ValueError:
+            Raised, before anything is merged, if the sketches have a
+            different ``accuracy``
+        """
+        if other.sketch.accuracy != self.sketch.accuracy:
+            raise ValueError("cannot merge sketches with different accuracy")
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        self.rate.merge(other.rate)
+
+
+class JobStatistics(object):
+    """
+    Task duration statistics for many jobs, optionally split by the
+    :const:`pyfarm.core.enums.OperatingSystem` of the agent which ran
+    each task.  Recording a task is constant time and every query reads
+    the current state of the statistics directly.
+
+    >>> now = [0]
+    >>> stats = JobStatistics(clock=lambda: now[0])
+    >>> for now[0] in range(10, 110, 10):
+    ...     stats.add(1, 20.0, os="linux")
+    >>> int(round(stats.quantile(1, 0.5, os="linux")))
+    20
+    >>> int(round(stats.eta(1, remaining=10)))
+    90
+
+    :param float accuracy:
+        The relative accuracy of quantiles, see :class:`QuantileSketch`
+
+    :param float halflife:
+        The half life of the throughput, see :class:`DecayingRate`
+
+    :param clock:
+        Callable which returns the current time in seconds.  Defaults
+        to :func:`time.time`.
+    """
+    def __init__(self, accuracy=0.01, halflife=300, clock=time.time):
+        self.accuracy = accuracy
+        self.halflife = halflife
+        self.clock = clock
+        self._stats = {}
+
+    def __contains__(self, job_id):
+        return (job_id, None) in self._stats
+
+    def __iter__(self):
+        return (job_id for job_id, os in self._stats if os is None)
+
+    def _key(self, job_id, os):
+        return job_id, None if os is None else DBOperatingSystem._cast(os)
+
+    def _get(self, key):
+        try:
+            return self._stats[key]
+        except KeyError:
+            stats = self._stats[key] = DurationStats(
+                self.accuracy, self.halflife, clock=self.clock)
+            return stats
+
+    def add(self, job_id, duration, os=None, now=None):
+        """
+        Records a task from ``job_id`` which finished at ``now`` after
+        ``duration`` seconds.  The task is added to the statistics for
+        the whole job and, if ``os`` is provided, the statistics for
+        that operating system.
+        """
+        if now is None:
+            now = self.clock()
+        self._get((job_id, None)).add(duration, now=now)
+        if os is not None:
+            self._get(self._key(job_id, os)).add(duration, now=now)
+
+    def get(self, job_id, os=None):
+        """
+        Returns the :class:`DurationStats` for ``job_id`` and ``os`` or
+        ``None`` if no tasks have been recorded
+        """
+        return self._stats.get(self._key(job_id, os))
+
+    def discard(self, job_id):
+        """Removes all statistics for ``job_id``"""
+        for key in [key for key in self._stats if key[0] == job_id]:
+            del self._stats[key]
+
+    def merge(self, other):
+        """
+        Adds the statistics from another :class:`JobStatistics`
+
+        :raises ValueError:
+            Raised, before anything is merged, if the instances have a
+            different ``accuracy``
+        """
+        if other.accuracy != self.accuracy or any(
+                stats.sketch.accuracy != self.accuracy
+                for stats in other._stats.values()):
+            raise ValueError("cannot merge statistics with different accuracy")
+
+        for key, stats in other._stats.items():
+            if key in self._stats:
+                self._stats[key].merge(stats)
+            else:
+                copy = self._stats[key] = DurationStats(
+                    self.accuracy, self.halflife, clock=self.clock)
+                copy.merge(stats)
+
+    def mean(self, job_id, os=None):
+        """Returns the mean duration or ``None`` if there are no tasks"""
+        stats = self.get(job_id, os)
+        return stats.stats.mean if stats is not None else None
+
+    def quantile(self, job_id, q, os=None):
+        """
+        Returns the duration at quantile ``q``, for example 0.95 for the
+        95th percentile, or ``None`` if there are no tasks
+        """
+        stats = self.get(job_id, os)
+        return stats.sketch.quantile(q) if stats is not None else None
+
+    def throughput(self, job_id, os=None, now=None):
+        """Returns the number of tasks finishing per second"""
+        stats = self.get(job_id, os)
+        return stats.rate.rate(now) if stats is not None else 0.0
+
+    def eta(self, job_id, remaining, now=None):
+        """
+        Returns the estimated number of seconds until ``remaining`` more
+        tasks in ``job_id`` finish at the current throughput or ``None``
+        if there's no throughput to estimate from.
+        """
+        if not remaining:
+            return 0.0
+        throughput = self.throughput(job_id, now=now)
+        return remaining / throughput if throughput else None
@@ -0,0 +1,365 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Task Table
+==========
+
+Stores the tasks of large jobs as columns of typed :class:`array.array`
+values instead of one Python object per task.  A task takes 37 bytes
+across all of the columns, see :meth:`TaskTable.bytes_per_task`, and
+when :mod:`numpy` is installed :meth:`TaskTable.where` and
+:meth:`TaskTable.update` operate on whole columns at once through views
+of the arrays which do not copy them.
+
+Rows are only ever appended.  Deleted rows are marked and skipped until
+:meth:`TaskTable.compact` removes them.
+
+:const NO_AGENT:
+    The agent id stored for a task which is not assigned to an agent
+"""
+
+from __future__ import division
+
+import sys
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from pyfarm.core.enums import (
+    STRING_TYPES, INTEGER_TYPES, Values, DBWorkState)
+from pyfarm.core.rollup import QUEUED, rollup
+
+NO_AGENT = -1
+NAN = float("nan")
+
+# State code of a deleted row, this is not a valid DBWorkState
+_DELETED = 255
+
+try:
+    array("q")
+    _INT64 = "q"
+except ValueError:  # pragma: no cover
+    _INT64 = "l"
+
+
+class TaskRow(namedtuple(
+        "TaskRow", ("frame", "state", "agent", "attempts", "start", "end"))):
+    """
+    A single row of a :class:`TaskTable`.  ``state`` is a
+    :const:`pyfarm.core.enums.DBWorkState` code or
+    :const:`pyfarm.core.rollup.QUEUED`, ``agent`` is :const:`NO_AGENT` if
+    the task is not assigned and the times are ``nan`` until they're set.
+    """
+    __slots__ = ()
+
+
+def _from_numpy(typecode, values):
+    """Builds an :class:`array.array` from a :class:`numpy.ndarray`"""
+    column = array(typecode)
+    try:
+        column.frombytes(values.tobytes())
+    except AttributeError:  # pragma: no cover
+        column.fromstring(values.tostring())
+    return column
+
+
+def _is_sequence(value):
+    return isinstance(value, (list, tuple, array)) or (
+        numpy is not None and isinstance(value, numpy.ndarray))
+
+
+class TaskTable(object):
+    """
+    A columnar table of tasks.  Each column is available as an attribute
+    of the same name holding an :class:`array.array`, these should be
+    treated as read only.
+
+    >>> from pyfarm.core.enums import WorkState
+    >>> table = TaskTable()
+    >>> table.extend(range(1, 11))
+    >>> table.update([2, 3], state=WorkState.FAILED, agent=7)
+    >>> [table.frame[row] for row in table.where(state="failed", agent=7)]
+    [3.0, 4.0]
+
+    :cvar COLUMNS:
+        The name and :mod:`array` type code of each column
+    """
+    COLUMNS = (
+        ("frame", "d"), ("state", "B"), ("agent", _INT64),
+        ("attempts", "I"), ("start", "d"), ("end", "d"))
+    DEFAULTS = {
+        "state": QUEUED, "agent": NO_AGENT, "attempts": 0,
+        "start": NAN, "end": NAN}
+
+    def __init__(self):
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+        self._deleted = 0
+
+    def __len__(self):
+        """Returns the number of rows which have not been deleted"""
+        return len(self.frame) - self._deleted
+
+    def _state(self, state):
+        if state is None or (
+                isinstance(state, INTEGER_TYPES) and state == QUEUED):
+            return QUEUED
+        return DBWorkState._cast(state)
+
+    def _column_values(self, name, value, count):
+        """
+        Returns ``value`` for column ``name`` as either a single value or
+        a sequence of ``count`` values
+        """
+        if name not in self.DEFAULTS:
+            raise TypeError("%r is not a column which can be set" % name)
+
+        if value is None:
+            value = self.DEFAULTS[name]
+
+        if _is_sequence(value):
+            if len(value) != count:
+                raise ValueError(
+                    "expected %d values for %r, got %d" % (
+                        count, name, len(value)))
+            if name == "state":
+                value = [self._state(state) for state in value]
+        elif name == "state":
+            value = self._state(value)
+        return value
+
+    def _rows(self, rows):
+        if isinstance(rows, INTEGER_TYPES):
+            rows = [rows]
+        state = self.state
+        for row in rows:
+            if state[row] == _DELETED:
+                raise IndexError("row %d was deleted" % row)
+        return rows
+
+    def _view(self, name):
+        column = getattr(self, name)
+        return numpy.frombuffer(column, dtype=column.typecode)
+
+    def _isin(self, view, values):
+        if len(values) == 1:
+            return view == values[0]
+        return numpy.isin(view, values)
+
+    def append(self, frame, state=None, agent=None, attempts=0,
+               start=None, end=None):
+        """Adds a single task and returns its row"""
+        row = TaskRow(frame, self._state(state),
+                      NO_AGENT if agent is None else agent, attempts,
+                      NAN if start is None else start,
+                      NAN if end is None else end)
+        for (name, _), value in zip(self.COLUMNS, row):
+            getattr(self, name).append(value)
+        return len(self.frame) - 1
+
+    def extend(self, frames, **columns):
+        """
+        Adds many tasks at once.  Each of ``columns`` may be a single value
+        used for every task or a sequence with one value per frame.
+
+        :raises ValueError:
+            Raised if a sequence does not have one value per frame or a
+            state is invalid.  Nothing is added if this is raised.
+        """
+        if not _is_sequence(frames):
+            frames = list(frames)
+        count = len(frames)
+
+        # Convert everything before changing any column so a bad value
+        # can't leave the columns with different lengths.
+        arrays = []
+        for name, typecode in self.COLUMNS:
+            if name == "frame":
+                values = frames
+            else:
+                values = self._column_values(
+                    name, columns.pop(name, None), count)
+
+            if numpy is not None:
+                values = numpy.asarray(values, dtype=typecode)
+                if not values.ndim:
+                    values = numpy.repeat(values, count)
+                column = _from_numpy(typecode, values)
+            elif _is_sequence(values):
+                column = array(typecode, values)
+            else:
+                column = array(typecode, [values]) * count
+            arrays.append(column)
+
+        if columns:
+            raise TypeError(
+                "%r is not a column which can be set" % sorted(columns)[0])
+
+        for (name, _), column in zip(self.COLUMNS, arrays):
+            getattr(self, name).extend(column)
+
+    def get(self, row):
+        """
+        Returns the :class:`TaskRow` for ``row``
+
+        :raises IndexError:
+            Raised if ``row`` does not exist or was deleted
+        """
+        self._rows(row)
+        return TaskRow._make(
+            getattr(self, name)[row] for name, _ in self.COLUMNS)
+
+    def update(self, rows, **columns):
+        """
+        Sets ``columns`` for each of ``rows``.  The value of each column
+        may be a single value or a sequence with one value per row.  The
+        frame of a task can't be changed.
+
+        >>> table = TaskTable()
+        >>> table.extend([1, 2, 3])
+        >>> table.update([0, 2], attempts=[1, 2], agent=5)
+        >>> table.get(2).attempts
+        2
+        """
+        rows = self._rows(rows)
+        updates = [
+            (name, self._column_values(name, value, len(rows)))
+            for name, value in columns.items()]
+
+        for name, values in updates:
+            if numpy is not None:
+                self._view(name)[rows] = values
+            else:
+                column = getattr(self, name)
+                if not _is_sequence(values):
+                    values = [values] * len(rows)
+                for row, value in zip(rows, values):
+                    column[row] = value
+
+    def delete(self, rows):
+        """Marks ``rows`` as deleted until :meth:`compact` is called"""
+        state = self.state
+        for row in self._rows(rows):
+            state[row] = _DELETED
+            self._deleted += 1
+
+    def where(self, state=None, agent=None, frames=None):
+        """
+        Returns the rows which match every filter that's provided.  If
+        :mod:`numpy` is installed the rows are returned as an array,
+        otherwise as a list.
+
+        :param state:
+            A state or an iterable of states, including
+            :class:`pyfarm.core.enums.StateSet`.  Use
+            :const:`pyfarm.core.rollup.QUEUED` to find queued tasks.
+
+        :param agent:
+            An agent id or an iterable of agent ids.  Use
+            :const:`NO_AGENT` to find tasks which are not assigned.
+
+        :param tuple frames:
+            ``(first, last)`` range of frames to include
+        """
+        states = agents = None
+        if state is not None:
+            if isinstance(state, (Values, STRING_TYPES, INTEGER_TYPES)):
+                state = [state]
+            states = [self._state(value) for value in state]
+        if agent is not None:
+            agents = [agent] if isinstance(agent, INTEGER_TYPES) else agent
+
+        if numpy is not None:
+            state_view = self._view("state")
+            mask = state_view != _DELETED
+            if states is not None:
+                mask &= self._isin(state_view, states)
+            if agents is not None:
+                mask &= self._isin(self._view("agent"), list(agents))
+            if frames is not None:
+                frame_view = self._view("frame")
+                mask &= (frame_view >= frames[0]) & (frame_view <= frames[1])
+            return mask.nonzero()[0]
+
+        states = None if states is None else set(states)
+        agents = None if agents is None else set(agents)
+        results = []
+        for row, (frame, code, agent_id) in enumerate(
+                zip(self.frame, self.state, self.agent)):
+            if code == _DELETED:
+                continue
+            if states is not None and code not in states:
+                continue
+            if agents is not None and agent_id not in agents:
+                continue
+            if frames is not None and not frames[0] <= frame <= frames[1]:
+                continue
+            results.append(row)
+        return results
+
+    def count(self, state=None, agent=None, frames=None):
+        """Returns the number of rows :meth:`where` would return"""
+        return len(self.where(state=state, agent=agent, frames=frames))
+
+    def rollup(self):
+        """
+        Returns the :class:`pyfarm.core.rollup.JobRollup` for every task
+        in the table
+        """
+        if numpy is not None:
+            state_view = self._view("state")
+            if self._deleted:
+                state_view = state_view[state_view != _DELETED]
+            return rollup(state_view)
+        elif not self._deleted:
+            return rollup(self.state)
+        return rollup(
+            array("B", [code for code in self.state if code != _DELETED]))
+
+    def compact(self):
+        """
+        Removes deleted rows and returns the row each remaining row was
+        at before compacting, which is also the order rows are in now.
+        """
+        keep = self.where()
+        if not self._deleted:
+            return keep
+
+        for name, typecode in self.COLUMNS:
+            column = getattr(self, name)
+            if numpy is not None:
+                compacted = _from_numpy(typecode, self._view(name)[keep])
+            else:
+                compacted = array(typecode, [column[row] for row in keep])
+            setattr(self, name, compacted)
+
+        self._deleted = 0
+        return keep
+
+    def nbytes(self):
+        """Returns the memory used by the columns, including spare capacity"""
+        return sum(
+            sys.getsizeof(getattr(self, name)) for name, _ in self.COLUMNS)
+
+    def bytes_per_task(self):
+        """Returns :meth:`nbytes` divided by the number of rows stored"""
+        return self.nbytes() / max(len(self.frame), 1)
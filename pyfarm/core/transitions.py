@@ -0,0 +1,268 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+State Transitions
+=================
+
+Describes which state changes are legal for
+:const:`pyfarm.core.enums.WorkState` and
+:const:`pyfarm.core.enums.AgentState`.  Each table is compiled into a
+dense matrix indexed by the position of the state in the table so a
+single check is one dictionary lookup per state plus an index into the
+matrix.  :meth:`TransitionTable.illegal` validates whole arrays of
+state changes in one call.
+
+A state may always transition to itself, these are treated as updates
+which do not change anything.
+
+Work State
+----------
+
+A task which is queued does not have a state, ``None`` or
+:const:`pyfarm.core.rollup.QUEUED` may be used to represent it.
+
+.. csv-table::
+    :header: From, To
+    :widths: 10, 50
+
+    queued, "paused, running, failed"
+    paused, queued
+    running, "queued, paused, done, failed"
+    done, queued
+    failed, queued
+
+Agent State
+-----------
+
+.. csv-table::
+    :header: From, To
+    :widths: 10, 50
+
+    offline, "online, disabled"
+    online, "offline, disabled, running"
+    running, "offline, disabled, online"
+    disabled, "offline, online"
+
+:const WORK_STATE_TRANSITIONS:
+    :class:`TransitionTable` for the work states above
+
+:const AGENT_STATE_TRANSITIONS:
+    :class:`TransitionTable` for the agent states above
+"""
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from pyfarm.core.enums import _WorkState, _AgentState, range_
+from pyfarm.core.rollup import QUEUED
+
+
+class TransitionTable(object):
+    """
+    A compiled table of legal transitions between the members of
+    an enum.
+
+    >>> from pyfarm.core.enums import _AgentState
+    >>> table = TransitionTable(
+    ...     _AgentState, {"offline": ["online"], 202: [_AgentState.OFFLINE]})
+    >>> table.allowed("offline", 202)
+    True
+    >>> table.illegal([201, 202, 201], [202, 201, 203])
+    [2]
+
+    :param enum:
+        The enum, built from :class:`pyfarm.core.enums.Values`, whose
+        members are the states in the table.
+
+    :param dict transitions:
+        Maps each state to the states it may transition to.  States may be
+        given as :class:`pyfarm.core.enums.Values` instances, integers or
+        strings.
+
+    :param tuple extra_states:
+        Additional states which are not part of ``enum``, such as a queued
+        task which does not have a state, given as ``(key, ...)`` tuples
+        where every key in the tuple refers to the same state.  The first
+        integer key, if any, is used by :meth:`illegal` when the states
+        are provided as a :class:`numpy.ndarray`.
+    """
+    def __init__(self, enum, transitions, extra_states=()):
+        self.enum = enum
+        self._ordinals = {}
+        self.states = []
+
+        for value in sorted(enum, key=int):
+            self._add_state((value.int, value.str), value)
+
+        for keys in extra_states:
+            self._add_state(keys, keys[0])
+
+        # The last row and column are used for any state which is not in
+        # the table, all transitions to or from it are illegal.
+        self.width = len(self.states) + 1
+        self._invalid = len(self.states)
+        self._matrix = bytearray(self.width * self.width)
+
+        for old_state, new_states in transitions.items():
+            old = self._ordinal(old_state)
+            for new_state in new_states:
+                self._matrix[old * self.width + self._ordinal(new_state)] = 1
+
+        for ordinal in range_(len(self.states)):
+            self._matrix[ordinal * self.width + ordinal] = 1
+
+        self._numpy_tables = None
+
+    def _add_state(self, keys, state):
+        ordinal = len(self.states)
+        for key in keys:
+            if key in self._ordinals:
+                raise ValueError("%r is already in the table" % (key, ))
+            self._ordinals[key] = ordinal
+        self.states.append(state)
+
+    def _ordinal(self, state):
+        try:
+            return self._ordinals[state]
+        except (KeyError, TypeError):
+            raise ValueError("%r is not a valid state" % (state, ))
+
+    def allowed(self, old_state, new_state):
+        """Returns True if ``old_state`` may transition to ``new_state``"""
+        ordinals = self._ordinals
+        invalid = self._invalid
+        try:
+            return self._matrix[
+                ordinals.get(old_state, invalid) * self.width +
+                ordinals.get(new_state, invalid)] == 1
+        except TypeError:  # unhashable state
+            return False
+
+    def validate(self, old_state, new_state):
+        """
+        Same as :meth:`allowed` but raises an exception instead of
+        returning False.
+
+        :raises ValueError:
+            Raised if ``old_state`` may not transition to ``new_state``
+        """
+        if not self.allowed(old_state, new_state):
+            raise ValueError(
+                "%r cannot transition to %r" % (old_state, new_state))
+
+    def targets(self, state):
+        """Returns a list of states which ``state`` may transition to"""
+        row = self._ordinal(state) * self.width
+        return [
+            new_state for ordinal, new_state in enumerate(self.states)
+            if self._matrix[row + ordinal]]
+
+    def _numpy(self):
+        """
+        Builds, or returns the previously built, lookup tables from
+        integer state to ordinal and the transition matrix as numpy
+        arrays.
+        """
+        if self._numpy_tables is None:
+            codes = dict(
+                (key, ordinal) for key, ordinal in self._ordinals.items()
+                if isinstance(key, int) and key >= 0)
+
+            # Code N is stored at N + 1 so the first and last entries are
+            # always invalid.  Looking up with mode="clip" then maps
+            # anything outside of the table, including negative values,
+            # to the invalid ordinal.
+            lookup = numpy.empty(max(codes) + 3, dtype=numpy.intp)
+            lookup.fill(self._invalid)
+            for code, ordinal in codes.items():
+                lookup[code + 1] = ordinal
+
+            matrix = numpy.frombuffer(
+                bytes(self._matrix), dtype=numpy.uint8).astype(bool)
+            self._numpy_tables = lookup, matrix.reshape(self.width, self.width)
+
+        return self._numpy_tables
+
+    def illegal(self, old_states, new_states):
+        """
+        Checks many transitions at once and returns the indexes of any
+        transition which is not allowed.  If either input is a
+        :class:`numpy.ndarray` of integer states the check is done in a
+        single vectorized pass and the indexes are returned as an array,
+        otherwise a list is returned.
+
+        :param old_states:
+            The state each item is transitioning from
+
+        :param new_states:
+            The state each item is transitioning to, in the same
+            order as ``old_states``
+
+        :raises ValueError:
+            Raised if the inputs are not the same length
+        """
+        if len(old_states) != len(new_states):
+            raise ValueError(
+                "`old_states` and `new_states` must be the same length")
+
+        if numpy is not None and (
+                isinstance(old_states, numpy.ndarray) or
+                isinstance(new_states, numpy.ndarray)):
+            lookup, matrix = self._numpy()
+            old = lookup.take(numpy.asarray(old_states) + 1, mode="clip")
+            new = lookup.take(numpy.asarray(new_states) + 1, mode="clip")
+            return numpy.flatnonzero(~matrix[old, new])
+
+        ordinals = self._ordinals
+        invalid = self._invalid
+        width = self.width
+        matrix = self._matrix
+        try:
+            return [
+                index for index, (old, new)
+                in enumerate(zip(old_states, new_states))
+                if not matrix[
+                    ordinals.get(old, invalid) * width +
+                    ordinals.get(new, invalid)]]
+        except TypeError:  # unhashable state
+            allowed = self.allowed
+            return [
+                index for index, (old, new)
+                in enumerate(zip(old_states, new_states))
+                if not allowed(old, new)]
+
+
+WORK_STATE_TRANSITIONS = TransitionTable(
+    _WorkState, {
+        QUEUED: [_WorkState.PAUSED, _WorkState.RUNNING, _WorkState.FAILED],
+        _WorkState.PAUSED: [QUEUED],
+        _WorkState.RUNNING: [
+            QUEUED, _WorkState.PAUSED, _WorkState.DONE, _WorkState.FAILED],
+        _WorkState.DONE: [QUEUED],
+        _WorkState.FAILED: [QUEUED]},
+    extra_states=[(QUEUED, None)])
+
+AGENT_STATE_TRANSITIONS = TransitionTable(
+    _AgentState, {
+        _AgentState.OFFLINE: [_AgentState.ONLINE, _AgentState.DISABLED],
+        _AgentState.ONLINE: [
+            _AgentState.OFFLINE, _AgentState.DISABLED, _AgentState.RUNNING],
+        _AgentState.RUNNING: [
+            _AgentState.OFFLINE, _AgentState.DISABLED, _AgentState.ONLINE],
+        _AgentState.DISABLED: [_AgentState.OFFLINE, _AgentState.ONLINE]})
@@ -0,0 +1,366 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Transition Log
+==============
+
+An append-only binary log of task state transitions.  Each transition
+is stored as a fixed width record so the file can be memory mapped and
+the n-th record found without reading the ones before it.  A sparse
+index of every :attr:`TransitionLog.index_interval`-th timestamp is
+kept in memory so finding the records in a time range is a binary
+search rather than a scan.
+
+Records are little endian and packed, 26 bytes each:
+
+.. csv-table::
+    :header: Field, Type, Description
+    :widths: 10, 10, 50
+
+    time, double, seconds since the epoch
+    task, int64, task id
+    old, uint8, :const:`pyfarm.core.enums.DBWorkState` code before
+    new, uint8, :const:`pyfarm.core.enums.DBWorkState` code after
+    agent, int64, "agent id, -1 if there's no agent"
+
+Queued tasks, which do not have a state, are stored as
+:const:`pyfarm.core.rollup.QUEUED`.  The records follow a 16 byte
+header which identifies the file and the record layout.
+"""
+
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from collections import namedtuple
+from contextlib import closing
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from pyfarm.core.enums import DBWorkState, _WorkState
+from pyfarm.core.rollup import QUEUED
+
+NO_AGENT = -1
+RECORD = struct.Struct("<dqBBq")
+HEADER = struct.Struct("<8sHH4x")
+MAGIC = b"PFTRNLOG"
+VERSION = 1
+
+if numpy is not None:
+    DTYPE = numpy.dtype([
+        ("time", "<f8"), ("task", "<i8"), ("old", "u1"), ("new", "u1"),
+        ("agent", "<i8")])
+else:  # pragma: no cover
+    DTYPE = None
+
+
+class Transition(namedtuple(
+        "Transition", ("time", "task", "old", "new", "agent"))):
+    """A single record from a :class:`TransitionLog`"""
+    __slots__ = ()
+
+
+# Maps the plain forms of each state to the code stored in the log
+_STATE_CODES = {None: QUEUED, QUEUED: QUEUED}
+for _value in _WorkState:
+    _STATE_CODES[_value.int] = _STATE_CODES[_value.str] = _value.int
+del _value
+
+if numpy is not None:
+    _VALID_CODES = numpy.array(sorted(set(_STATE_CODES.values())))
+
+
+def _state(state):
+    try:
+        return _STATE_CODES[state]
+    except (KeyError, TypeError):
+        return DBWorkState._cast(state)
+
+
+class TransitionLog(object):
+    """
+    Reads and appends to a transition log file, the file is created if
+    it does not exist.  Records must be appended in time order.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "transitions.log")
+    >>> with TransitionLog(path) as log:
+    ...     log.append(10.0, 1, None, "running", agent=5)
+    ...     log.append(20.0, 1, "running", "done", agent=5)
+    >>> log = TransitionLog(path)
+    >>> [record.new for record in log.records(start=15)] == [DBWorkState.DONE]
+    True
+
+    :param string path:
+        The path to the log file
+
+    :param int index_interval:
+        The number of records between entries in the sparse time index
+
+    :param bool readonly:
+        If True the log is opened for reading only and is never modified,
+        which makes it safe to open while another process is appending.
+        A partial record at the end of the file, which the writer may be
+        in the middle of writing, is ignored rather than removed.
+
+    :raises ValueError:
+        Raised if ``path`` exists but is not a transition log
+    """
+    def __init__(self, path, index_interval=1024, readonly=False):
+        self.path = path
+        self.index_interval = index_interval
+        self.readonly = readonly
+        self._index = []
+        self._last_time = None
+
+        if not readonly and (
+                not os.path.exists(path) or not os.path.getsize(path)):
+            self._file = open(path, "w+b")
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            self._file.flush()
+            self._count = 0
+            return
+
+        self._file = open(path, "rb" if readonly else "r+b")
+        header = self._file.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("%s is not a transition log" % path)
+        magic, version, record_size = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError("%s is not a transition log" % path)
+
+        self._count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+        if not readonly:
+            self.repair()
+
+        # Records are only read through mmap so the file can stay
+        # positioned at the end for appending.
+        self._file.seek(0, os.SEEK_END)
+
+        if self._count:
+            with closing(self._map()) as data:
+                for record in range(0, self._count, index_interval):
+                    self._index.append(self._time(data, record))
+                self._last_time = self._time(data, self._count - 1)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _writable(self):
+        if self.readonly:
+            raise IOError("%s was opened read only" % self.path)
+
+    def repair(self):
+        """
+        Removes a partial record from the end of the file, left behind by
+        a writer which stopped while writing it, and returns True if one
+        was removed.  This is called when a log is opened for appending
+        and must not be called while another process is appending.
+        """
+        self._writable()
+        self._file.flush()
+        size = HEADER.size + self._count * RECORD.size
+        if os.path.getsize(self.path) == size:
+            return False
+        self._file.truncate(size)
+        self._file.seek(0, os.SEEK_END)
+        return True
+
+    def _map(self):
+        self._file.flush()
+        return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _time(self, data, record):
+        return struct.unpack_from(
+            "<d", data, HEADER.size + record * RECORD.size)[0]
+
+    def _check_time(self, time):
+        if self._last_time is not None and time < self._last_time:
+            raise ValueError(
+                "records must be appended in time order, %r is before %r" % (
+                    time, self._last_time))
+
+    def _indexed(self, times):
+        """Updates the index after ``times`` were appended"""
+        interval = self.index_interval
+        start = self._count
+        for record in range(-start % interval, len(times), interval):
+            self._index.append(times[record])
+        self._count += len(times)
+        self._last_time = times[-1]
+
+    def append(self, time, task, old, new, agent=None):
+        """
+        Appends a single transition of ``task`` from state ``old`` to
+        ``new``.  States may be given in any form
+        :const:`pyfarm.core.enums.WorkState` accepts or as ``None`` for
+        a queued task.
+
+        :raises ValueError:
+            Raised if ``time`` is before the last record or a state is
+            invalid
+
+        :raises IOError:
+            Raised if the log was opened read only
+        """
+        self._writable()
+        self._check_time(time)
+        self._file.write(RECORD.pack(
+            time, task, _state(old), _state(new),
+            NO_AGENT if agent is None else agent))
+        self._indexed([time])
+
+    def extend(self, records):
+        """
+        Appends many transitions in a single write.  ``records`` is either
+        an iterable of ``(time, task, old, new, agent)`` tuples or, if
+        :mod:`numpy` is installed, a structured array with :const:`DTYPE`
+        which is written without being converted.
+
+        :raises ValueError:
+            Raised if the records are not in time order or a state is
+            invalid.  Nothing is written if this is raised.
+
+        :raises IOError:
+            Raised if the log was opened read only
+        """
+        self._writable()
+        if numpy is not None and isinstance(records, numpy.ndarray):
+            if not len(records):
+                return
+            for column in ("old", "new"):
+                if not numpy.isin(records[column], _VALID_CODES).all():
+                    raise ValueError("records contain an invalid state")
+            records = records.astype(DTYPE, copy=False)
+            times = records["time"]
+            if (numpy.diff(times) < 0).any():
+                raise ValueError("records must be in time order")
+            self._check_time(times[0])
+            data = records.tobytes()
+            times = times.tolist()
+        else:
+            pack = RECORD.pack
+            times = []
+            chunks = []
+            last = None
+            for time, task, old, new, agent in records:
+                if last is not None and time < last:
+                    raise ValueError("records must be in time order")
+                last = time
+                times.append(time)
+                chunks.append(pack(
+                    time, task, _state(old), _state(new),
+                    NO_AGENT if agent is None else agent))
+            if not times:
+                return
+            self._check_time(times[0])
+            data = b"".join(chunks)
+
+        self._file.write(data)
+        self._indexed(times)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def seek(self, time):
+        """
+        Returns the number of the first record at or after ``time``, or
+        the number of records if there is none.
+        """
+        if not self._count or time <= self._index[0]:
+            return 0
+
+        # The index narrows the search to a single block which is then
+        # searched in the file.  The block is the last one starting
+        # before `time`, records at `time` may begin at the end of the
+        # block when the same time spans more than one block.
+        block = max(bisect_left(self._index, time) - 1, 0)
+        low = block * self.index_interval
+        high = min(low + self.index_interval, self._count)
+        with closing(self._map()) as data:
+            while low < high:
+                middle = (low + high) // 2
+                if self._time(data, middle) < time:
+                    low = middle + 1
+                else:
+                    high = middle
+        return low
+
+    def _range(self, start, end):
+        first = 0 if start is None else self.seek(start)
+        last = self._count if end is None else self.seek(end)
+        return first, max(first, last)
+
+    def records(self, start=None, end=None):
+        """
+        Yields each :class:`Transition` with a time in ``[start, end)``
+        """
+        first, last = self._range(start, end)
+        if first == last:
+            return
+
+        unpack_from = RECORD.unpack_from
+        with closing(self._map()) as data:
+            for offset in range(
+                    HEADER.size + first * RECORD.size,
+                    HEADER.size + last * RECORD.size, RECORD.size):
+                yield Transition._make(unpack_from(data, offset))
+
+    def read(self, start=None, end=None):
+        """
+        Returns the records with a time in ``[start, end)`` as a
+        :mod:`numpy` structured array with :const:`DTYPE`.  Only the
+        records in the range are read from the file.
+        """
+        first, last = self._range(start, end)
+        if first == last:
+            return numpy.zeros(0, dtype=DTYPE)
+
+        with closing(self._map()) as data:
+            return numpy.frombuffer(
+                data, dtype=DTYPE, count=last - first,
+                offset=HEADER.size + first * RECORD.size).copy()
+
+    def replay(self, aggregator, job_of, start=None, end=None):
+        """
+        Applies the transitions with a time in ``[start, end)`` to a
+        :class:`pyfarm.core.rollup.JobStateAggregator` and returns the
+        indexes, relative to ``start``, of the transitions which could
+        not be applied, see
+        :meth:`pyfarm.core.rollup.JobStateAggregator.apply_many`.
+
+        :param job_of:
+            Mapping of task id to job id.  Transitions of tasks which are
+            not in the mapping can't be applied.
+        """
+        events = (
+            (job_of.get(record.task), record.old, record.new)
+            for record in self.records(start, end))
+        return aggregator.apply_many(events)
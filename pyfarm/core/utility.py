@@ -24,8 +24,16 @@ of PyFarm.
 
 from __future__ import division
 
+import heapq
 import json
-from functools import partial
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import chain, compress, repeat
+from operator import attrgetter
 from ast import literal_eval
 
 try:
@@ -33,10 +41,26 @@ try:
 except ImportError:  # pragma: no cover
     from collections import UserDict
 
-from pyfarm.core.config import read_env_bool
+try:
+    from math import gcd
+except ImportError:  # pragma: no cover
+    from fractions import gcd
+
+try:
+    from collections.abc import ItemsView, Mapping, ValuesView
+except ImportError:  # pragma: no cover
+    from collections import ItemsView, Mapping, ValuesView
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from pyfarm.core.config import read_env, read_env_bool
 from pyfarm.core.enums import (
-    NUMERIC_TYPES, STRING_TYPES, PY2, PY3,
-    BOOLEAN_TRUE, BOOLEAN_FALSE, NONE, Values)
+    NUMERIC_TYPES, INTEGER_TYPES, STRING_TYPES, PY2, PY3,
+    BOOLEAN_TRUE, BOOLEAN_FALSE, NONE, Values, range_, _WorkState,
+    _AgentState, _OperatingSystem, _UseAgentAddress)
 
 
 class ImmutableDict(dict):
@@ -88,24 +112,2270 @@ class ImmutableDict(dict):
     del write_required
 
 
+# Hash array mapped trie used by FrozenDict.  Each node covers five bits
+# of a key's hash and stores its entries in a list which only has room
+# for the slots actually in use, a bitmap records which slots those are.
+# An entry is either a (hash, key, value) tuple or another node.
+_HAMT_BITS = 5
+_HAMT_MASK = (1 << _HAMT_BITS) - 1
+_HAMT_HASH_MASK = (1 << 64) - 1
+_HAMT_HASH_BITS = 64
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # pragma: no cover
+    def _popcount(value):
+        return bin(value).count("1")
+
+
+class _BitmapNode(object):
+    """A node in :class:`FrozenDict`'s trie"""
+    __slots__ = ("bitmap", "entries", "owner")
+
+    def __init__(self, bitmap, entries, owner=None):
+        self.bitmap = bitmap
+        self.entries = entries
+
+        # Set while a FrozenDict is being built, nodes which belong
+        # to the build can be modified in place.
+        self.owner = owner
+
+    def _with(self, index, entry, owner):
+        """Replaces the entry at ``index``, in place if possible"""
+        if owner is not None and self.owner is owner:
+            self.entries[index] = entry
+            return self
+        entries = self.entries[:]
+        entries[index] = entry
+        return _BitmapNode(self.bitmap, entries, owner)
+
+    def assoc(self, shift, leaf, owner):
+        """
+        Returns a node with ``leaf`` added and True if the key was not
+        already present
+        """
+        bit = 1 << ((leaf[0] >> shift) & _HAMT_MASK)
+        index = _popcount(self.bitmap & (bit - 1))
+
+        if not self.bitmap & bit:
+            if owner is not None and self.owner is owner:
+                self.entries.insert(index, leaf)
+                self.bitmap |= bit
+                return self, True
+            entries = self.entries[:]
+            entries.insert(index, leaf)
+            return _BitmapNode(self.bitmap | bit, entries, owner), True
+
+        entry = self.entries[index]
+        if type(entry) is tuple:
+            if entry[1] is leaf[1] or (
+                    entry[0] == leaf[0] and entry[1] == leaf[1]):
+                if entry[2] is leaf[2]:
+                    return self, False
+                return self._with(index, leaf, owner), False
+            node = _merge(entry, leaf, shift + _HAMT_BITS, owner)
+            return self._with(index, node, owner), True
+
+        node, added = entry.assoc(shift + _HAMT_BITS, leaf, owner)
+        if node is entry:
+            return self, added
+        return self._with(index, node, owner), added
+
+    def without(self, shift, key_hash, key):
+        """
+        Returns a node without ``key``, ``self`` if ``key`` is not present
+        or None if the node is now empty.  A node which would only
+        contain a single (hash, key, value) tuple returns the tuple
+        instead so the parent can hold it directly.
+        """
+        bit = 1 << ((key_hash >> shift) & _HAMT_MASK)
+        if not self.bitmap & bit:
+            return self
+
+        index = _popcount(self.bitmap & (bit - 1))
+        entry = self.entries[index]
+        if type(entry) is tuple:
+            if not (entry[1] is key or (
+                    entry[0] == key_hash and entry[1] == key)):
+                return self
+            replacement = None
+        else:
+            replacement = entry.without(shift + _HAMT_BITS, key_hash, key)
+            if replacement is entry:
+                return self
+
+        if replacement is not None:
+            if len(self.entries) == 1 and shift and \
+                    type(replacement) is tuple:
+                return replacement
+            entries = self.entries[:]
+            entries[index] = replacement
+            return _BitmapNode(self.bitmap, entries)
+
+        if len(self.entries) == 1:
+            return None
+        entries = self.entries[:]
+        del entries[index]
+        if len(entries) == 1 and shift and type(entries[0]) is tuple:
+            return entries[0]
+        return _BitmapNode(self.bitmap ^ bit, entries)
+
+
+class _CollisionNode(object):
+    """Holds keys whose hashes are identical"""
+    __slots__ = ("hash", "entries")
+
+    def __init__(self, key_hash, entries):
+        self.hash = key_hash
+        self.entries = entries
+
+    def assoc(self, shift, leaf, owner):
+        if leaf[0] != self.hash:
+            bit = 1 << ((self.hash >> shift) & _HAMT_MASK)
+            return _BitmapNode(bit, [self], owner).assoc(shift, leaf, owner)
+
+        for index, entry in enumerate(self.entries):
+            if entry[1] is leaf[1] or entry[1] == leaf[1]:
+                entries = self.entries[:]
+                entries[index] = leaf
+                return _CollisionNode(self.hash, entries), False
+        return _CollisionNode(self.hash, self.entries + [leaf]), True
+
+    def without(self, shift, key_hash, key):
+        if key_hash != self.hash:
+            return self
+        entries = [
+            entry for entry in self.entries
+            if not (entry[1] is key or entry[1] == key)]
+        if len(entries) == len(self.entries):
+            return self
+        elif len(entries) == 1:
+            return entries[0]
+        return _CollisionNode(self.hash, entries)
+
+
+def _merge(first, second, shift, owner):
+    """Returns a node containing two (hash, key, value) tuples"""
+    if first[0] == second[0] or shift >= _HAMT_HASH_BITS:
+        return _CollisionNode(first[0], [first, second])
+
+    first_index = (first[0] >> shift) & _HAMT_MASK
+    second_index = (second[0] >> shift) & _HAMT_MASK
+    if first_index == second_index:
+        return _BitmapNode(
+            1 << first_index,
+            [_merge(first, second, shift + _HAMT_BITS, owner)], owner)
+    elif first_index > second_index:
+        first, second = second, first
+    return _BitmapNode(
+        1 << first_index | 1 << second_index, [first, second], owner)
+
+
+def _item_hash(key, value):
+    """The contribution of a single item to :meth:`FrozenDict.__hash__`"""
+    return hash((key, value)) & _HAMT_HASH_MASK
+
+
+class _FrozenDictItems(ItemsView):
+    def __iter__(self):
+        for entry in self._mapping._entries():
+            yield entry[1], entry[2]
+
+
+class _FrozenDictValues(ValuesView):
+    def __iter__(self):
+        for entry in self._mapping._entries():
+            yield entry[2]
+
+
+class FrozenDict(Mapping):
+    """
+    An immutable and hashable mapping.  Unlike :class:`ImmutableDict`,
+    which is a :class:`dict` that refuses writes, a modified copy is
+    produced by :meth:`set`, :meth:`delete` or :meth:`merge` in
+    O(log n) time and shares everything which didn't change with the
+    original.  This makes it cheap to derive many slightly different
+    mappings, such as the environment of each task in a job, from a
+    single base.
+
+    >>> base = FrozenDict({"PATH": "/bin", "USER": "render"})
+    >>> task = base.set("FRAME", "1")
+    >>> sorted(task.items())
+    [('FRAME', '1'), ('PATH', '/bin'), ('USER', 'render')]
+    >>> "FRAME" in base
+    False
+    >>> task.delete("FRAME") == base
+    True
+    >>> cache = {task: "task 1"}
+
+    The hash is computed once and kept up to date by each modified
+    copy.  Like :class:`frozenset` it's only available when all
+    values are hashable.
+    """
+    __slots__ = ("_root", "_length", "_hash")
+
+    def __init__(self, *args, **kwargs):
+        root = _BitmapNode(0, [])
+        length = 0
+        if args or kwargs:
+            root, length = self._build(root, length, args, kwargs)
+        self._root = root
+        self._length = length
+        self._hash = None
+
+    @classmethod
+    def _new(cls, root, length, hash_):
+        instance = cls.__new__(cls)
+        instance._root = root
+        instance._length = length
+        instance._hash = hash_
+        return instance
+
+    @staticmethod
+    def _build(root, length, args, kwargs):
+        """
+        Adds the items in ``args`` and ``kwargs``, which are the same as
+        the arguments to :class:`dict`, to ``root`` and returns the new
+        root and length.  Nodes created here are modified in place rather
+        than copied for every item.
+        """
+        if len(args) > 1:
+            raise TypeError(
+                "expected at most 1 arguments, got %d" % len(args))
+
+        items = []
+        if args:
+            items = args[0]
+            if isinstance(items, Mapping):
+                items = items.items()
+            elif hasattr(items, "keys"):
+                items = ((key, items[key]) for key in items.keys())
+        if kwargs:
+            items = chain(items, kwargs.items())
+
+        owner = object()
+        for key, value in items:
+            root, added = root.assoc(
+                0, (hash(key) & _HAMT_HASH_MASK, key, value), owner)
+            length += added
+
+        # Nodes built above stay marked with `owner` but nothing else
+        # holds a reference to it so they can't be modified again.
+        return root, length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        key_hash = hash(key) & _HAMT_HASH_MASK
+        node = self._root
+        shift = 0
+        while True:
+            if type(node) is _CollisionNode:
+                for entry in node.entries:
+                    if entry[1] is key or entry[1] == key:
+                        return entry[2]
+                raise KeyError(key)
+
+            bit = 1 << ((key_hash >> shift) & _HAMT_MASK)
+            bitmap = node.bitmap
+            if not bitmap & bit:
+                raise KeyError(key)
+
+            node = node.entries[_popcount(bitmap & (bit - 1))]
+            if type(node) is tuple:
+                if node[1] is key or (
+                        node[0] == key_hash and node[1] == key):
+                    return node[2]
+                raise KeyError(key)
+            shift += _HAMT_BITS
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for entry in self._entries():
+            yield entry[1]
+
+    def _entries(self):
+        """Yields every (hash, key, value) tuple"""
+        stack = [iter(self._root.entries)]
+        while stack:
+            for entry in stack[-1]:
+                if type(entry) is tuple:
+                    yield entry
+                else:
+                    stack.append(iter(entry.entries))
+                    break
+            else:
+                stack.pop()
+
+    def items(self):
+        return _FrozenDictItems(self)
+
+    def values(self):
+        return _FrozenDictValues(self)
+
+    def __hash__(self):
+        if self._hash is None:
+            result = 0
+            for entry in self._entries():
+                result += _item_hash(entry[1], entry[2])
+            self._hash = result & _HAMT_HASH_MASK
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif isinstance(other, FrozenDict):
+            if self._length != other._length:
+                return False
+            elif self._root is other._root:
+                return True
+            elif self._hash is not None and other._hash is not None \
+                    and self._hash != other._hash:
+                return False
+        elif not isinstance(other, Mapping):
+            return NotImplemented
+        elif len(self) != len(other):
+            return False
+
+        missing = object()
+        for entry in self._entries():
+            if other.get(entry[1], missing) != entry[2]:
+                return False
+        return True
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self.items()))
+
+    def __reduce__(self):
+        return self.__class__, (dict(self.items()), )
+
+    def copy(self):
+        """Returns ``self``, a copy is never needed"""
+        return self
+
+    def set(self, key, value):
+        """Returns a copy with ``key`` set to ``value``"""
+        key_hash = hash(key) & _HAMT_HASH_MASK
+        hash_ = self._hash
+        if hash_ is not None:
+            old = self.get(key, _missing)
+            try:
+                hash_ += _item_hash(key, value)
+                if old is not _missing:
+                    hash_ -= _item_hash(key, old)
+            except TypeError:
+                hash_ = None
+            else:
+                hash_ &= _HAMT_HASH_MASK
+
+        root, added = self._root.assoc(0, (key_hash, key, value), None)
+        if root is self._root:
+            return self
+        return self._new(root, self._length + added, hash_)
+
+    def delete(self, key):
+        """
+        Returns a copy without ``key``
+
+        :raises KeyError:
+            Raised if ``key`` is not present
+        """
+        value = self[key]
+        root = self._root.without(0, hash(key) & _HAMT_HASH_MASK, key)
+        if root is None:
+            root = _BitmapNode(0, [])
+        hash_ = self._hash
+        if hash_ is not None:
+            hash_ = (hash_ - _item_hash(key, value)) & _HAMT_HASH_MASK
+        return self._new(root, self._length - 1, hash_)
+
+    def discard(self, key):
+        """Returns a copy without ``key`` or ``self`` if it's not present"""
+        if key not in self:
+            return self
+        return self.delete(key)
+
+    def merge(self, *args, **kwargs):
+        """
+        Returns a copy with the items from ``args`` and ``kwargs``, which
+        are the same as the arguments to :class:`dict`, added
+        """
+        if not args and not kwargs:
+            return self
+        root, length = self._build(self._root, self._length, args, kwargs)
+        if root is self._root:
+            return self
+        return self._new(root, length, None)
+
+
+_missing = object()
+
+
+_RECORD_TYPES = {}
+
+
+def _rebuild_record(classname, keys, values):
+    """Used to unpickle instances of classes built by :func:`record_type`"""
+    return record_type(classname, keys)._make(values)
+
+
+class _Record(Mapping):
+    """Base class of the classes produced by :func:`record_type`"""
+    __slots__ = ()
+    _keys = ()
+    _getters = {}
+    _setters = ()
+    _getters_ordered = ()
+
+    def __init__(self, *args, **kwargs):
+        if len(args) == len(self._setters) and not kwargs:
+            values = args
+        elif not args:
+            values = self._values_from(kwargs)
+        else:
+            raise TypeError(
+                "%s expects %d values or keyword arguments" % (
+                    self.__class__.__name__, len(self._keys)))
+
+        for setter, value in zip(self._setters, values):
+            setter(self, value)
+
+    @classmethod
+    def _values_from(cls, mapping):
+        try:
+            values = [mapping[key] for key in cls._keys]
+        except KeyError as e:
+            raise TypeError(
+                "%s missing key %r" % (cls.__name__, e.args[0]))
+        if len(mapping) != len(cls._keys):
+            extra = [key for key in mapping if key not in cls._getters]
+            raise TypeError(
+                "%s got unexpected key %r" % (cls.__name__, extra[0]))
+        return values
+
+    @classmethod
+    def _from_mapping(cls, mapping):
+        """
+        Builds a record from a mapping with exactly the keys the class
+        was created with
+        """
+        return cls._make(cls._values_from(mapping))
+
+    @classmethod
+    def _make(cls, values):
+        """
+        Builds a record from a sequence of values in the same order as
+        the keys the class was created with
+        """
+        if not isinstance(values, (tuple, list)):
+            values = tuple(values)
+        if len(values) != len(cls._setters):
+            raise TypeError(
+                "%s expects %d values, got %d" % (
+                    cls.__name__, len(cls._setters), len(values)))
+        record = cls.__new__(cls)
+        for setter, value in zip(cls._setters, values):
+            setter(record, value)
+        return record
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "%s is read-only" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError(
+            "%s is read-only" % self.__class__.__name__)
+
+    def __getitem__(self, key):
+        try:
+            getter = self._getters[key]
+        except (KeyError, TypeError):
+            raise KeyError(key)
+        return getter(self)
+
+    def get(self, key, default=None):
+        getter = self._getters.get(key)
+        if getter is None:
+            return default
+        return getter(self)
+
+    def __contains__(self, key):
+        try:
+            return key in self._getters
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _values(self):
+        return [getter(self) for getter in self._getters_ordered]
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self._values() == other._values()
+        return Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        # The same hash FrozenDict produces for the same items
+        # since the two may compare equal.
+        result = 0
+        for key, value in zip(self._keys, self._values()):
+            result += _item_hash(key, value)
+        return result & _HAMT_HASH_MASK
+
+    def __repr__(self):
+        return "%s(%r)" % (
+            self.__class__.__name__, dict(zip(self._keys, self._values())))
+
+    def __reduce__(self):
+        return _rebuild_record, (
+            self.__class__.__name__, self._keys, tuple(self._values()))
+
+    def copy(self):
+        """Returns ``self``, a copy is never needed"""
+        return self
+
+
+def record_type(classname, keys):
+    """
+    Returns a class for read-only mappings which all have exactly the
+    keys in ``keys``.  Each instance stores only its values, one slot per
+    key, and shares the key lookup table with every other instance so
+    it needs a fraction of the memory of a :class:`dict` or
+    :class:`ImmutableDict`.  Calling this again with the same arguments
+    returns the same class.
+
+    Instances are built from one positional value per key, from keyword
+    arguments or, with the ``_from_mapping`` class method, from another
+    mapping.  A mapping is never accepted positionally since a record
+    with a single key could not tell it apart from the key's value.
+
+    >>> Agent = record_type("Agent", ("hostname", "cpus", "ram"))
+    >>> agent = Agent("render01", 16, 65536)
+    >>> agent["cpus"]
+    16
+    >>> agent == Agent._from_mapping(
+    ...     {"hostname": "render01", "cpus": 16, "ram": 65536})
+    True
+    >>> dict(agent) == {"hostname": "render01", "cpus": 16, "ram": 65536}
+    True
+
+    :param string classname:
+        The name of the class to produce
+
+    :param keys:
+        The keys each instance will have, in the order positional
+        values are provided
+
+    :raises ValueError:
+        Raised if ``keys`` contains duplicates
+    """
+    keys = tuple(keys)
+    registry_key = (classname, keys)
+    try:
+        return _RECORD_TYPES[registry_key]
+    except (KeyError, TypeError):
+        pass
+
+    if len(set(keys)) != len(keys):
+        raise ValueError("keys must be unique")
+
+    slots = tuple("_%d" % index for index in range_(len(keys)))
+    cls = type(classname, (_Record, ), {"__slots__": slots})
+    cls._keys = keys
+    cls._setters = tuple(getattr(cls, slot).__set__ for slot in slots)
+    cls._getters_ordered = tuple(getattr(cls, slot).__get__ for slot in slots)
+    cls._getters = dict(zip(keys, map(attrgetter, slots)))
+    _RECORD_TYPES[registry_key] = cls
+    return cls
+
+
+def _is_enum(value):
+    """
+    Returns True if ``value`` is an enum produced by
+    :func:`pyfarm.core.enums.Enum` or :func:`pyfarm.core.enums.cast_enum`
+    """
+    if not hasattr(value, "_fields"):
+        return False
+    elif hasattr(value, "_enum"):
+        return True
+    return bool(value) and all(isinstance(item, Values) for item in value)
+
+
+# Types which are never replaced by _json_prepare()
+_JSON_SCALARS = frozenset(
+    STRING_TYPES + NUMERIC_TYPES + (bool, type(None)))
+_JSON_CONTAINERS = frozenset((dict, list, tuple))
+
+# The most items of a list or dictionary dump() encodes at once
+_JSON_STREAM_ITEMS = 512
+
+# Translation table mapping digits to "0" and everything else to a
+# space.  A document with a run of _JSON_WIDE_INTEGER after translating
+# may hold an integer outside of the 64 bit range, which orjson would
+# decode as a float.
+_JSON_DIGITS = bytes(bytearray(
+    0x30 if 0x30 <= byte <= 0x39 else 0x20 for byte in range_(256)))
+_JSON_WIDE_INTEGER = b"0" * 19
+
+
+def _json_prepare(o):
+    """
+    Returns ``o`` with any :class:`Values` or enums it contains replaced
+    by their JSON form.  :mod:`json` writes tuples, which both are, as
+    arrays without ever passing them to
+    :meth:`PyFarmJSONEncoder.default`.  Only the lists and dictionaries
+    leading to a replaced value are copied, ``o`` itself is returned
+    when nothing has to be replaced.
+    """
+    cls = type(o)
+    if cls in _JSON_SCALARS:
+        return o
+    elif cls is dict:
+        result = None
+        for key, value in o.items():
+            if type(value) in _JSON_SCALARS:
+                continue
+            prepared = _json_prepare(value)
+            if prepared is not value:
+                if result is None:
+                    result = o.copy()
+                result[key] = prepared
+        return o if result is None else result
+    elif isinstance(o, tuple):
+        if isinstance(o, Values):
+            return o.str
+        elif _is_enum(o):
+            return _json_prepare(o._asdict())
+        return [_json_prepare(value) for value in o]
+    elif cls is list:
+        result = None
+        for index, value in enumerate(o):
+            if type(value) in _JSON_SCALARS:
+                continue
+            prepared = _json_prepare(value)
+            if prepared is not value:
+                if result is None:
+                    result = list(o)
+                result[index] = prepared
+        return o if result is None else result
+    return o
+
+
+def _json_large(o):
+    """
+    Returns True if ``o`` is a list or dictionary with more than
+    :const:`_JSON_STREAM_ITEMS` items or holds one which does.  These
+    are the containers :func:`dump` writes out in pieces.
+    """
+    cls = type(o)
+    if cls is dict:
+        values = o.values()
+    elif cls is list or cls is tuple:
+        values = o
+    else:
+        return False
+
+    if len(values) > _JSON_STREAM_ITEMS:
+        return True
+    for value in values:
+        if type(value) in _JSON_CONTAINERS and \
+                len(value) > _JSON_STREAM_ITEMS:
+            return True
+    return False
+
+
 class PyFarmJSONEncoder(json.JSONEncoder):
-    def encode(self, o):
-        # Introspect dictionary objects for our
-        # enum value type so we can dump out the string
-        # value explicitly.  Otherwise, json.dumps will
-        # dump out a tuple object instead.
-        if isinstance(o, dict):
-            o = o.copy()
-            for key, value in o.items():
-                if isinstance(value, Values):
-                    o[key] = value.str
+    """
+    JSON encoder which writes :class:`Values` as their string value and
+    enums as objects of their fields, at any depth.  Only the containers
+    holding those are copied, everything else is passed to
+    :class:`json.JSONEncoder` as is so :func:`dumps` keeps using the C
+    encoder when it's available.
 
-        return super(PyFarmJSONEncoder, self).encode(o)
+    :func:`dump` writes large lists and dictionaries out in pieces of
+    up to :const:`_JSON_STREAM_ITEMS` items, each encoded on its own,
+    so neither the whole string nor a converted copy of the whole
+    object is ever built.
+    """
+    def default(self, o):
+        if isinstance(o, Mapping):
+            return _json_prepare(dict(o.items()))
+        return super(PyFarmJSONEncoder, self).default(o)
 
-dumps = partial(
-    json.dumps,
-    indent=4 if read_env_bool("PYFARM_PRETTY_JSON", False) else None,
-    cls=PyFarmJSONEncoder)
+    def iterencode(self, o, _one_shot=False):
+        if _one_shot:
+            return super(PyFarmJSONEncoder, self).iterencode(
+                _json_prepare(o), _one_shot)
+
+        indent = self.indent
+        if indent is not None and not isinstance(indent, STRING_TYPES):
+            indent = " " * indent
+        markers = {} if self.check_circular else None
+        return self._iterencode(o, indent, 0, markers)
+
+    def _iterencode(self, o, indent, depth, markers):
+        """
+        Encodes ``o`` in pieces if :func:`_json_large` says it should
+        be, otherwise in one piece with :meth:`encode`.  ``indent`` is
+        the string used for each level of indentation or None.
+        """
+        if not _json_large(o):
+            yield self._encode(o, indent, depth)
+            return
+
+        if markers is not None:
+            if id(o) in markers:
+                raise ValueError("Circular reference detected")
+            markers[id(o)] = o
+
+        if indent is None:
+            newline = closing = ""
+        else:
+            newline = "\n" + indent * (depth + 1)
+            closing = "\n" + indent * depth
+        separator = self.item_separator + newline
+        first = True
+
+        if type(o) is dict:
+            items = sorted(o.items()) if self.sort_keys else o.items()
+            yield "{"
+            for key, value in items:
+                try:
+                    key = _json_key(key)
+                except TypeError:
+                    if self.skipkeys:
+                        continue
+                    raise
+                yield (newline if first else separator) + \
+                    self.encode(key) + self.key_separator
+                for chunk in self._iterencode(
+                        value, indent, depth + 1, markers):
+                    yield chunk
+                first = False
+            yield ("" if first else closing) + "}"
+
+        else:
+            yield "["
+            for start in range_(0, len(o), _JSON_STREAM_ITEMS):
+                batch = o[start:start + _JSON_STREAM_ITEMS]
+                if not any(map(_json_large, batch)):
+                    # Encode the batch as a list then remove the
+                    # brackets, the indentation of the first item
+                    # is kept and the last bracket's is dropped.
+                    text = self._encode(list(batch), indent, depth)
+                    yield ("" if first else self.item_separator) + \
+                        text[1:len(text) - 1 - len(closing)]
+                    first = False
+                    continue
+
+                for value in batch:
+                    yield newline if first else separator
+                    for chunk in self._iterencode(
+                            value, indent, depth + 1, markers):
+                        yield chunk
+                    first = False
+            yield ("" if first else closing) + "]"
+
+        if markers is not None:
+            del markers[id(o)]
+
+    def _encode(self, o, indent, depth):
+        """Encodes ``o`` in one piece, indented to ``depth``"""
+        text = self.encode(o)
+        if depth and indent is not None:
+            # newlines in strings are escaped so these are all
+            # between items
+            text = text.replace("\n", "\n" + indent * depth)
+        return text
+
+
+def _json_default(o):
+    """
+    ``default`` for JSON libraries other than :mod:`json` which do not
+    encode tuple subclasses, such as :class:`Values`, on their own.
+    """
+    if isinstance(o, Values):
+        return o.str
+    elif _is_enum(o):
+        return o._asdict()
+    elif isinstance(o, Mapping):
+        return dict(o.items())
+    elif isinstance(o, tuple):
+        return list(o)
+    raise TypeError("%r is not JSON serializable" % (o, ))
+
+
+_INFINITY = float("inf")
+
+
+def _json_nonfinite(o):
+    """
+    Returns True if ``o`` holds a float which is NaN or infinite.  orjson
+    writes those as ``null`` where :mod:`json` writes ``NaN``,
+    ``Infinity`` and ``-Infinity``.
+    """
+    if isinstance(o, float):
+        return o != o or o in (_INFINITY, -_INFINITY)
+    elif isinstance(o, Values) or isinstance(o, STRING_TYPES):
+        return False
+    elif isinstance(o, Mapping):
+        o = o.values()
+    elif not isinstance(o, (list, tuple)):
+        return False
+    return any(map(_json_nonfinite, o))
+
+
+def _enum_lookup(enums):
+    """
+    Builds a table of key -> {value: member} from a dictionary of keys
+    to enums for :meth:`JSONBackend.loads`.
+    """
+    table = {}
+    for key, enum in enums.items():
+        members = getattr(enum, "_members", None)
+        if members is None:
+            members = {}
+            for value in enum:
+                members[value.int] = members[value.str] = value
+        table[key] = members
+    return table
+
+
+def _enum_hook(table):
+    """Returns an ``object_hook`` which replaces values using ``table``"""
+    def hook(data):
+        for key, members in table.items():
+            value = data.get(key)
+            if value is not None and not isinstance(value, (dict, list)):
+                data[key] = members.get(value, value)
+        return data
+    return hook
+
+
+def _apply_hook(data, hook):
+    """Applies ``hook`` to every object in ``data``, innermost first"""
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, (dict, list)):
+                _apply_hook(value, hook)
+        return hook(data)
+    elif isinstance(data, list):
+        for value in data:
+            if isinstance(value, (dict, list)):
+                _apply_hook(value, hook)
+    return data
+
+
+class JSONBackend(object):
+    """
+    Base class for the JSON libraries :func:`dumps` and :func:`loads`
+    can use.  Every backend encodes the types PyFarm uses, including
+    :class:`Values` and enums, to the same data and decodes it to the
+    same objects.  Whitespace, the escaping of non-ASCII characters and
+    the formatting of floats which need an exponent may differ between
+    libraries.
+
+    :param bool pretty:
+        If True produce indented output
+    """
+    name = None
+    available = False
+
+    def __init__(self, pretty=False):
+        self.pretty = pretty
+
+    def dumps(self, obj):  # pragma: no cover
+        raise NotImplementedError
+
+    def loads(self, data, enums=None):
+        """
+        Decodes ``data``.  ``enums`` is an optional dictionary of keys to
+        enums, a value under one of those keys which is the integer or
+        string value of a member is replaced by the member's
+        :class:`Values`:
+
+        >>> from pyfarm.core.enums import WorkState
+        >>> loads('{"state": "done"}', enums={"state": WorkState})
+        {'state': Values(106, 'done')}
+        """
+        raise NotImplementedError  # pragma: no cover
+
+
+class StdlibJSONBackend(JSONBackend):
+    """
+    Backend built on :mod:`json` and :class:`PyFarmJSONEncoder`.  The
+    output is the same as :func:`json.dumps` with its default options,
+    or with an indent of four when ``pretty`` is set.
+    """
+    name = "json"
+    available = True
+
+    def __init__(self, pretty=False):
+        super(StdlibJSONBackend, self).__init__(pretty=pretty)
+        self.options = {"cls": PyFarmJSONEncoder}
+        if pretty:
+            self.options.update(indent=4)
+
+    def dumps(self, obj, **kwargs):
+        options = self.options
+        if kwargs:
+            options = options.copy()
+            options.update(kwargs)
+        return json.dumps(obj, **options)
+
+    def dump(self, obj, stream, **kwargs):
+        options = self.options
+        if kwargs:
+            options = options.copy()
+            options.update(kwargs)
+        return json.dump(obj, stream, **options)
+
+    def loads(self, data, enums=None):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        if not enums:
+            return json.loads(data)
+        return json.loads(data, object_hook=_enum_hook(_enum_lookup(enums)))
+
+
+class OrjsonJSONBackend(JSONBackend):
+    """
+    Backend built on :mod:`orjson`, which produces compact output, or
+    output indented by two when ``pretty`` is set, and writes non-ASCII
+    characters as is.  Objects orjson can't encode, such as integers
+    larger than 64 bits, and objects holding NaN or infinite floats,
+    which orjson would write as ``null``, are encoded by
+    :class:`StdlibJSONBackend` instead.  orjson decodes those integers as floats so any document
+    which might contain one is decoded by :class:`StdlibJSONBackend`
+    as well.
+    """
+    name = "orjson"
+    available = orjson is not None
+
+    def __init__(self, pretty=False):
+        super(OrjsonJSONBackend, self).__init__(pretty=pretty)
+        self.fallback = StdlibJSONBackend(pretty=pretty)
+        if self.available:
+            self.option = orjson.OPT_NON_STR_KEYS
+            if pretty:
+                self.option |= orjson.OPT_INDENT_2
+
+    def dumps(self, obj):
+        try:
+            data = orjson.dumps(obj, default=_json_default, option=self.option)
+        except TypeError:
+            return self.fallback.dumps(obj)
+
+        # Only look for the floats which became null if there is one
+        if b"null" in data and _json_nonfinite(obj):
+            return self.fallback.dumps(obj)
+        return data.decode("utf-8")
+
+    def loads(self, data, enums=None):
+        if isinstance(data, STRING_TYPES):
+            digits = data.encode("utf-8").translate(_JSON_DIGITS)
+        else:
+            digits = bytes(data).translate(_JSON_DIGITS)
+        if _JSON_WIDE_INTEGER in digits:
+            return self.fallback.loads(data, enums=enums)
+
+        data = orjson.loads(data)
+        if not enums:
+            return data
+        return _apply_hook(data, _enum_hook(_enum_lookup(enums)))
+
+
+# Backends which get_json_backend() can return
+JSON_BACKENDS = (StdlibJSONBackend, OrjsonJSONBackend)
+
+
+def get_json_backend(name=None, pretty=None):
+    """
+    Returns an instance of the JSON backend called ``name`` or, if
+    ``name`` is not provided, the value of :envvar:`PYFARM_JSON_BACKEND`.
+    :class:`StdlibJSONBackend` is used when neither is set so the output
+    of :func:`dumps` only changes when another backend is asked for.
+    :class:`OrjsonJSONBackend` is never picked just because
+    :mod:`orjson` is installed, set :envvar:`PYFARM_JSON_BACKEND` to
+    ``orjson`` to use it.
+
+    :raises ValueError:
+        Raised if the requested backend does not exist or is not
+        installed
+    """
+    if pretty is None:
+        pretty = read_env_bool("PYFARM_PRETTY_JSON", False)
+    if name is None:
+        name = read_env("PYFARM_JSON_BACKEND", StdlibJSONBackend.name)
+
+    for backend in JSON_BACKENDS:
+        if backend.available and name == backend.name:
+            return backend(pretty=pretty)
+    raise ValueError("JSON backend %r is not available" % name)
+
+json_backend = get_json_backend()
+_stdlib_json = StdlibJSONBackend(pretty=json_backend.pretty)
+
+
+def dumps(obj, **kwargs):
+    """
+    Encodes ``obj`` with :data:`json_backend`.  Any keyword arguments are
+    passed along to :func:`json.dumps` which is used instead of the
+    backend when they're provided.
+    """
+    if kwargs:
+        return _stdlib_json.dumps(obj, **kwargs)
+    return json_backend.dumps(obj)
+
+
+def dump(obj, stream, **kwargs):
+    """
+    Writes ``obj`` to ``stream`` in chunks as it's encoded, the whole
+    string is never built in memory.  This always uses
+    :class:`StdlibJSONBackend`.
+    """
+    return _stdlib_json.dump(obj, stream, **kwargs)
+
+
+def loads(data, enums=None):
+    """Decodes ``data`` with :data:`json_backend`, see
+    :meth:`JSONBackend.loads`"""
+    return json_backend.loads(data, enums=enums)
+
+
+# Tags used by WireCodec, each encoded value starts with one byte
+_WIRE_NONE = 0x00
+_WIRE_TRUE = 0x01
+_WIRE_FALSE = 0x02
+_WIRE_INT = 0x03  # varint
+_WIRE_NEGATIVE_INT = 0x04  # varint of -(value + 1)
+_WIRE_FLOAT = 0x05  # little endian double
+_WIRE_STRING = 0x06  # varint length + utf-8, added to the string table
+_WIRE_STRING_REF = 0x07  # varint index into the string table
+_WIRE_LIST = 0x08  # varint length + values
+_WIRE_DICT = 0x09  # varint length + key/value pairs
+_WIRE_ENUM = 0x0a  # varint Values.int
+_WIRE_INTEGRAL_FLOAT = 0x0b  # varint, positive floats without a fraction
+_WIRE_SMALL_STRING_REF = 0x40  # 0x40-0x7f, string table index < 64
+_WIRE_SMALL_INT = 0x80  # 0x80-0xff, integers from 0 to 127
+_WIRE_DOUBLE = struct.Struct("<d")
+_WIRE_MAX_INTEGRAL_FLOAT = 2.0 ** 53
+
+WIRE_VERSION = 1
+
+
+def _json_key(key):
+    """Converts a dictionary key the same way :mod:`json` does"""
+    if isinstance(key, STRING_TYPES):
+        return key
+    elif key is True:
+        return "true"
+    elif key is False:
+        return "false"
+    elif key is None:
+        return "null"
+    elif isinstance(key, float):
+        return repr(key)
+    elif isinstance(key, INTEGER_TYPES):
+        return str(int(key))
+    raise TypeError(
+        "keys must be a string, number, bool or None, not %r" % (key, ))
+
+
+class WireCodec(object):
+    """
+    Compact binary encoding for messages sent between agents and the
+    master.  Anything :func:`dumps` can encode is supported and decoding
+    produces the same result as ``loads(dumps(obj))``, the encoding is
+    just smaller and quicker to produce:
+
+        * enum :class:`Values` are written as their integer code,
+          members of enums built by
+          :func:`pyfarm.core.enums.cast_enum` are plain strings or
+          integers and are written like any other
+        * integers, and floats such as frame numbers which don't have
+          a fractional part, are written as varints, 0 to 127 in a
+          single byte
+        * every string is written once per message, repeats of a
+          hostname or key refer back to the first copy
+
+    Decoding is done in pure Python and is slower than :func:`json.loads`,
+    which is implemented in C, so the codec saves bandwidth and encoding
+    time but not decoding time.
+
+    >>> from pyfarm.core.enums import _AgentState
+    >>> codec = WireCodec()
+    >>> data = codec.pack([{"state": _AgentState.ONLINE}] * 2)
+    >>> len(data), len(dumps([{"state": _AgentState.ONLINE}] * 2))
+    (21, 42)
+    >>> codec.unpack(data)
+    [{'state': 'online'}, {'state': 'online'}]
+
+    :param enums:
+        The enums whose members will be written as integer codes, by
+        default the enums in :mod:`pyfarm.core.enums`.  Both sides of a
+        connection must use the same enums, members of any other enum
+        are written as strings.
+    """
+    def __init__(self, enums=None):
+        if enums is None:
+            enums = (_WorkState, _AgentState, _OperatingSystem,
+                     _UseAgentAddress)
+
+        self.values = {}
+        for enum in enums:
+            for value in getattr(enum, "_enum", enum):
+                if self.values.setdefault(value.int, value) != value:
+                    raise ValueError(
+                        "%r and %r use the same integer value" % (
+                            self.values[value.int], value))
+
+        # Values hash the same as their string, the key needs
+        # both halves so members of other enums don't match.
+        self._codes = dict(
+            ((value.int, value.str), value.int)
+            for value in self.values.values())
+
+    def pack(self, obj):
+        """
+        Encodes ``obj`` and returns :class:`bytes`
+
+        :raises TypeError:
+            Raised if ``obj`` contains something which can't be encoded
+        """
+        out = bytearray((WIRE_VERSION, ))
+        append = out.append
+        extend = out.extend
+        strings = {}
+        get_string = strings.get
+        codes = self._codes
+        pack_double = _WIRE_DOUBLE.pack
+
+        def varint(value):
+            while value > 0x7f:
+                append(value & 0x7f | 0x80)
+                value >>= 7
+            append(value)
+
+        def string(value):
+            index = get_string(value)
+            if index is None:
+                strings[value] = len(strings)
+                if not isinstance(value, bytes):
+                    value = value.encode("utf-8")
+                append(_WIRE_STRING)
+                varint(len(value))
+                extend(value)
+            elif index < 0x40:
+                append(_WIRE_SMALL_STRING_REF | index)
+            else:
+                append(_WIRE_STRING_REF)
+                varint(index)
+
+        def encode(value):
+            kind = type(value)
+            if kind is int:
+                if 0 <= value < 0x80:
+                    append(_WIRE_SMALL_INT | value)
+                elif value >= 0:
+                    append(_WIRE_INT)
+                    varint(value)
+                else:
+                    append(_WIRE_NEGATIVE_INT)
+                    varint(-value - 1)
+            elif kind is dict:
+                append(_WIRE_DICT)
+                varint(len(value))
+                for key, item in value.items():
+                    # The common case, a key which was already written
+                    index = get_string(key)
+                    if index is not None and index < 0x40 and \
+                            type(key) is not Values:
+                        append(_WIRE_SMALL_STRING_REF | index)
+                    else:
+                        string(_json_key(key))
+                    encode(item)
+            elif kind is float:
+                if 0 < value < _WIRE_MAX_INTEGRAL_FLOAT and \
+                        value.is_integer():
+                    append(_WIRE_INTEGRAL_FLOAT)
+                    varint(int(value))
+                else:
+                    append(_WIRE_FLOAT)
+                    extend(pack_double(value))
+            elif kind is list or kind is tuple:
+                append(_WIRE_LIST)
+                varint(len(value))
+                for item in value:
+                    encode(item)
+            elif kind is Values:
+                code = codes.get((value[0], value[1]))
+                if code is None:
+                    string(value[1])
+                else:
+                    append(_WIRE_ENUM)
+                    varint(code)
+            elif value is None:
+                append(_WIRE_NONE)
+            elif value is True:
+                append(_WIRE_TRUE)
+            elif value is False:
+                append(_WIRE_FALSE)
+            elif isinstance(value, STRING_TYPES):
+                string(value)
+            elif isinstance(value, float):
+                encode(float(value))
+            elif isinstance(value, INTEGER_TYPES):
+                encode(int(value))
+            elif isinstance(value, Values):
+                encode(Values(*value))
+            elif _is_enum(value):
+                encode(value._asdict())
+            elif isinstance(value, Mapping):
+                encode(dict(value.items()))
+            elif isinstance(value, (list, tuple)):
+                encode(list(value))
+            else:
+                raise TypeError("%r can't be encoded" % (value, ))
+
+        encode(obj)
+        return bytes(out)
+
+    def unpack(self, data, values=False):
+        """
+        Decodes ``data`` produced by :meth:`pack`.
+
+        :param bool values:
+            If True enum members are returned as :class:`Values`
+            instead of their string
+
+        :raises ValueError:
+            Raised if ``data`` is truncated or was not produced by
+            :meth:`pack`
+        """
+        data = bytearray(data)
+        if not data or data[0] != WIRE_VERSION:
+            raise ValueError("unsupported wire format version")
+
+        strings = []
+        enum_values = self.values
+        unpack_double = _WIRE_DOUBLE.unpack_from
+
+        def varint(position):
+            result = shift = 0
+            while True:
+                byte = data[position]
+                position += 1
+                result |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    return result, position
+                shift += 7
+
+        def decode(position):
+            tag = data[position]
+            position += 1
+            if tag >= _WIRE_SMALL_INT:
+                return tag & 0x7f, position
+            elif tag >= _WIRE_SMALL_STRING_REF:
+                return strings[tag & 0x3f], position
+            elif tag == _WIRE_DICT:
+                length = data[position]
+                if length < 0x80:
+                    position += 1
+                else:
+                    length, position = varint(position)
+                result = {}
+                for _ in range_(length):
+                    tag = data[position]
+                    if _WIRE_SMALL_STRING_REF <= tag < _WIRE_SMALL_INT:
+                        key = strings[tag & 0x3f]
+                        position += 1
+                    else:
+                        key, position = decode(position)
+                    result[key], position = decode(position)
+                return result, position
+            elif tag == _WIRE_LIST:
+                length, position = varint(position)
+                result = []
+                append = result.append
+                for _ in range_(length):
+                    item, position = decode(position)
+                    append(item)
+                return result, position
+            elif tag == _WIRE_STRING:
+                length, position = varint(position)
+                end = position + length
+                if end > len(data):
+                    raise IndexError
+                value = data[position:end].decode("utf-8")
+                strings.append(value)
+                return value, end
+            elif tag == _WIRE_ENUM:
+                code, position = varint(position)
+                value = enum_values[code]
+                return (value if values else value.str), position
+            elif tag == _WIRE_FLOAT:
+                return unpack_double(data, position)[0], position + 8
+            elif tag == _WIRE_INTEGRAL_FLOAT:
+                value, position = varint(position)
+                return float(value), position
+            elif tag == _WIRE_STRING_REF:
+                index, position = varint(position)
+                return strings[index], position
+            elif tag == _WIRE_INT:
+                return varint(position)
+            elif tag == _WIRE_NEGATIVE_INT:
+                value, position = varint(position)
+                return -value - 1, position
+            elif tag == _WIRE_NONE:
+                return None, position
+            elif tag == _WIRE_TRUE:
+                return True, position
+            elif tag == _WIRE_FALSE:
+                return False, position
+            raise ValueError("unknown tag 0x%02x" % tag)
+
+        try:
+            result, position = decode(1)
+        except (IndexError, KeyError, TypeError, struct.error):
+            raise ValueError("truncated or corrupt data")
+
+        if position != len(data):
+            raise ValueError("%d trailing bytes" % (len(data) - position))
+        return result
+
+
+_wire_codec = WireCodec()
+
+
+def pack(obj):
+    """Encodes ``obj`` with the default :class:`WireCodec`"""
+    return _wire_codec.pack(obj)
+
+
+def unpack(data, values=False):
+    """Decodes ``data`` with the default :class:`WireCodec`"""
+    return _wire_codec.unpack(data, values=values)
+
+
+_FRAME_RANGE = re.compile(
+    r"^\s*(-?\d+)(?:\s*-\s*(-?\d+)(?:\s*x\s*(\d+))?)?\s*$")
+
+
+def _run_count(run):
+    """Returns the number of frames in a (start, end, step) run"""
+    return (run[1] - run[0]) // run[2] + 1
+
+
+def _clip_run(run, low, high):
+    """Returns the part of ``run`` between ``low`` and ``high`` or None"""
+    start, end, step = run
+    if start < low:
+        start += -((start - low) // step) * step
+    end = min(end, high)
+    if start > end:
+        return None
+    end = start + (end - start) // step * step
+    if start == end:
+        return start, start, 1
+    return start, end, step
+
+
+def _inverse(value, modulo):
+    """Returns the modular inverse of ``value``, which must exist"""
+    low, high = value % modulo, modulo
+    x, last_x = 1, 0
+    while low > 1:
+        quotient = high // low
+        low, high = high - quotient * low, low
+        x, last_x = last_x - quotient * x, x
+    return x % modulo
+
+
+def _intersect_runs(first, second):
+    """Returns the frames ``first`` and ``second`` share as a run or None"""
+    low = max(first[0], second[0])
+    high = min(first[1], second[1])
+    if low > high:
+        return None
+
+    step_a, step_b = first[2], second[2]
+    divisor = gcd(step_a, step_b)
+    difference = second[0] - first[0]
+    if difference % divisor:
+        return None
+
+    # Chinese remainder theorem, the first frame at or after first[0]
+    # which both runs contain repeats every lcm(step_a, step_b) frames.
+    modulo = step_b // divisor
+    step = step_a * modulo
+    offset = (difference // divisor) * _inverse(step_a // divisor, modulo)
+    frame = first[0] + step_a * (offset % modulo)
+    return _clip_run((frame, high, step), low, high)
+
+
+def _runs_from_frames(frames):
+    """
+    Compresses sorted unique ``frames`` into (start, end, step) runs.
+    Two frames never start a run if the second could start a longer
+    one instead, so ``1, 2, 4, 6`` becomes ``1`` and ``2-6x2``.
+    """
+    start = previous = step = None
+    count = 0
+    for frame in frames:
+        if count == 0:
+            start = previous = frame
+            count = 1
+        elif count == 1:
+            step = frame - previous
+            previous = frame
+            count = 2
+        elif frame - previous == step:
+            previous = frame
+            count += 1
+        elif count == 2:
+            yield start, start, 1
+            start, step, previous = previous, frame - previous, frame
+        else:
+            yield start, previous, step
+            start = previous = frame
+            count = 1
+
+    if count == 1:
+        yield start, start, 1
+    elif count:
+        yield start, previous, step
+
+
+def _append_run(runs, run):
+    """Appends ``run`` to ``runs`` joining it to the last run if possible"""
+    if runs:
+        last = runs[-1]
+        if last[0] == last[1] and run[0] == run[1]:
+            runs[-1] = (last[0], run[0], run[0] - last[0])
+            return
+        elif last[0] == last[1]:
+            if last[0] + run[2] == run[0]:
+                runs[-1] = (last[0], run[1], run[2])
+                return
+        elif run[0] == run[1]:
+            if last[1] + last[2] == run[0]:
+                runs[-1] = (last[0], run[0], last[2])
+                return
+        elif last[2] == run[2] and last[1] + last[2] == run[0]:
+            runs[-1] = (last[0], run[1], last[2])
+            return
+    runs.append(run)
+
+
+def _combine_runs(first, second, operation):
+    """
+    Applies ``operation`` ("|", "&" or "-") to two pairs of runs that
+    cover the same segment, either of which may be None.  Returns a
+    list of runs.
+    """
+    if first is None or second is None:
+        if operation == "|":
+            return [first or second]
+        elif operation == "-" and first is not None:
+            return [first]
+        return []
+
+    shared = _intersect_runs(first, second)
+    if operation == "&":
+        return [shared] if shared else []
+    elif operation == "-":
+        if shared is None:
+            return [first]
+        elif shared == first:
+            return []
+        elif shared[2] == first[2] * 2:
+            # Every other frame of `first` is removed
+            runs = []
+            step = first[2]
+            for run in ((first[0], shared[0] - step, step),
+                        (shared[0] + step, shared[1] - step, shared[2]),
+                        (shared[1] + step, first[1], step)):
+                run = _clip_run(run, run[0], run[1])
+                if run is not None:
+                    runs.append(run)
+            return runs
+        frames = (frame for frame in _run_frames(first)
+                  if not _in_run(shared, frame))
+    elif shared == second:
+        return [first]
+    elif shared == first:
+        return [second]
+    else:
+        frames = _merge_frames(_run_frames(first), _run_frames(second))
+    return list(_runs_from_frames(frames))
+
+
+def _run_frames(run):
+    return iter(range_(run[0], run[1] + 1, run[2]))
+
+
+def _in_run(run, frame):
+    return run[0] <= frame <= run[1] and not (frame - run[0]) % run[2]
+
+
+def _merge_frames(first, second):
+    """Merges two sorted iterators of frames dropping duplicates"""
+    previous = None
+    for frame in heapq.merge(first, second):
+        if frame != previous:
+            yield frame
+            previous = frame
+
+
+class FrameSet(object):
+    """
+    An immutable, sorted set of integer frame numbers stored as
+    ``(start, end, step)`` runs rather than individual frames.  Range
+    expressions such as ``"1-1000x2,1500,2000-2100"`` are parsed without
+    producing a frame for each number and :func:`str` compresses the set
+    back into the shortest expression it can find.
+
+    >>> frames = FrameSet("1-1000x2,1500,2000-2100")
+    >>> len(frames), 999 in frames, 1000 in frames
+    (602, True, False)
+    >>> str(frames & FrameSet("900-2050"))
+    '901-999x2,1500,2000-2050'
+    >>> str(FrameSet([1, 2, 3, 5, 7, 9, 20]))
+    '1-3,5-9x2,20'
+
+    Membership and indexing take O(log n) time in the number of runs,
+    iteration is lazy and set operations take time in proportion to the
+    number of runs.  The exception is where runs with incompatible steps
+    overlap, ``1-100x2 | 1-100x3`` for example, only the frames in the
+    overlapping part are enumerated to build the result.
+
+    :param frames:
+        A range expression, another :class:`FrameSet`, a :func:`range`
+        or an iterable of integer frames
+
+    :raises ValueError:
+        Raised if a range expression can't be parsed
+    """
+    __slots__ = ("_runs", "_starts", "_offsets")
+
+    def __init__(self, frames=None):
+        if frames is None:
+            runs = []
+        elif isinstance(frames, FrameSet):
+            runs = frames._runs
+        elif isinstance(frames, STRING_TYPES):
+            runs = self._parse(frames)
+        elif isinstance(frames, range_):
+            runs = []
+            if len(frames):
+                start, end = frames[0], frames[-1]
+                step = frames[1] - start if len(frames) > 1 else 1
+                if step < 0:
+                    start, end, step = end, start, -step
+                runs = [_clip_run((start, end, step), start, end)]
+        else:
+            runs = list(_runs_from_frames(sorted(set(frames))))
+        self._set_runs(runs)
+
+    def _set_runs(self, runs):
+        self._runs = runs
+        self._starts = [run[0] for run in runs]
+        self._offsets = []
+        total = 0
+        for run in runs:
+            total += _run_count(run)
+            self._offsets.append(total)
+
+    @classmethod
+    def _from_runs(cls, runs):
+        instance = cls.__new__(cls)
+        instance._set_runs(runs)
+        return instance
+
+    @staticmethod
+    def _parse(expression):
+        runs = []
+        for token in expression.split(","):
+            if not token.strip():
+                continue
+            match = _FRAME_RANGE.match(token)
+            if match is None:
+                raise ValueError("invalid frame range %r" % token.strip())
+            start, end, step = match.groups()
+            start = int(start)
+            end = start if end is None else int(end)
+            step = 1 if step is None else int(step)
+            if end < start or step < 1:
+                raise ValueError("invalid frame range %r" % token.strip())
+            runs.append(_clip_run((start, end, step), start, end))
+
+        runs.sort()
+        result = []
+        for run in runs:
+            if result and run[0] <= result[-1][1]:
+                # Overlaps what's been built so far, rare enough that a
+                # general union is fine.
+                result = FrameSet._sweep(result, [run], "|")
+            else:
+                _append_run(result, run)
+        return result
+
+    @staticmethod
+    def _sweep(first, second, operation):
+        """Applies ``operation`` to two lists of runs"""
+        points = set()
+        for run in chain(first, second):
+            points.add(run[0])
+            points.add(run[1] + 1)
+        points = sorted(points)
+
+        result = []
+        first_index = second_index = 0
+        for low, next_low in zip(points, points[1:]):
+            high = next_low - 1
+            while first_index < len(first) and first[first_index][1] < low:
+                first_index += 1
+            while second_index < len(second) and \
+                    second[second_index][1] < low:
+                second_index += 1
+
+            pair = []
+            for runs, index in ((first, first_index), (second, second_index)):
+                run = None
+                if index < len(runs) and runs[index][0] <= high:
+                    run = _clip_run(runs[index], low, high)
+                pair.append(run)
+
+            if pair[0] is None and pair[1] is None:
+                continue
+            for run in _combine_runs(pair[0], pair[1], operation):
+                _append_run(result, run)
+        return result
+
+    @property
+    def runs(self):
+        """The ``(start, end, step)`` runs in this set, end is inclusive"""
+        return tuple(self._runs)
+
+    @property
+    def start(self):
+        """The first frame, None for an empty set"""
+        return self._runs[0][0] if self._runs else None
+
+    @property
+    def end(self):
+        """The last frame, None for an empty set"""
+        return self._runs[-1][1] if self._runs else None
+
+    def __len__(self):
+        return self._offsets[-1] if self._offsets else 0
+
+    def __bool__(self):
+        return bool(self._runs)
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for start, end, step in self._runs:
+            for frame in range_(start, end + 1, step):
+                yield frame
+
+    def __contains__(self, frame):
+        index = bisect_right(self._starts, frame) - 1
+        return index >= 0 and _in_run(self._runs[index], frame)
+
+    def __getitem__(self, index):
+        """
+        Returns the frame at ``index`` in sorted order or, for a slice,
+        a :class:`FrameSet` of the frames at those positions
+        """
+        if isinstance(index, slice):
+            return self._slice(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        run_index = bisect_right(self._offsets, index)
+        start = self._offsets[run_index - 1] if run_index else 0
+        run = self._runs[run_index]
+        return run[0] + (index - start) * run[2]
+
+    def _slice(self, index):
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("slices of a FrameSet can't have a step")
+
+        runs = []
+        run_index = bisect_right(self._offsets, start)
+        while start < stop:
+            offset = self._offsets[run_index - 1] if run_index else 0
+            first, last, step = self._runs[run_index]
+            end = min(stop, self._offsets[run_index])
+            runs.append(_clip_run(
+                (first + (start - offset) * step,
+                 first + (end - 1 - offset) * step, step),
+                first, last))
+            start = end
+            run_index += 1
+        return self._from_runs(runs)
+
+    def __eq__(self, other):
+        if not isinstance(other, FrameSet):
+            return NotImplemented
+        elif self._runs == other._runs:
+            return True
+        elif len(self) != len(other):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def _operation(self, other, operation):
+        if not isinstance(other, FrameSet):
+            other = FrameSet(other)
+        return self._from_runs(self._sweep(self._runs, other._runs, operation))
+
+    def union(self, other):
+        """Returns the frames in either set"""
+        return self._operation(other, "|")
+
+    def intersection(self, other):
+        """Returns the frames in both sets"""
+        return self._operation(other, "&")
+
+    def difference(self, other):
+        """Returns the frames in this set which are not in ``other``"""
+        return self._operation(other, "-")
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def __str__(self):
+        tokens = []
+        short = []
+
+        # Runs of one or two frames are compressed again along
+        # with their neighbors, 1,3 and 5 could be 1-5x2.
+        for run in self._runs + [None]:
+            if run is not None and _run_count(run) < 3:
+                short.extend(range_(run[0], run[1] + 1, run[2]))
+                continue
+            for start, end, step in _runs_from_frames(short):
+                if start == end:
+                    tokens.append("%d" % start)
+                elif _run_count((start, end, step)) == 2 and step != 1:
+                    tokens.append("%d,%d" % (start, end))
+                else:
+                    tokens.append(_format_run((start, end, step)))
+            del short[:]
+            if run is not None:
+                tokens.append(_format_run(run))
+        return ",".join(tokens)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, str(self))
+
+    def __reduce__(self):
+        return self.__class__, (str(self), )
+
+
+def _format_run(run):
+    start, end, step = run
+    if step == 1:
+        return "%d-%d" % (start, end)
+    return "%d-%dx%d" % (start, end, step)
+
+
+class FrameCost(object):
+    """
+    A per-frame cost model for :func:`chunk_frames`.  Costs are constant
+    over intervals of frames, a frame outside of every interval costs
+    ``default``.
+
+    >>> cost = FrameCost({"1-100": 4.0, 500: 10}, default=1.0)
+    >>> cost(50), cost(500), cost(101)
+    (4.0, 10, 1.0)
+
+    :param costs:
+        A mapping, or iterable of pairs, of a frame interval to the cost
+        of each frame in that interval.  Intervals may be a single frame,
+        a ``(first, last)`` tuple or a ``"first-last"`` string and must
+        not overlap.
+
+    :raises ValueError:
+        Raised if an interval is invalid, intervals overlap or a cost
+        is negative
+    """
+    def __init__(self, costs=None, default=1.0):
+        if default < 0:
+            raise ValueError("costs can't be negative")
+        self.default = default
+        if isinstance(costs, Mapping):
+            costs = costs.items()
+
+        intervals = []
+        for interval, cost in costs or ():
+            if isinstance(interval, STRING_TYPES):
+                match = _FRAME_RANGE.match(interval)
+                if match is None or match.group(3) is not None:
+                    raise ValueError("invalid frame interval %r" % interval)
+                first = int(match.group(1))
+                last = first if match.group(2) is None else int(match.group(2))
+            elif isinstance(interval, tuple):
+                first, last = interval
+            else:
+                first = last = interval
+            if last < first:
+                raise ValueError("invalid frame interval %r" % (interval, ))
+            if cost < 0:
+                raise ValueError("costs can't be negative")
+            intervals.append((first, last, cost))
+
+        intervals.sort()
+        for previous, interval in zip(intervals, intervals[1:]):
+            if interval[0] <= previous[1]:
+                raise ValueError(
+                    "frame intervals %r and %r overlap" % (
+                        previous[:2], interval[:2]))
+        self.intervals = intervals
+        self._firsts = [interval[0] for interval in intervals]
+
+    def __call__(self, frame):
+        """Returns the cost of ``frame``"""
+        index = bisect_right(self._firsts, frame) - 1
+        if index >= 0 and frame <= self.intervals[index][1]:
+            return self.intervals[index][2]
+        return self.default
+
+    def segments(self, frames):
+        """
+        Returns the cost of ``frames``, a :class:`FrameSet`, as a list of
+        ``(position, cost)`` pairs in order where each frame from
+        ``position`` up to the next pair's position has the same cost.
+        The number of pairs depends only on the number of runs in
+        ``frames`` and intervals in this model, not the number of frames.
+        """
+        segments = []
+        intervals = self.intervals
+        position = 0
+
+        def add(start, cost):
+            if segments and segments[-1][1] == cost:
+                return
+            elif segments and segments[-1][0] == start:
+                segments[-1] = (start, cost)
+            else:
+                segments.append((start, cost))
+
+        for start, end, step in frames.runs:
+            count = (end - start) // step + 1
+            index = max(bisect_right(self._firsts, start) - 1, 0)
+            offset = 0
+            while index < len(intervals) and offset < count:
+                first, last, cost = intervals[index]
+                index += 1
+                if last < start:
+                    continue
+                elif first > end:
+                    break
+
+                # Positions of the run's frames which are inside the
+                # interval, the first at or after `first` and the last
+                # at or before `last`.
+                low = max(0, -((start - first) // step))
+                high = min(count - 1, (last - start) // step)
+                if low > high:
+                    continue
+                if low > offset:
+                    add(position + offset, self.default)
+                add(position + low, cost)
+                offset = high + 1
+
+            if offset < count:
+                add(position + offset, self.default)
+            position += count
+
+        return segments
+
+
+class _CumulativeCost(object):
+    """
+    The total cost of the frames before each position in a
+    :class:`FrameSet`, built from :meth:`FrameCost.segments`
+    """
+    def __init__(self, segments, length):
+        self.length = length
+        self.positions = [position for position, _ in segments]
+        self.costs = [cost for _, cost in segments]
+        self.totals = []
+        total = 0
+        for index, (position, cost) in enumerate(segments):
+            self.totals.append(total)
+            end = segments[index + 1][0] if index + 1 < len(segments) \
+                else length
+            total += (end - position) * cost
+        self.total = total
+
+    def at(self, position):
+        """Returns the cost of the frames before ``position``"""
+        index = bisect_right(self.positions, position) - 1
+        if index < 0:
+            return 0
+        return self.totals[index] + (
+            position - self.positions[index]) * self.costs[index]
+
+    def position(self, cost):
+        """
+        Returns the largest position whose frames before it cost no
+        more than ``cost``
+        """
+        index = bisect_right(self.totals, cost) - 1
+        if index < 0:
+            return 0
+        end = self.positions[index + 1] if index + 1 < len(self.positions) \
+            else self.length
+        if not self.costs[index]:
+            return end
+        position = self.positions[index] + int(
+            (cost - self.totals[index]) // self.costs[index])
+        return min(position, end)
+
+
+def chunk_frames(frames, size=None, count=None, max_cost=None, cost=None):
+    """
+    Splits ``frames`` into batches for tasks and yields each one as a
+    :class:`FrameSet`.  Batches are produced lazily, only the runs in a
+    batch are built so the time and memory needed doesn't depend on the
+    number of frames in the job.  Exactly one of ``size``, ``count`` or
+    ``max_cost`` must be provided:
+
+        * ``size`` - batches of ``size`` frames, the last may be smaller
+        * ``count`` - ``count`` batches with the same number of frames,
+          or the same cost if ``cost`` is provided, give or take a frame
+        * ``max_cost`` - as many frames in each batch as possible without
+          the batch costing more than ``max_cost``.  A frame which costs
+          more than ``max_cost`` on its own is a batch by itself.
+
+    >>> [str(batch) for batch in chunk_frames("1-10x2,20-22", size=3)]
+    ['1-5x2', '7,9,20', '21-22']
+    >>> cost = FrameCost({"1-10": 3.0})
+    >>> [str(batch) for batch in chunk_frames("1-20", count=2, cost=cost)]
+    ['1-7', '8-20']
+
+    :param frames:
+        The frames to split, anything :class:`FrameSet` accepts
+
+    :param cost:
+        The cost of each frame, either a :class:`FrameCost` or a function
+        which takes a frame and returns its cost.  A function is called
+        for every frame, a :class:`FrameCost` works with runs of frames
+        instead.  Without ``cost`` every frame costs 1.
+
+    :raises ValueError:
+        Raised if the arguments are invalid
+    """
+    if sum(value is not None for value in (size, count, max_cost)) != 1:
+        raise ValueError(
+            "exactly one of `size`, `count` or `max_cost` is required")
+    elif size is not None and cost is not None:
+        raise ValueError("`cost` can't be used with `size`")
+    for name, value in (("size", size), ("count", count),
+                        ("max_cost", max_cost)):
+        if value is not None and value <= 0:
+            raise ValueError("`%s` must be greater than zero" % name)
+
+    if not isinstance(frames, FrameSet):
+        frames = FrameSet(frames)
+    length = len(frames)
+
+    if cost is None:
+        cost = FrameCost()
+    if size is not None:
+        boundaries = range_(size, length + size, size)
+    elif isinstance(cost, FrameCost):
+        boundaries = _cost_boundaries(
+            _CumulativeCost(cost.segments(frames), length), count, max_cost)
+    else:
+        boundaries = _callable_cost_boundaries(frames, cost, count, max_cost)
+
+    start = 0
+    for end in boundaries:
+        end = min(end, length)
+        if end > start:
+            yield frames[start:end]
+            start = end
+        if start >= length:
+            break
+
+
+def _cost_boundaries(cumulative, count, max_cost):
+    """Yields the end position of each batch for a :class:`FrameCost`"""
+    length = cumulative.length
+    if count is not None:
+        if not cumulative.total:
+            for index in range_(1, count + 1):
+                yield length * index // count
+            return
+
+        previous = 0
+        for index in range_(1, count):
+            target = cumulative.total * index / count
+            position = cumulative.position(target)
+            # Use whichever side of the target is closer
+            if position < length and (
+                    cumulative.at(position + 1) - target <=
+                    target - cumulative.at(position)):
+                position += 1
+            position = max(position, previous)
+            yield position
+            previous = position
+        yield length
+        return
+
+    position = 0
+    while position < length:
+        end = cumulative.position(cumulative.at(position) + max_cost)
+        position = max(end, position + 1)
+        yield position
+
+
+def _callable_cost_boundaries(frames, cost, count, max_cost):
+    """Yields the end position of each batch for a cost function"""
+    if count is not None:
+        total = sum(cost(frame) for frame in frames)
+        if not total:
+            for index in range_(1, count + 1):
+                yield len(frames) * index // count
+            return
+        target = 1
+    else:
+        target = None
+
+    spent = 0
+    for position, frame in enumerate(frames):
+        frame_cost = cost(frame)
+        if target is not None:
+            spent += frame_cost
+            while target < count and \
+                    spent - frame_cost / 2 > total * target / count:
+                # The target is closer to the start of this frame
+                target += 1
+                yield position
+        elif spent + frame_cost > max_cost and position:
+            spent = frame_cost
+            yield position
+        else:
+            spent += frame_cost
+    yield len(frames)
+
+
+ConversionResult = namedtuple("ConversionResult", ("values", "errors"))
+
+# Returned by the functions below for a value which can't be converted
+_CONVERSION_ERROR = object()
+
+_BOOL_CODES = dict.fromkeys(BOOLEAN_FALSE, 0)
+_BOOL_CODES.update(dict.fromkeys(BOOLEAN_TRUE, 1))
+
+# numpy types for the array.array typecodes used by the batch conversions
+_CONVERSION_DTYPES = {"b": "bool", "q": "int64", "d": "float64"}
+
+
+def _lookup_code(table, value):
+    """
+    Returns the code for ``value`` in ``table``, strings are normalized
+    the same way :meth:`convert.bool` and :meth:`convert.none` do
+    """
+    if isinstance(value, STRING_TYPES):
+        value = value.lower().strip()
+    try:
+        return table.get(value, _CONVERSION_ERROR)
+    except TypeError:  # unhashable
+        return _CONVERSION_ERROR
+
+
+def _bool_code(value):
+    return _lookup_code(_BOOL_CODES, value)
+
+
+def _none_code(value, codes=dict.fromkeys(NONE, 1)):
+    return _lookup_code(codes, value)
+
+
+def _number(value, types):
+    if isinstance(value, types):
+        return value
+    elif not isinstance(value, STRING_TYPES):
+        return _CONVERSION_ERROR
+    try:
+        value = literal_eval(value)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RuntimeError):
+        return _CONVERSION_ERROR
+    return value if isinstance(value, types) else _CONVERSION_ERROR
+
+
+def _number_typecode(numbers):
+    """
+    Returns the :class:`array.array` typecode which can hold all of
+    ``numbers`` or None if a list is required
+    """
+    typecode = "q"
+    for number in numbers:
+        if isinstance(number, INTEGER_TYPES) and not isinstance(number, bool):
+            if not -0x8000000000000000 <= number <= 0x7fffffffffffffff:
+                return None
+        elif isinstance(number, float):
+            typecode = "d"
+        elif not isinstance(number, bool):
+            return None
+    return typecode
+
+
+# Code used for an entry which failed to convert while building a
+# single byte result and tables for bytes.translate() to replace it
+# or to find it.
+_BYTE_ERROR = 2
+_CLEAR_BYTE_ERROR = bytearray(range_(256))
+_CLEAR_BYTE_ERROR[_BYTE_ERROR] = 0
+_CLEAR_BYTE_ERROR = bytes(_CLEAR_BYTE_ERROR)
+_FIND_BYTE_ERROR = bytearray(256)
+_FIND_BYTE_ERROR[_BYTE_ERROR] = 1
+_FIND_BYTE_ERROR = bytes(_FIND_BYTE_ERROR)
+
+
+def _flagged(flags):
+    """Returns the indexes of the non-zero bytes in ``flags``"""
+    return list(compress(range_(len(flags)), flags))
+
+
+def _convert_column(values, convert_one, typecode, default):
+    """
+    Converts every entry in ``values`` with ``convert_one`` which is
+    only called once for each distinct value.  Returns a
+    :class:`ConversionResult` whose values are an :class:`array.array`,
+    or :class:`numpy.ndarray` if ``values`` was one, of ``typecode``.
+    ``typecode`` may also be a function which picks the typecode from the
+    distinct results or returns None if the results must be a list.
+    Entries which could not be converted are replaced by ``default``.
+
+    Every pass over ``values`` is made by C code, :func:`map` with a
+    lookup table of the distinct results, so the Python code here only
+    runs once per distinct value and once per error.
+    """
+    # numpy is not imported here unless something else already has,
+    # if it's not imported then `values` can't be an array.
+    numpy = sys.modules.get("numpy")
+    to_numpy = numpy is not None and isinstance(values, numpy.ndarray)
+    if to_numpy:
+        values = values.tolist()
+    elif not isinstance(values, (list, tuple)):
+        values = list(values)
+
+    errors = []
+    keys = values
+    keyed = False
+    try:
+        distinct = set(values)
+    except TypeError:
+        # Unhashable values, each one has to be converted
+        converted = []
+        for index, value in enumerate(values):
+            result = convert_one(value)
+            if result is _CONVERSION_ERROR:
+                errors.append(index)
+                result = default
+            converted.append(result)
+        distinct = None
+        results = converted
+    else:
+        # Values which are equal but of different types, such as 1, 1.0
+        # and True, may not convert to the same result so they're paired
+        # with their type.  Strings are never equal to the other types
+        # so this is only needed if there's more than one other type.
+        if set(map(type, distinct)).difference(STRING_TYPES) and len(
+                set(map(type, values)).difference(STRING_TYPES)) > 1:
+            keyed = True
+            keys = list(zip(map(type, values), values))
+            distinct = set(keys)
+
+        table = {}
+        failed = []
+        for key in distinct:
+            result = convert_one(key[1] if keyed else key)
+            if result is _CONVERSION_ERROR:
+                failed.append(key)
+                result = default
+            table[key] = result
+        results = table.values()
+
+    if callable(typecode):
+        typecode = typecode(results)
+
+    if distinct is None:
+        pass
+    elif typecode == "b":
+        # Failures are given their own code so they can be found
+        # in the same pass which builds the result.
+        for key in failed:
+            table[key] = _BYTE_ERROR
+        converted = bytearray(map(table.__getitem__, keys))
+        if failed:
+            errors = _flagged(converted.translate(_FIND_BYTE_ERROR))
+            converted = converted.translate(_CLEAR_BYTE_ERROR)
+    else:
+        if failed:
+            errors = _flagged(bytearray(map(
+                dict.fromkeys(failed, 1).get, keys, repeat(0, len(keys)))))
+        converted = list(map(table.__getitem__, keys))
+
+    if typecode is None:
+        if not isinstance(converted, list):  # pragma: no cover
+            converted = list(converted)
+    elif to_numpy:
+        converted = numpy.frombuffer(
+            array(typecode, converted)
+            if typecode != "b" else bytes(converted),
+            dtype=_CONVERSION_DTYPES[typecode])
+    elif typecode == "b":
+        converted = array("b", bytes(converted))
+    else:
+        result = array(typecode)
+        result.fromlist(converted)
+        converted = result
+
+    return ConversionResult(converted, errors)
 
 
 class convert(object):
@@ -258,3 +2528,84 @@ class convert(object):
             value = list(value)
 
         return value
+
+    @staticmethod
+    def bools(values):
+        """
+        Converts every entry in ``values`` to a boolean like :meth:`bool`
+        does.  Instead of raising an exception the index of any entry
+        which can't be converted is recorded and False is used in its
+        place.  Each distinct value is only converted once so this is
+        much faster than calling :meth:`bool` for every row of a large
+        column.
+
+        >>> values, errors = convert.bools(["yes", "n", "yes", "maybe"])
+        >>> list(values), errors
+        ([1, 0, 1, 0], [3])
+
+        :param values:
+            An iterable or :class:`numpy.ndarray` of values to convert
+
+        :return:
+            A :class:`ConversionResult` whose ``values`` are an
+            :class:`array.array` of 0 or 1, or a boolean
+            :class:`numpy.ndarray` if ``values`` was an array, and whose
+            ``errors`` are the indexes which could not be converted
+        """
+        return _convert_column(values, _bool_code, "b", 0)
+
+    @staticmethod
+    def nones(values):
+        """
+        Checks every entry in ``values`` against
+        :const:`pyfarm.core.enums.NONE` like :meth:`none` does.  The
+        result's ``values`` are 1 for entries which represent ``None`` and
+        0 for anything else, the index of which is also recorded in
+        ``errors``.
+
+        >>> values, errors = convert.nones(["null", "", "foo"])
+        >>> list(values), errors
+        ([1, 1, 0], [2])
+        """
+        return _convert_column(values, _none_code, "b", 0)
+
+    @staticmethod
+    def stons(values, types=NUMERIC_TYPES):
+        """
+        Converts every entry in ``values`` to a number like :meth:`ston`
+        does.  The result's ``values`` are an :class:`array.array` of
+        64 bit integers if every value is an integer in that range,
+        doubles if there are also floats or otherwise a list.  Entries
+        which can't be converted are replaced by 0 and their indexes are
+        recorded in ``errors``.
+
+        >>> values, errors = convert.stons(["1", 2, "1.5", "foo"])
+        >>> values, errors
+        (array('d', [1.0, 2.0, 1.5, 0.0]), [3])
+        """
+        def number(value):
+            return _number(value, types)
+        return _convert_column(values, number, _number_typecode, 0)
+
+    @staticmethod
+    def lists(values, sep=",", strip=True, filter_empty=True):
+        """
+        Splits every entry in ``values`` like :meth:`list` does.  The
+        result's ``values`` are a list of tuples rather than lists so
+        repeated entries can share a single result.  Entries which are
+        not strings are replaced by an empty tuple and their indexes are
+        recorded in ``errors``.
+
+        >>> values, errors = convert.lists(["a, b", None])
+        >>> values, errors
+        ([('a', 'b'), ()], [1])
+        """
+        if not isinstance(sep, STRING_TYPES):
+            raise TypeError("Expected a string for `sep`")
+
+        def split(value):
+            if not isinstance(value, STRING_TYPES):
+                return _CONVERSION_ERROR
+            return tuple(convert.list(
+                value, sep=sep, strip=strip, filter_empty=filter_empty))
+        return _convert_column(values, split, None, ())
@@ -0,0 +1,523 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Work Queue
+==========
+
+Orders queued tasks for dispatch.  Tasks are kept in an
+:class:`IndexedHeap` per job, ordered by priority and then by the time
+they were queued, and the jobs are kept in a second heap ordered by
+their best task so finding the next task, changing a task's priority or
+state and removing a task are all ``O(log n)``.
+
+Only queued tasks, those with a state of ``None`` or
+:const:`pyfarm.core.rollup.QUEUED`, can be dispatched.  Tasks in any
+:const:`pyfarm.core.enums.WorkState` are still tracked by the queue but
+are excluded from dispatch until they are queued again.
+"""
+
+from __future__ import division
+
+import time
+from heapq import heapify
+from itertools import count
+
+from pyfarm.core.enums import Values, DBWorkState, _WorkState
+from pyfarm.core.rollup import QUEUED
+
+# Maps each form a task state may be provided in to the value
+# stored by WorkQueue, None for queued or a DBWorkState code.
+_STATES = {None: None, QUEUED: None}
+for _value in _WorkState:
+    _STATES[_value.int] = _STATES[_value.str] = _value.int
+del _value
+
+
+class IndexedHeap(object):
+    """
+    A binary min-heap of items ordered by a key which also tracks the
+    position of each item so an item's key can be changed, or the item
+    removed, in ``O(log n)`` without searching for it.  Items with the
+    same key come out in the order they were added, the items themselves
+    are never compared.
+
+    >>> heap = IndexedHeap([("a", 3), ("b", 1), ("c", 2)])
+    >>> heap.update("a", 0)
+    >>> heap.remove("c")
+    2
+    >>> heap.pop()
+    ('a', 0)
+
+    :param items:
+        Initial ``(item, key)`` pairs
+    """
+    def __init__(self, items=()):
+        # Each entry is (key, sequence, item), the sequence breaks ties
+        # between equal keys in the order items were added.
+        self._heap = []
+        self._index = {}
+        self._sequence = count()
+        self.extend(items)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __bool__(self):
+        return bool(self._heap)
+
+    __nonzero__ = __bool__
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __iter__(self):
+        """Iterates over the items in no particular order"""
+        return iter(self._index)
+
+    def _sift_up(self, pos):
+        heap = self._heap
+        index = self._index
+        entry = heap[pos]
+        while pos:
+            parent = (pos - 1) >> 1
+            other = heap[parent]
+            if entry < other:
+                heap[pos] = other
+                index[other[2]] = pos
+                pos = parent
+            else:
+                break
+        heap[pos] = entry
+        index[entry[2]] = pos
+
+    def _sift_down(self, pos):
+        heap = self._heap
+        index = self._index
+        end = len(heap)
+        entry = heap[pos]
+        child = 2 * pos + 1
+        while child < end:
+            right = child + 1
+            if right < end and heap[right] < heap[child]:
+                child = right
+            other = heap[child]
+            if other < entry:
+                heap[pos] = other
+                index[other[2]] = pos
+                pos = child
+                child = 2 * pos + 1
+            else:
+                break
+        heap[pos] = entry
+        index[entry[2]] = pos
+
+    def _fix(self, pos):
+        heap = self._heap
+        if pos and heap[pos] < heap[(pos - 1) >> 1]:
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def push(self, item, key):
+        """
+        Adds ``item`` to the heap
+
+        :raises ValueError:
+            Raised if ``item`` is already in the heap
+        """
+        if item in self._index:
+            raise ValueError("%r is already in the heap" % (item, ))
+        self._heap.append((key, next(self._sequence), item))
+        self._sift_up(len(self._heap) - 1)
+
+    def extend(self, items):
+        """
+        Adds many ``(item, key)`` pairs at once.  When the number of new
+        items is large compared to the heap it's rebuilt in ``O(n)``
+        instead of pushing each item.
+
+        :raises ValueError:
+            Raised if any item is already in the heap, nothing is added
+            if this is raised
+        """
+        sequence = self._sequence
+        entries = [(key, next(sequence), item) for item, key in items]
+        index = self._index
+        added = set()
+        for _, _, item in entries:
+            if item in index or item in added:
+                raise ValueError("%r is already in the heap" % (item, ))
+            added.add(item)
+
+        heap = self._heap
+        if len(entries) * 4 < len(heap):
+            for entry in entries:
+                heap.append(entry)
+                self._sift_up(len(heap) - 1)
+        else:
+            heap.extend(entries)
+            heapify(heap)
+            self._index = dict(
+                (entry[2], pos) for pos, entry in enumerate(heap))
+
+    def peek(self):
+        """
+        Returns the ``(item, key)`` with the smallest key without
+        removing it
+
+        :raises IndexError:
+            Raised if the heap is empty
+        """
+        key, _, item = self._heap[0]
+        return item, key
+
+    def pop(self):
+        """
+        Removes and returns the ``(item, key)`` with the smallest key
+
+        :raises IndexError:
+            Raised if the heap is empty
+        """
+        heap = self._heap
+        last = heap.pop()
+        if heap:
+            key, _, item = heap[0]
+            heap[0] = last
+            self._sift_down(0)
+        else:
+            key, _, item = last
+        del self._index[item]
+        return item, key
+
+    def key(self, item):
+        """Returns the key for ``item``"""
+        return self._heap[self._index[item]][0]
+
+    def update(self, item, key):
+        """
+        Changes the key for ``item``
+
+        :raises KeyError:
+            Raised if ``item`` is not in the heap
+        """
+        pos = self._index[item]
+        self._heap[pos] = (key, self._heap[pos][1], item)
+        self._fix(pos)
+
+    def remove(self, item):
+        """
+        Removes ``item`` from the heap and returns its key
+
+        :raises KeyError:
+            Raised if ``item`` is not in the heap
+        """
+        pos = self._index.pop(item)
+        heap = self._heap
+        key = heap[pos][0]
+        last = heap.pop()
+        if pos < len(heap):
+            heap[pos] = last
+            self._fix(pos)
+        return key
+
+
+class WorkQueue(object):
+    """
+    Tracks tasks and their states and hands out queued tasks in order of
+    priority, highest first, and then by the time they were queued.
+
+    When ``fair_share`` is enabled, jobs whose best tasks have the same
+    priority share the dispatcher by the number of their tasks which are
+    running, divided by the job's weight, so one large job can't hold
+    back the other jobs at its priority.  Otherwise tasks are handed out
+    strictly by priority and age.
+
+    >>> from pyfarm.core.enums import WorkState
+    >>> queue = WorkQueue(fair_share=False)
+    >>> queue.push("a", job_id=1, priority=5, queued_at=2)
+    >>> queue.push("b", job_id=2, priority=5, queued_at=1)
+    >>> queue.update("b", state=WorkState.PAUSED)
+    >>> queue.pop()
+    ('a', 1)
+    >>> len(queue)
+    0
+
+    :param bool fair_share:
+        If True share dispatch between jobs of the same priority
+
+    :param clock:
+        Callable which returns the time a task was queued at when the
+        time is not provided to :meth:`push`.  Defaults to
+        :func:`time.time`.
+    """
+    def __init__(self, fair_share=True, clock=time.time):
+        self.fair_share = fair_share
+        self.clock = clock
+        self._jobs = IndexedHeap()
+        self._job_tasks = {}
+        self._running = {}
+        self._weights = {}
+        self._queued = 0
+
+        # task id -> [job id, priority, queued at, sequence, state]
+        self._tasks = {}
+        self._sequence = count()
+
+    def __len__(self):
+        """Returns the number of tasks which can be dispatched"""
+        return self._queued
+
+    def __contains__(self, task_id):
+        return task_id in self._tasks
+
+    def _state(self, state):
+        if isinstance(state, Values):
+            state = state.int
+        try:
+            return _STATES[state]
+        except (KeyError, TypeError):
+            raise ValueError("%r is not a valid task state" % (state, ))
+
+    def _task_key(self, task):
+        return -task[1], task[2], task[3]
+
+    def _refresh_job(self, job_id):
+        """Updates the position of ``job_id`` from its best task"""
+        tasks = self._job_tasks.get(job_id)
+        if not tasks:
+            if job_id in self._jobs:
+                self._jobs.remove(job_id)
+            return
+
+        key = tasks.peek()[1]
+        if self.fair_share:
+            share = self._running.get(job_id, 0) / self._weights.get(job_id, 1)
+            key = (key[0], share) + key[1:]
+
+        if job_id in self._jobs:
+            self._jobs.update(job_id, key)
+        else:
+            self._jobs.push(job_id, key)
+
+    def _enqueue(self, task_id, task):
+        job_id = task[0]
+        try:
+            tasks = self._job_tasks[job_id]
+        except KeyError:
+            tasks = self._job_tasks[job_id] = IndexedHeap()
+        tasks.push(task_id, self._task_key(task))
+        self._queued += 1
+
+    def _dequeue(self, task_id, task):
+        job_id = task[0]
+        tasks = self._job_tasks[job_id]
+        tasks.remove(task_id)
+        self._queued -= 1
+        if not tasks:
+            del self._job_tasks[job_id]
+
+    def _adjust_running(self, job_id, delta):
+        running = self._running.get(job_id, 0) + delta
+        if running:
+            self._running[job_id] = running
+        else:
+            self._running.pop(job_id, None)
+
+    def _new_task(self, task_id, job_id, priority=0, queued_at=None,
+                  state=None):
+        if task_id in self._tasks:
+            raise ValueError("task %r is already in the queue" % (task_id, ))
+        if queued_at is None:
+            queued_at = self.clock()
+        task = [job_id, priority, queued_at, next(self._sequence),
+                self._state(state)]
+        return task
+
+    def push(self, task_id, job_id, priority=0, queued_at=None, state=None):
+        """
+        Adds a task to the queue.  Tasks which are not queued are tracked
+        but won't be dispatched until :meth:`update` queues them.
+
+        :param task_id:
+            Unique id of the task
+
+        :param job_id:
+            The job the task belongs to
+
+        :param int priority:
+            The task's priority, higher values are dispatched first.  This
+            is usually the priority of the job.
+
+        :param queued_at:
+            The time the task was queued, older tasks are dispatched first
+            among tasks of the same priority
+
+        :param state:
+            The task's :const:`pyfarm.core.enums.WorkState`, or ``None``
+            if it's queued
+
+        :raises ValueError:
+            Raised if ``task_id`` is already in the queue or ``state`` is
+            not a valid state
+        """
+        task = self._new_task(task_id, job_id, priority, queued_at, state)
+        self._tasks[task_id] = task
+        if task[4] is None:
+            self._enqueue(task_id, task)
+            self._refresh_job(job_id)
+        elif task[4] == DBWorkState.RUNNING:
+            self._adjust_running(job_id, 1)
+            self._refresh_job(job_id)
+
+    def extend(self, tasks):
+        """
+        Adds many tasks at once, each given as a tuple of the arguments to
+        :meth:`push`.  This is much faster than calling :meth:`push` for
+        each task when adding a large number of tasks.
+
+        :raises ValueError:
+            Raised if any task is already in the queue, appears more than
+            once or has an invalid state.  Nothing is added if this is
+            raised.
+        """
+        new_tasks = {}
+        for args in tasks:
+            task = self._new_task(*args)
+            if args[0] in new_tasks:
+                raise ValueError(
+                    "task %r is already in the queue" % (args[0], ))
+            new_tasks[args[0]] = task
+
+        by_job = {}
+        for task_id, task in new_tasks.items():
+            if task[4] is None:
+                by_job.setdefault(task[0], []).append(
+                    (task_id, self._task_key(task)))
+            elif task[4] == DBWorkState.RUNNING:
+                self._adjust_running(task[0], 1)
+                by_job.setdefault(task[0], [])
+
+        self._tasks.update(new_tasks)
+        for job_id, items in by_job.items():
+            if items:
+                try:
+                    self._job_tasks[job_id].extend(items)
+                except KeyError:
+                    self._job_tasks[job_id] = IndexedHeap(items)
+                self._queued += len(items)
+            self._refresh_job(job_id)
+
+    def update(self, task_id, priority=None, state=None, queued_at=None):
+        """
+        Changes the priority, state or queued time of a task.  Arguments
+        which are ``None`` are not changed, to queue a task again pass
+        :const:`pyfarm.core.rollup.QUEUED` as the ``state``.
+
+        :raises KeyError:
+            Raised if ``task_id`` is not in the queue
+
+        :raises ValueError:
+            Raised if ``state`` is not a valid state
+        """
+        task = self._tasks[task_id]
+        job_id = task[0]
+        old_state = task[4]
+        new_state = old_state if state is None else self._state(state)
+
+        if old_state is None:
+            self._dequeue(task_id, task)
+
+        if priority is not None:
+            task[1] = priority
+        if queued_at is not None:
+            task[2] = queued_at
+        task[4] = new_state
+
+        if old_state == DBWorkState.RUNNING and new_state != old_state:
+            self._adjust_running(job_id, -1)
+        elif new_state == DBWorkState.RUNNING and new_state != old_state:
+            self._adjust_running(job_id, 1)
+
+        if new_state is None:
+            self._enqueue(task_id, task)
+        self._refresh_job(job_id)
+
+    def remove(self, task_id):
+        """
+        Stops tracking ``task_id``
+
+        :raises KeyError:
+            Raised if ``task_id`` is not in the queue
+        """
+        task = self._tasks.pop(task_id)
+        if task[4] is None:
+            self._dequeue(task_id, task)
+        elif task[4] == DBWorkState.RUNNING:
+            self._adjust_running(task[0], -1)
+        self._refresh_job(task[0])
+
+    def state(self, task_id):
+        """
+        Returns the :const:`pyfarm.core.enums.DBWorkState` of ``task_id``
+        or ``None`` if it's queued
+        """
+        return self._tasks[task_id][4]
+
+    def set_weight(self, job_id, weight):
+        """
+        Sets the share of the dispatcher ``job_id`` receives relative to
+        other jobs of the same priority when ``fair_share`` is enabled.
+        The default weight is 1.
+        """
+        if weight <= 0:
+            raise ValueError("`weight` must be greater than zero")
+        self._weights[job_id] = weight
+        self._refresh_job(job_id)
+
+    def running(self, job_id):
+        """Returns the number of tasks in ``job_id`` which are running"""
+        return self._running.get(job_id, 0)
+
+    def peek(self):
+        """
+        Returns the ``(task_id, job_id)`` which :meth:`pop` would return
+        without changing anything
+
+        :raises IndexError:
+            Raised if there are no tasks which can be dispatched
+        """
+        if not self._jobs:
+            raise IndexError("no tasks can be dispatched")
+        job_id = self._jobs.peek()[0]
+        return self._job_tasks[job_id].peek()[0], job_id
+
+    def pop(self):
+        """
+        Returns the ``(task_id, job_id)`` of the next task to dispatch and
+        marks it as running.  Call :meth:`update` or :meth:`remove` once
+        the task stops running.
+
+        :raises IndexError:
+            Raised if there are no tasks which can be dispatched
+        """
+        task_id, job_id = self.peek()
+        self._dequeue(task_id, self._tasks[task_id])
+        self._tasks[task_id][4] = DBWorkState.RUNNING
+        self._adjust_running(job_id, 1)
+        self._refresh_job(job_id)
+        return task_id, job_id
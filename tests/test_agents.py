@@ -0,0 +1,240 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+from math import ceil
+
+from pyfarm.core.enums import (
+    PY26, AgentState, DBAgentState, OperatingSystem, DBOperatingSystem,
+    UseAgentAddress, DBUseAgentAddress, StateSet, _AgentState,
+    _UseAgentAddress)
+
+if PY26:
+    from unittest2 import TestCase
+else:
+    from unittest import TestCase
+
+from pyfarm.core.agents import AgentKey, AgentIndex, HeartbeatTracker
+
+
+class TestAgentIndex(TestCase):
+    def setUp(self):
+        self.index = AgentIndex()
+        self.index.add(
+            1, AgentState.ONLINE, OperatingSystem.LINUX, UseAgentAddress.REMOTE)
+        self.index.add(
+            2, DBAgentState.ONLINE, DBOperatingSystem.LINUX,
+            DBUseAgentAddress.PASSIVE)
+        self.index.add(
+            3, _AgentState.OFFLINE, OperatingSystem.WINDOWS,
+            UseAgentAddress.LOCAL)
+        self.index.add(
+            4, AgentState.RUNNING, OperatingSystem.LINUX,
+            UseAgentAddress.HOSTNAME)
+
+    def test_add(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertIn(1, self.index)
+        self.assertEqual(set(self.index), set([1, 2, 3, 4]))
+        self.assertEqual(
+            self.index.get(1),
+            AgentKey(DBAgentState.ONLINE, DBOperatingSystem.LINUX,
+                     DBUseAgentAddress.REMOTE))
+        self.assertIsNone(self.index.get(5))
+
+    def test_add_existing(self):
+        with self.assertRaises(ValueError):
+            self.index.add(1, "online", "linux", "remote")
+
+    def test_add_invalid(self):
+        with self.assertRaises(ValueError):
+            self.index.add(5, "done", "linux", "remote")
+        self.assertNotIn(5, self.index)
+
+    def test_query(self):
+        self.assertEqual(
+            self.index.query(state=AgentState.ONLINE), set([1, 2]))
+        self.assertEqual(
+            self.index.query(os=DBOperatingSystem.LINUX), set([1, 2, 4]))
+        self.assertEqual(
+            self.index.query(
+                state="online", os="linux",
+                address=~StateSet(_UseAgentAddress, ["passive"])),
+            set([1]))
+        self.assertEqual(
+            self.index.query(state=["online", "running"], os="linux"),
+            set([1, 2, 4]))
+        self.assertEqual(self.index.query(), set([1, 2, 3, 4]))
+        self.assertEqual(self.index.query(os="mac"), set())
+
+    def test_query_invalid(self):
+        with self.assertRaises(ValueError):
+            self.index.query(state="foo")
+
+    def test_iter_query(self):
+        self.assertEqual(
+            sorted(self.index.iter_query(state=AgentState.ONLINE)), [1, 2])
+
+    def test_update(self):
+        self.index.update(1, state=AgentState.RUNNING)
+        self.assertEqual(self.index.query(state="online"), set([2]))
+        self.assertEqual(self.index.query(state="running"), set([1, 4]))
+        self.assertEqual(self.index.get(1).os, DBOperatingSystem.LINUX)
+
+        self.index.update(3, os="bsd", address="passive")
+        self.assertEqual(self.index.query(os="windows"), set())
+        self.assertEqual(self.index.query(address="passive"), set([2, 3]))
+
+    def test_update_unchanged(self):
+        self.index.update(1, state="online")
+        self.assertEqual(self.index.counts("state")[DBAgentState.ONLINE], 2)
+
+    def test_update_missing(self):
+        with self.assertRaises(KeyError):
+            self.index.update(5, state="online")
+
+    def test_remove(self):
+        self.index.remove(3)
+        self.assertNotIn(3, self.index)
+        self.assertEqual(self.index.query(state="offline"), set())
+        self.assertEqual(self.index.counts("os"), {DBOperatingSystem.LINUX: 3})
+
+        with self.assertRaises(KeyError):
+            self.index.remove(3)
+
+    def test_count(self):
+        self.assertEqual(self.index.count(), 4)
+        self.assertEqual(self.index.count(state="online"), 2)
+        self.assertEqual(self.index.count(state="online", address="remote"), 1)
+        self.assertEqual(self.index.count(os=["windows", "linux"]), 4)
+        self.assertEqual(
+            self.index.count(state=["online", DBAgentState.ONLINE]), 2)
+        self.assertEqual(
+            self.index.count(state=["online", "online"], os=["linux"] * 3),
+            len(self.index.query(
+                state=["online", "online"], os=["linux"] * 3)))
+        self.assertEqual(
+            sorted(self.index.iter_query(state=["online", "online"])),
+            sorted(self.index.query(state="online")))
+
+    def test_counts(self):
+        self.assertEqual(
+            self.index.counts("state"),
+            {DBAgentState.ONLINE: 2, DBAgentState.OFFLINE: 1,
+             DBAgentState.RUNNING: 1})
+        self.index.update(4, state="online")
+        self.assertEqual(
+            self.index.counts("state"),
+            {DBAgentState.ONLINE: 3, DBAgentState.OFFLINE: 1})
+        self.assertEqual(
+            self.index.counts("address"),
+            {DBUseAgentAddress.REMOTE: 1, DBUseAgentAddress.PASSIVE: 1,
+             DBUseAgentAddress.LOCAL: 1, DBUseAgentAddress.HOSTNAME: 1})
+
+
+class TestHeartbeatTracker(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.tracker = HeartbeatTracker(
+            30, resolution=1, slots=4, levels=3, clock=lambda: self.now)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            HeartbeatTracker(30, slots=3)
+        with self.assertRaises(ValueError):
+            HeartbeatTracker(30, levels=0)
+
+    def test_expire(self):
+        self.tracker.heartbeat(1)
+        self.assertIn(1, self.tracker)
+        self.assertEqual(self.tracker.deadline(1), 1030)
+        self.now = 1029.9
+        self.assertEqual(self.tracker.expire(), [])
+        self.now = 1030
+        self.assertEqual(self.tracker.expire(), [1])
+        self.assertNotIn(1, self.tracker)
+        self.assertEqual(len(self.tracker), 0)
+
+    def test_heartbeat_extends_deadline(self):
+        self.tracker.heartbeat(1)
+        self.now = 1020
+        self.tracker.heartbeat(1)
+        self.now = 1040
+        self.assertEqual(self.tracker.expire(), [])
+        self.now = 1050
+        self.assertEqual(self.tracker.expire(), [1])
+
+    def test_batches(self):
+        batches = []
+        self.tracker.callback = batches.append
+        for agent_id in range(10):
+            self.tracker.heartbeat(agent_id, timeout=agent_id * 10)
+        self.now = 1045
+        self.assertEqual(sorted(self.tracker.expire()), [0, 1, 2, 3, 4])
+        self.assertEqual(self.tracker.expire(), [])
+        self.now = 2000
+        self.assertEqual(sorted(self.tracker.expire()), [5, 6, 7, 8, 9])
+        self.assertEqual(len(batches), 2)
+
+    def test_beyond_wheel(self):
+        # 3 levels of 4 slots only covers 64 ticks
+        self.tracker.heartbeat(1, timeout=500)
+        self.tracker.heartbeat(2, timeout=70)
+        self.now = 1069
+        self.assertEqual(self.tracker.expire(), [])
+        self.now = 1070
+        self.assertEqual(self.tracker.expire(), [2])
+        self.now = 1499
+        self.assertEqual(self.tracker.expire(), [])
+        self.now = 1500
+        self.assertEqual(self.tracker.expire(), [1])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        deadlines = {}
+        for _ in range(200):
+            self.now += rng.choice([0, 0.5, 1, 3, 17])
+            for _ in range(5):
+                agent_id = rng.randrange(50)
+                timeout = rng.choice([1, 5, 30, 100, 300])
+                self.tracker.heartbeat(agent_id, timeout=timeout)
+                # expiry is rounded up to the next tick
+                deadlines[agent_id] = ceil(self.now + timeout)
+            expected = set(
+                agent_id for agent_id, deadline in deadlines.items()
+                if deadline <= self.now)
+            for agent_id in expected:
+                del deadlines[agent_id]
+            self.assertEqual(set(self.tracker.expire()), expected)
+
+    def test_remove(self):
+        self.tracker.heartbeat(1)
+        self.tracker.remove(1)
+        self.now = 2000
+        self.assertEqual(self.tracker.expire(), [])
+        with self.assertRaises(KeyError):
+            self.tracker.remove(1)
+
+    def test_updates_index(self):
+        index = AgentIndex()
+        index.add(1, AgentState.ONLINE, OperatingSystem.LINUX,
+                  UseAgentAddress.REMOTE)
+        self.tracker.index = index
+        self.tracker.heartbeat(1)
+        self.tracker.heartbeat(2)
+        self.now = 1030
+        self.assertEqual(sorted(self.tracker.expire()), [1, 2])
+        self.assertEqual(index.get(1).state, DBAgentState.OFFLINE)
@@ -0,0 +1,121 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+from string import Template
+
+from pyfarm.core.enums import PY26
+
+if PY26:
+    from unittest2 import TestCase
+else:
+    from unittest import TestCase
+
+from pyfarm.core.commands import (
+    MAX_EXPANSION_RECURSION, CommandTemplate)
+from pyfarm.core.utility import FrameSet
+
+
+class TestCommandTemplate(TestCase):
+    def test_constants(self):
+        template = CommandTemplate("$a ${b}c $$a $ 100% $", {"a": 1, "b": "x"})
+        self.assertEqual(template.program, (("1 xc $a $ 100% $", ), ))
+        self.assertEqual(template.render(1), "1 xc $a $ 100% $")
+        self.assertEqual(
+            template.render_many([1, 2]), ["1 xc $a $ 100% $"] * 2)
+
+    def test_frame_variables(self):
+        template = CommandTemplate("-s $start -e $end -f ${frame}% $frame")
+        self.assertEqual(
+            template.program,
+            (("-s ", "start", " -e ", "end", " -f ", "frame", "% ", "frame"),
+             ))
+        self.assertEqual(
+            template.render(5, start=1, end=10), "-s 1 -e 10 -f 5% 5")
+        self.assertEqual(template.render(5), "-s 5 -e 5 -f 5% 5")
+        self.assertEqual(
+            template.render(start=1, end=10), "-s 1 -e 10 -f 1% 1")
+        self.assertEqual(
+            template.render_many(FrameSet("1-5x2")),
+            ["-s 1 -e 5 -f 1% 1", "-s 1 -e 5 -f 3% 3", "-s 1 -e 5 -f 5% 5"])
+        self.assertEqual(
+            template.render_many(iter([7, 8]), start=0),
+            ["-s 0 -e 8 -f 7% 7", "-s 0 -e 8 -f 8% 8"])
+        self.assertEqual(template.render_many([]), [])
+
+    def test_frame_variables_override_values(self):
+        template = CommandTemplate("$frame", {"frame": "x"})
+        self.assertEqual(template.render(1), "1")
+
+    def test_unresolved(self):
+        template = CommandTemplate("$a ${b} $c", {"c": "$d"})
+        self.assertEqual(template.unresolved, frozenset(["a", "b", "d"]))
+        self.assertEqual(template.render(1), "$a ${b} $d")
+
+    def test_recursive_values(self):
+        values = {"out": "$root/$shot/${shot}_$frame.exr",
+                  "root": "/shots", "shot": "a"}
+        template = CommandTemplate("render -o $out", values)
+        self.assertEqual(template.render(3), "render -o /shots/a/a_3.exr")
+
+    def test_recursion_limit(self):
+        template = CommandTemplate("$a", {"a": "$a"})
+        self.assertEqual(template.render(1), "$a")
+        self.assertEqual(template.unresolved, frozenset(["a"]))
+
+        values = dict(
+            ("v%d" % index, "$v%d" % (index + 1))
+            for index in range(MAX_EXPANSION_RECURSION))
+        values["v%d" % MAX_EXPANSION_RECURSION] = "done"
+        self.assertEqual(CommandTemplate("$v0", values).render(1), "$v10")
+        values.pop("v0")
+        self.assertEqual(CommandTemplate("$v1", values).render(1), "done")
+
+    def test_arguments(self):
+        template = CommandTemplate(
+            ("$exe", "-f", "$frame", "--range=$start-$end"), {"exe": "/bin/r"})
+        self.assertEqual(
+            template.render(2, start=1, end=3),
+            ["/bin/r", "-f", "2", "--range=1-3"])
+        self.assertEqual(
+            template.render_many([1, 2]),
+            [["/bin/r", "-f", "1", "--range=1-2"],
+             ["/bin/r", "-f", "2", "--range=1-2"]])
+        self.assertEqual(CommandTemplate([]).render(1), [])
+        self.assertEqual(
+            repr(CommandTemplate(["a"])), "CommandTemplate(['a'])")
+
+    def test_matches_safe_substitute(self):
+        random.seed(0)
+        pieces = ("$frame", "${start}", "$end", "$a", "${b}", "$missing",
+                  "$$", "$", "%", "%s", " ", "x", "-", "{", "}", "$1")
+        values = {"a": "A%", "b": 2}
+        for _ in range(500):
+            text = "".join(
+                random.choice(pieces)
+                for _ in range(random.randint(0, 12)))
+            template = CommandTemplate(text, values)
+            frames = random.sample(range(100), 3)
+            for frame in frames:
+                expected = Template(text).safe_substitute(
+                    values, frame=frame, start=frames[0], end=frames[-1])
+                self.assertEqual(
+                    template.render(frame, start=frames[0], end=frames[-1]),
+                    expected)
+            self.assertEqual(
+                template.render_many(frames),
+                [template.render(frame, frames[0], frames[-1])
+                 for frame in frames])
@@ -18,12 +18,18 @@ from __future__ import with_statement
 
 import os
 import tempfile
+import threading
 import uuid
 from textwrap import dedent
 from os.path import join, dirname, expandvars, expanduser
 
 from pkg_resources import get_distribution
 
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:  # pragma: no cover
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
 from pyfarm.core.enums import PY26, LINUX, MAC, WINDOWS
 from pyfarm.core.testutil import TestCase as BaseTestCase, requires_ci
 
@@ -34,7 +40,7 @@ else:
 
 from pyfarm.core.config import (
     read_env, read_env_number, read_env_bool, read_env_strict_number,
-    BOOLEAN_FALSE, BOOLEAN_TRUE, Configuration)
+    BOOLEAN_FALSE, BOOLEAN_TRUE, Configuration, HTTPConfigurationLayer)
 
 
 class TestConfigEnvironment(TestCase):
@@ -397,3 +403,248 @@ class TestConfigurationExpansion(BaseTestCase):
         self.assertEqual(config["path"], "foo/bar/%s" % envvalue1)
         self.assertEqual(config["home"], expanduser("~/foo"))
         self.assertEqual(config["envvar2_expand"], "envvar2")
+
+    def test_command_template(self):
+        envvar = "a" + uuid.uuid4().hex
+        os.environ[envvar] = "env"
+        config = Configuration("pyfarm.core")
+        config.update(
+            foo="foo", out="$temp/$foo.$frame", env={"render": "/bin/r"})
+        template = config.command_template(
+            "$render $%s -o $out -s $start -e $end" % envvar)
+        self.assertEqual(
+            template.render_many([1, 2]),
+            ["/bin/r env -o %s/foo.1 -s 1 -e 2" % config.tempdir,
+             "/bin/r env -o %s/foo.2 -s 1 -e 2" % config.tempdir])
+
+
+class ConfigurationServer(HTTPServer):
+    """Local stand-in for a configuration server"""
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), ConfigurationHandler)
+        self.payload = b"value: 1"
+        self.etag = '"1"'
+        self.requests = []
+
+        # Requests are only answered while this is set
+        self.respond = threading.Event()
+        self.respond.set()
+        self.thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s/agent.yml" % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ConfigurationHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        etag = self.headers.get("If-None-Match")
+        self.server.requests.append(etag)
+        self.server.respond.wait(5)
+
+        if etag is not None and etag == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(self.server.payload)))
+        self.end_headers()
+        self.wfile.write(self.server.payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPConfigurationLayer(BaseTestCase):
+    def setUp(self):
+        super(TestHTTPConfigurationLayer, self).setUp()
+        self.server = ConfigurationServer()
+        self.addCleanup(self.server.stop)
+
+    def test_cache_path(self):
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        self.assertEqual(dirname(layer.cache_path), self.tempdir)
+        self.assertEqual(layer.etag_path, layer.cache_path + ".etag")
+        self.assertNotEqual(
+            layer.cache_path,
+            HTTPConfigurationLayer(
+                self.server.url + "?a", self.tempdir).cache_path)
+
+    def test_fetch_stores_cache(self):
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        self.assertIsNone(layer.cached())
+        self.assertEqual(layer.fetch(), {"value": 1})
+        self.assertEqual(self.server.requests, [None])
+        self.assertEqual(layer.etag, '"1"')
+
+        with open(layer.cache_path, "rb") as stream:
+            self.assertEqual(stream.read(), b"value: 1")
+
+        with open(layer.etag_path, "rb") as stream:
+            self.assertEqual(stream.read(), b'"1"')
+
+    def test_fetch_not_modified(self):
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        layer.fetch()
+        self.assertIsNone(layer.fetch())
+        self.assertEqual(self.server.requests, [None, '"1"'])
+
+    def test_fetch_server_unavailable(self):
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        self.server.stop()
+        self.assertIsNone(layer.fetch())
+
+    def test_load_without_cache(self):
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        received = []
+        self.assertEqual(layer.load(callback=received.append), {"value": 1})
+        self.assertIsNone(layer.thread)
+        self.assertEqual(received, [{"value": 1}])
+
+    def test_load_from_cache_then_revalidate(self):
+        HTTPConfigurationLayer(self.server.url, self.tempdir).fetch()
+        self.server.payload = b"value: 2"
+        self.server.etag = '"2"'
+
+        # a new layer, as if the process was restarted
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        received = []
+        self.assertEqual(layer.load(callback=received.append), {"value": 1})
+        layer.thread.join(5)
+        self.assertEqual(self.server.requests, [None, '"1"'])
+        self.assertEqual(received, [{"value": 1}, {"value": 2}])
+        self.assertEqual(layer.cached(), {"value": 2})
+        self.assertEqual(layer.etag, '"2"')
+
+    def test_load_from_cache_unmodified(self):
+        HTTPConfigurationLayer(self.server.url, self.tempdir).fetch()
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        received = []
+        self.assertEqual(layer.load(callback=received.append), {"value": 1})
+        layer.thread.join(5)
+        self.assertEqual(received, [{"value": 1}])
+
+    def test_load_from_cache_server_unavailable(self):
+        HTTPConfigurationLayer(self.server.url, self.tempdir).fetch()
+        self.server.stop()
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        self.assertEqual(layer.load(revalidate=False), {"value": 1})
+        self.assertIsNone(layer.thread)
+
+    def test_invalid_payload_not_cached(self):
+        self.server.payload = b"- a\n- b"
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        self.assertIsNone(layer.fetch())
+        self.assertIsNone(layer.cached())
+
+    def test_unsafe_payload_rejected(self):
+        # with an unsafe loader this would call os.getpid()
+        self.server.payload = b"value: !!python/object/apply:os.getpid []"
+        layer = HTTPConfigurationLayer(self.server.url, self.tempdir)
+        self.assertIsNone(layer.fetch())
+        self.assertIsNone(layer.cached())
+
+        # nor is a payload written to the cache directly
+        with open(layer.cache_path, "wb") as stream:
+            stream.write(self.server.payload)
+        self.assertIsNone(layer.cached())
+
+    def test_configuration_load(self):
+        config = Configuration("agent", "1.2.3")
+        config.system_root = self.tempdir
+        config.user_root = None
+        config.local_dir = None
+        config.environment_root = None
+        config.tempdir = self.tempdir
+        self.server.payload = b"value: 1\nenv:\n    key: 1"
+        layer = config.add_http_layer(self.server.url)
+        self.assertEqual(config.layers, [layer])
+        environment = {}
+        config.load(environment=environment)
+        self.assertEqual(config["value"], 1)
+        self.assertEqual(environment, {"key": 1})
+        self.assertIn(self.server.url, config.loaded)
+
+    def test_configuration_refresh(self):
+        config = Configuration("agent", "1.2.3")
+        config.system_root = self.tempdir
+        config.user_root = None
+        config.local_dir = None
+        config.environment_root = None
+        config.tempdir = self.tempdir
+        layer = config.add_http_layer(self.server.url)
+        layer.fetch()
+        self.server.payload = b"value: 2\nenv:\n    key: 2"
+        self.server.etag = '"2"'
+
+        # the revalidation can't finish until load() has returned
+        self.server.respond.clear()
+        environment = {}
+        config.load(environment=environment)
+        self.assertEqual(config["value"], 1)
+        self.server.respond.set()
+        layer.thread.join(5)
+        self.assertEqual(layer.cached(), {"value": 2, "env": {"key": 2}})
+
+        # revalidated data is only applied by refresh()
+        self.assertEqual(config["value"], 1)
+        self.assertEqual(environment, {})
+        self.assertTrue(config.refresh())
+        self.assertEqual(config["value"], 2)
+        self.assertNotIn("env", config)
+        self.assertEqual(environment, {"key": 2})
+        self.assertFalse(config.refresh())
+
+    def test_configuration_refresh_layer_order(self):
+        upper = ConfigurationServer()
+        self.addCleanup(upper.stop)
+        upper.payload = b"value: 10\nupper: true"
+
+        config = Configuration("agent", "1.2.3")
+        config.system_root = self.tempdir
+        config.user_root = None
+        config.local_dir = None
+        config.environment_root = None
+        config.tempdir = self.tempdir
+        lower_layer = config.add_http_layer(self.server.url)
+        upper_layer = config.add_http_layer(upper.url)
+        lower_layer.fetch()
+        upper_layer.fetch()
+        self.server.payload = b"value: 2\nlower: 2"
+        self.server.etag = '"2"'
+
+        config.load(environment={})
+        self.assertEqual(config["value"], 10)
+        lower_layer.thread.join(5)
+        upper_layer.thread.join(5)
+
+        # the lower layer's new data does not override the upper layer
+        self.assertTrue(config.refresh())
+        self.assertEqual(config["value"], 10)
+        self.assertEqual(config["lower"], 2)
+        self.assertTrue(config["upper"])
+
+    def test_configuration_apply_copies(self):
+        config = Configuration("agent", "1.2.3")
+        data = {"value": 1, "env": {"key": 1}}
+        environment = {}
+        config._apply(data, environment=environment)
+        self.assertEqual(data, {"value": 1, "env": {"key": 1}})
+        self.assertEqual(environment, {"key": 1})
+        self.assertNotIn("env", config)
+
+    def test_configuration_environment_url(self):
+        os.environ[Configuration.DEFAULT_ENVIRONMENT_URL_VARIABLE] = \
+            self.server.url
+        config = Configuration("agent", "1.2.3")
+        self.assertEqual(len(config.layers), 1)
+        self.assertEqual(config.layers[0].url, self.server.url)
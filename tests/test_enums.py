@@ -31,7 +31,13 @@ from pyfarm.core.enums import (
     _OperatingSystem, _UseAgentAddress, DBUseAgentAddress,
     DBAgentState, DBOperatingSystem, DBWorkState, Enum,
     Values, cast_enum, LINUX, MAC, WINDOWS, BSD, BOOLEAN_TRUE, BOOLEAN_FALSE,
-    INTEGER_TYPES)
+    INTEGER_TYPES, StateSet, RUNNING_WORK_STATES, DB_RUNNING_WORK_STATES,
+    FAILED_WORK_STATES, DB_FAILED_WORK_STATES)
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
 
 class TestEnums(TestCase):
@@ -225,6 +231,71 @@ class TestEnums(TestCase):
         with self.assertRaises(TypeError):
             cast_enum(e, None)
 
+    def test_cast_enum_registry(self):
+        self.assertIs(cast_enum(_WorkState, str), WorkState)
+        self.assertIs(cast_enum(_WorkState, int), DBWorkState)
+        self.assertIs(cast_enum(_AgentState, int), cast_enum(_AgentState, int))
+        self.assertIsNot(cast_enum(_AgentState, int), DBWorkState)
+
+        # same members, different name
+        Values.check_uniqueness = False
+        a = cast_enum(Enum("a", A=Values(1, "A")), str)
+        b = cast_enum(Enum("b", A=Values(1, "A")), str)
+        self.assertIsNot(a, b)
+        self.assertIs(a, cast_enum(Enum("a", A=Values(1, "A")), str))
+
+    def test_lazy_cast_enums(self):
+        from pyfarm.core import enums
+        for name in enums._CAST_ENUMS:
+            self.assertIn(name, dir(enums))
+            self.assertIs(getattr(enums, name), enums.__getattr__(name))
+
+        with self.assertRaises(AttributeError):
+            enums.__getattr__("foo")
+
+    def test_star_import(self):
+        from pyfarm.core import enums
+        namespace = {}
+        exec("from pyfarm.core.enums import *", namespace)
+        for name in enums._CAST_ENUMS:
+            self.assertIs(namespace[name], getattr(enums, name))
+        for name in ("Enum", "Values", "WINDOWS", "RUNNING_WORK_STATES"):
+            self.assertIn(name, namespace)
+        self.assertNotIn("_WorkState", namespace)
+
+    def test_cast_enum_contains(self):
+        for value in _WorkState:
+            self.assertIn(value, WorkState)
+            self.assertIn(value.int, WorkState)
+            self.assertIn(value.str, WorkState)
+            self.assertIn(value, DBWorkState)
+
+        self.assertNotIn("foo", WorkState)
+        self.assertNotIn(42, DBWorkState)
+        self.assertNotIn([], WorkState)
+
+        # same string, different enum
+        self.assertIn("running", AgentState)
+        self.assertNotIn(_AgentState.RUNNING, WorkState)
+
+    def test_cast_enum_cast(self):
+        self.assertEqual(WorkState._cast(105), "running")
+        self.assertEqual(WorkState._cast("running"), "running")
+        self.assertEqual(DBWorkState._cast("running"), 105)
+        self.assertEqual(DBWorkState._cast(_WorkState.RUNNING), 105)
+        self.assertIs(DBWorkState._member("failed"), _WorkState.FAILED)
+        self.assertIs(WorkState._member(107), _WorkState.FAILED)
+
+        with self.assertRaises(ValueError):
+            WorkState._cast("foo")
+
+        with self.assertRaises(ValueError):
+            DBWorkState._member(_AgentState.RUNNING)
+
+    def test_cast_enum_no_instance_dict(self):
+        self.assertFalse(hasattr(WorkState, "__dict__"))
+        self.assertFalse(hasattr(DBWorkState, "__dict__"))
+
 
 class TestPythonVersion(TestCase):
     @skipUnless(sys.version_info[0:2] == (2, 6), "Not Python 2.6")
@@ -323,6 +394,11 @@ class TestEnumValueClass(TestCase):
         self.assertNotEqual(Values(1, "A"), Values(2, "B"))
         self.assertNotEqual(Values(1, "A"), "B")
         self.assertNotEqual(Values(1, "A"), 2)
+        self.assertFalse(Values(1, "A") != "A")
+        self.assertFalse(Values(1, "A") != 1)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(Values(1, "A"), "__dict__"))
 
     def test_greater(self):
         self.assertGreater(2, Values(1, "A"))
@@ -364,3 +440,126 @@ class TestEnumValueClass(TestCase):
 
     def test_convert_str(self):
         self.assertEqual(str(Values(1, "A")), "A")
+
+
+class TestStateSet(TestCase):
+    def setUp(self):
+        self.running = StateSet(_WorkState, [_WorkState.RUNNING])
+        self.failed = StateSet(_WorkState, ["failed"])
+        self.finished = StateSet(_WorkState, ["done", 107])
+
+    def test_work_state_sets(self):
+        self.assertEqual(set(RUNNING_WORK_STATES), set(["running"]))
+        self.assertEqual(set(DB_RUNNING_WORK_STATES), set([105]))
+        self.assertEqual(set(FAILED_WORK_STATES), set(["failed"]))
+        self.assertEqual(set(DB_FAILED_WORK_STATES), set([107]))
+        self.assertEqual(RUNNING_WORK_STATES, set([WorkState.RUNNING]))
+        self.assertEqual(DB_FAILED_WORK_STATES, set([DBWorkState.FAILED]))
+
+    def test_contains(self):
+        for state_set in (self.running, DB_RUNNING_WORK_STATES):
+            self.assertIn("running", state_set)
+            self.assertIn(105, state_set)
+            self.assertIn(_WorkState.RUNNING, state_set)
+            self.assertNotIn("done", state_set)
+            self.assertNotIn(106, state_set)
+            self.assertNotIn("foo", state_set)
+            self.assertNotIn([], state_set)
+
+    def test_invalid_state(self):
+        with self.assertRaises(ValueError):
+            StateSet(_WorkState, ["foo"])
+
+        with self.assertRaises(TypeError):
+            StateSet(_WorkState, [], float)
+
+    def test_iter_order(self):
+        states = StateSet(_WorkState, ["failed", "paused", "done"])
+        self.assertEqual(list(states), ["paused", "done", "failed"])
+        states = StateSet(_WorkState, ["failed", "paused", "done"], int)
+        self.assertEqual(list(states), [100, 106, 107])
+
+    def test_len_bool(self):
+        self.assertEqual(len(self.finished), 2)
+        self.assertEqual(len(StateSet(_WorkState)), 0)
+        self.assertTrue(self.running)
+        self.assertFalse(StateSet(_WorkState))
+
+    def test_set_operations(self):
+        self.assertEqual(
+            set(self.running | self.failed), set(["running", "failed"]))
+        self.assertEqual(set(self.finished & self.failed), set(["failed"]))
+        self.assertEqual(set(self.finished - self.failed), set(["done"]))
+        self.assertEqual(
+            set(self.finished ^ StateSet(_WorkState, ["done", "paused"])),
+            set(["failed", "paused"]))
+        self.assertEqual(set(~self.finished), set(["paused", "running"]))
+        self.assertEqual(set(self.running | ["paused"]), set(["running", "paused"]))
+        self.assertTrue(self.failed.issubset(self.finished))
+        self.assertTrue(self.finished.issuperset(["done"]))
+        self.assertFalse(self.running.issubset(self.finished))
+
+    def test_set_operations_reflected(self):
+        states = set(["running", "queued", 107])
+        self.assertEqual(
+            states | self.finished,
+            set(["running", "queued", 107, "done", "failed"]))
+        self.assertEqual(states & self.finished, set([107]))
+        self.assertEqual(states - self.finished, set(["running", "queued"]))
+        self.assertEqual(
+            states ^ self.finished, set(["running", "queued", "done"]))
+        result = frozenset(["running"]) | self.failed
+        self.assertIsInstance(result, frozenset)
+        self.assertEqual(result, frozenset(["running", "failed"]))
+        self.assertEqual(
+            set(["running"]) | RUNNING_WORK_STATES, set(RUNNING_WORK_STATES))
+        with self.assertRaises(TypeError):
+            ["running"] | self.running
+
+    def test_different_enums(self):
+        with self.assertRaises(TypeError):
+            self.running | StateSet(_AgentState, ["online"])
+
+    def test_equality_and_hash(self):
+        other = StateSet(_WorkState, ["running"])
+        self.assertEqual(self.running, other)
+        self.assertEqual(hash(self.running), hash(other))
+        self.assertNotEqual(self.running, self.failed)
+        self.assertNotEqual(
+            StateSet(_AgentState, ["offline"]), StateSet(_WorkState))
+        self.assertNotEqual(self.running, ["running"])
+        self.assertNotEqual(
+            self.running, StateSet(_WorkState, ["running"], int))
+        for state_set in (self.running, self.finished,
+                          StateSet(_WorkState, ["done"], int)):
+            self.assertEqual(state_set, frozenset(state_set))
+            self.assertEqual(hash(state_set), hash(frozenset(state_set)))
+
+    def test_isin(self):
+        self.assertEqual(
+            self.finished.isin([106, "done", "running", 42]),
+            [True, True, False, False])
+
+    @skipUnless(numpy is not None, "numpy is not installed")
+    def test_isin_numpy(self):
+        result = self.finished.isin(numpy.array([106, 107, 105, -1, 10 ** 6]))
+        self.assertEqual(result.tolist(), [True, True, False, False, False])
+
+    def test_sql_in(self):
+        self.assertEqual(self.finished.sql_in("state"), "state IN (106, 107)")
+        self.assertEqual(StateSet(_WorkState).sql_in("state"), "1 = 0")
+
+    def test_sql_mask(self):
+        self.assertEqual(
+            self.finished.sql_mask("state"),
+            "(state BETWEEN 100 AND 107 AND (192 >> (state - 100)) & 1 = 1)")
+
+    def test_sql_mask_wide_range(self):
+        Values.check_uniqueness = False
+        try:
+            enum = Enum("wide", A=Values(0, "a"), B=Values(100, "b"))
+        finally:
+            Values.check_uniqueness = True
+
+        with self.assertRaises(ValueError):
+            StateSet(enum, ["a"]).sql_mask("state")
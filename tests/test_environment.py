@@ -0,0 +1,139 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from pyfarm.core.enums import PY26
+
+if PY26:
+    from unittest2 import TestCase
+else:
+    from unittest import TestCase
+
+from pyfarm.core.environment import EnvironmentBuilder, merge_layer
+from pyfarm.core.utility import FrozenDict
+
+
+class TestMergeLayer(TestCase):
+    def test_merge(self):
+        base = FrozenDict({"A": "1", "B": "2"})
+        self.assertIs(merge_layer(base, None), base)
+        self.assertIs(merge_layer(base, {}), base)
+        self.assertEqual(
+            merge_layer(base, {"B": 3, "C": "c", "A": None}),
+            {"B": "3", "C": "c"})
+        self.assertEqual(merge_layer(base, [("A", "x")]), {"A": "x", "B": "2"})
+        self.assertEqual(base, {"A": "1", "B": "2"})
+
+
+class TestEnvironmentBuilder(TestCase):
+    def setUp(self):
+        self.builder = EnvironmentBuilder(
+            {"PATH": "/bin", "USER": "agent", "HOME": "/home/agent"},
+            {"RENDERER": "arnold", "THREADS": 8})
+        self.builder.set_job(1, {"SHOT": "sh010", "HOME": None})
+
+    def test_default_layers(self):
+        builder = EnvironmentBuilder()
+        builder.set_job(1)
+        self.assertEqual(builder.environ(1), dict(os.environ))
+
+    def test_environment(self):
+        expected = {"PATH": "/bin", "USER": "agent", "RENDERER": "arnold",
+                    "THREADS": "8", "SHOT": "sh010"}
+        self.assertEqual(self.builder.environment(1), expected)
+        expected.update(FRAME="5")
+        del expected["USER"]
+        self.assertEqual(
+            self.builder.environment(1, {"FRAME": 5, "USER": None}), expected)
+
+    def test_shared(self):
+        first = self.builder.environment(1)
+        self.assertIs(self.builder.environment(1), first)
+        self.assertIs(self.builder.environment(1, {}), first)
+        task = self.builder.environment(1, {"FRAME": "1"})
+        self.assertNotIn("FRAME", first)
+        self.assertEqual(task.delete("FRAME"), first)
+
+    def test_environ(self):
+        environ = self.builder.environ(1, {"FRAME": 1, "PATH": None})
+        self.assertEqual(
+            environ,
+            {"USER": "agent", "RENDERER": "arnold", "THREADS": "8",
+             "SHOT": "sh010", "FRAME": "1"})
+        environ["OTHER"] = "x"
+        self.assertNotIn("OTHER", self.builder.environ(1))
+        self.assertIsNot(self.builder.environ(1), self.builder.environ(1))
+
+    def test_envp(self):
+        self.assertEqual(
+            sorted(self.builder.envp(1)),
+            ["PATH=/bin", "RENDERER=arnold", "SHOT=sh010", "THREADS=8",
+             "USER=agent"])
+        self.assertEqual(
+            sorted(self.builder.envp(1, {"SHOT": "sh020", "USER": None})),
+            ["PATH=/bin", "RENDERER=arnold", "SHOT=sh020", "THREADS=8"])
+        first, second = self.builder.envp(1), self.builder.envp(1)
+        self.assertIsNot(first, second)
+        self.assertTrue(all(a is b for a, b in zip(first, second)))
+
+    def test_duplicate_overrides(self):
+        for overrides, expected in (
+                ([("SHOT", "a"), ("SHOT", "b")], "b"),
+                ([("SHOT", "a"), ("SHOT", None)], None),
+                ([("SHOT", None), ("SHOT", "c")], "c")):
+            self.assertEqual(
+                self.builder.environment(1, overrides).get("SHOT"), expected)
+            self.assertEqual(
+                self.builder.environ(1, overrides).get("SHOT"), expected)
+            envp = self.builder.envp(1, overrides)
+            self.assertEqual(
+                [entry for entry in envp if entry.startswith("SHOT=")],
+                [] if expected is None else ["SHOT=%s" % expected])
+            self.assertEqual(
+                sorted(envp),
+                sorted("%s=%s" % item for item in
+                       self.builder.environ(1, overrides).items()))
+
+    def test_set_layers(self):
+        first = self.builder.environment(1)
+        generation = self.builder.generation
+        self.builder.set_layers({"PATH": "/usr/bin"})
+        self.assertEqual(self.builder.generation, generation + 1)
+        self.assertEqual(self.builder.environment(1), {
+            "PATH": "/usr/bin", "SHOT": "sh010"})
+        self.assertEqual(self.builder.environ(1), {
+            "PATH": "/usr/bin", "SHOT": "sh010"})
+        self.assertEqual(
+            sorted(self.builder.envp(1)), ["PATH=/usr/bin", "SHOT=sh010"])
+        self.assertNotEqual(first, self.builder.environment(1))
+
+    def test_set_job(self):
+        self.builder.environ(1)
+        self.builder.set_job(1, {"SHOT": "sh020"})
+        self.assertEqual(self.builder.environ(1)["SHOT"], "sh020")
+        self.assertEqual(self.builder.environment(1)["HOME"], "/home/agent")
+
+    def test_jobs(self):
+        self.assertIn(1, self.builder)
+        self.assertEqual(len(self.builder), 1)
+        self.builder.discard_job(1)
+        self.builder.discard_job(1)
+        self.assertNotIn(1, self.builder)
+        for method in (self.builder.environment, self.builder.environ,
+                       self.builder.envp):
+            with self.assertRaises(KeyError):
+                method(1)
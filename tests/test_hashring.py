@@ -0,0 +1,147 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import random
+
+from pyfarm.core.enums import PY26
+
+if PY26:
+    from unittest2 import TestCase, skipIf
+else:
+    from unittest import TestCase, skipIf
+
+from pyfarm.core.hashring import HashRing, key_hash, numpy
+
+JOBS = list(range(20000))
+
+
+class TestHashRing(TestCase):
+    def setUp(self):
+        self.ring = HashRing(["master%d" % index for index in range(5)])
+
+    def test_empty(self):
+        ring = HashRing()
+        self.assertEqual(len(ring), 0)
+        with self.assertRaises(ValueError):
+            ring.get(1)
+        with self.assertRaises(ValueError):
+            ring.get_many([1])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            HashRing(replicas=0)
+        with self.assertRaises(ValueError):
+            self.ring.add("master0")
+        with self.assertRaises(ValueError):
+            self.ring.add("master9", weight=0)
+        with self.assertRaises(KeyError):
+            self.ring.remove("master9")
+
+    def test_key_hash(self):
+        self.assertEqual(key_hash(1), key_hash(1))
+        self.assertNotEqual(key_hash(1), key_hash(2))
+        self.assertEqual(key_hash("job"), key_hash(u"job"))
+        self.assertTrue(0 <= key_hash(-1) < 2 ** 64)
+
+    def test_deterministic(self):
+        other = HashRing(["master%d" % index for index in (4, 2, 0, 3, 1)])
+        self.assertEqual(self.ring, other)
+        self.assertEqual(self.ring.get_many(JOBS), other.get_many(JOBS))
+
+    def test_balance(self):
+        counts = dict((node, 0) for node in self.ring)
+        for node in self.ring.get_many(JOBS):
+            counts[node] += 1
+        expected = len(JOBS) / len(counts)
+        for count in counts.values():
+            self.assertTrue(expected * 0.7 < count < expected * 1.3, counts)
+
+    def test_weight(self):
+        ring = HashRing({"small": 1, "large": 3})
+        owners = ring.get_many(JOBS)
+        self.assertTrue(2 < owners.count("large") / owners.count("small") < 4)
+
+    def test_get_many(self):
+        keys = JOBS[:1000] + ["job%d" % index for index in range(1000)]
+        self.assertEqual(
+            self.ring.get_many(keys), [self.ring.get(key) for key in keys])
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_get_many_numpy(self):
+        keys = numpy.arange(-1000, 1000, dtype=numpy.int64)
+        expected = [self.ring.get(key) for key in range(-1000, 1000)]
+        self.assertEqual(self.ring.get_many(keys), expected)
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_get_numpy_scalars(self):
+        keys = numpy.array([-5, 0, 7, 2 ** 40, 2 ** 62], dtype=numpy.int64)
+        self.assertEqual(
+            self.ring.get_many(keys), [self.ring.get(key) for key in keys])
+        self.assertEqual(key_hash(keys[2]), key_hash(7))
+        self.assertEqual(key_hash(numpy.uint32(7)), key_hash(7))
+        for node, jobs in self.ring.partition(keys).items():
+            for job in jobs:
+                self.assertEqual(self.ring.get(job), node)
+
+    def test_partition(self):
+        partitions = self.ring.partition(JOBS)
+        self.assertEqual(set(partitions), set(self.ring))
+        self.assertEqual(sorted(sum(partitions.values(), [])), JOBS)
+        for node, jobs in partitions.items():
+            for job in jobs[:50]:
+                self.assertEqual(self.ring.get(job), node)
+
+    def test_serialize(self):
+        ring = HashRing({"a": 1, "b": 2.5}, replicas=50)
+        data = json.loads(json.dumps(ring.to_dict()))
+        copy = HashRing.from_dict(data)
+        self.assertEqual(copy, ring)
+        self.assertEqual(copy.get_many(JOBS), ring.get_many(JOBS))
+        self.assertNotEqual(copy, HashRing({"a": 1, "b": 2.5}))
+
+    def test_membership_churn(self):
+        rng = random.Random(0)
+        names = ["master%d" % index for index in range(5, 30)]
+        owners = dict(zip(JOBS, self.ring.get_many(JOBS)))
+
+        for _ in range(30):
+            nodes = list(self.ring)
+            if len(nodes) > 2 and (not names or rng.random() < 0.5):
+                changed = rng.choice(nodes)
+                self.ring.remove(changed)
+                names.append(changed)
+                joined = False
+            else:
+                changed = names.pop(rng.randrange(len(names)))
+                self.ring.add(changed)
+                joined = True
+
+            new_owners = dict(zip(JOBS, self.ring.get_many(JOBS)))
+            moved = [job for job in JOBS if owners[job] != new_owners[job]]
+            for job in moved:
+                if joined:
+                    # jobs only move to the node that joined
+                    self.assertEqual(new_owners[job], changed)
+                else:
+                    # only the jobs of the node that left move
+                    self.assertEqual(owners[job], changed)
+
+            # roughly 1/n of the jobs move each time
+            share = len(JOBS) / len(self.ring if joined else nodes)
+            self.assertTrue(len(moved) < share * 1.5, (len(moved), share))
+            owners = new_owners
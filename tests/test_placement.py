@@ -0,0 +1,192 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+from pyfarm.core.enums import PY26
+
+if PY26:
+    from unittest2 import TestCase
+else:
+    from unittest import TestCase
+
+from pyfarm.core.placement import ResourceMatcher
+
+
+class TestResourceMatcher(TestCase):
+    def setUp(self):
+        self.matcher = ResourceMatcher()
+        self.matcher.add_agent("a", cpus=8, ram=16384)
+        self.matcher.add_agent("b", cpus=8, ram=8192)
+        self.matcher.add_agent("c", cpus=2, ram=32768)
+
+    def test_find_best_fit(self):
+        self.assertEqual(self.matcher.find(1, 1024), "c")
+        self.assertEqual(self.matcher.find(4, 1024), "b")
+        self.assertEqual(self.matcher.find(4, 10000), "a")
+        self.assertEqual(self.matcher.find(2, 20000), "c")
+        self.assertIsNone(self.matcher.find(16, 1))
+        self.assertIsNone(self.matcher.find(1, 65536))
+
+    def test_assign_and_release(self):
+        self.assertEqual(self.matcher.assign(1, 2, 32768), "c")
+        self.assertEqual(self.matcher.free("c"), (0, 0))
+        self.assertEqual(self.matcher.assign(2, 1, 1024), "b")
+        self.assertEqual(self.matcher.agent(2), "b")
+        self.assertIsNone(self.matcher.assign(3, 1, 20000))
+        self.assertEqual(self.matcher.release(1), "c")
+        self.assertEqual(self.matcher.assign(3, 1, 20000), "c")
+        self.assertEqual(self.matcher.free("c"), (1, 12768))
+
+        with self.assertRaises(ValueError):
+            self.matcher.assign(3, 1, 1)
+        with self.assertRaises(KeyError):
+            self.matcher.release(4)
+
+    def test_reserve(self):
+        with self.assertRaises(ValueError):
+            self.matcher.reserve("b", 9, 1)
+        self.matcher.reserve("b", 8, 8192)
+        self.assertIsNone(self.matcher.find(4, 20000))
+        self.matcher.unreserve("b", 100, 100000)
+        self.assertEqual(self.matcher.free("b"), (8, 8192))
+
+    def test_add_remove_agent(self):
+        with self.assertRaises(ValueError):
+            self.matcher.add_agent("a", 1, 1)
+        self.matcher.assign(1, 8, 16384)
+        self.matcher.remove_agent("a")
+        self.assertNotIn("a", self.matcher)
+        self.assertEqual(len(self.matcher), 2)
+        with self.assertRaises(KeyError):
+            self.matcher.release(1)
+        self.assertEqual(self.matcher.capacity(), (10, 40960, 10, 40960))
+
+    def test_remove_agent_keeps_other_assignments(self):
+        self.assertEqual(self.matcher.assign(1, 8, 16384), "a")
+        self.assertEqual(self.matcher.assign(2, 1, 1024), "c")
+        self.assertEqual(self.matcher.assign(3, 1, 1024), "c")
+        self.assertEqual(self.matcher.release(3), "c")
+        self.assertEqual(self.matcher.assign(4, 4, 1024), "b")
+        self.matcher.remove_agent("c")
+        self.assertEqual(self.matcher.agent(1), "a")
+        self.assertEqual(self.matcher.agent(4), "b")
+        with self.assertRaises(KeyError):
+            self.matcher.agent(2)
+
+        self.matcher.add_agent("c", cpus=2, ram=32768)
+        self.assertEqual(self.matcher.assign(2, 1, 1024), "c")
+        self.matcher.remove_agent("a")
+        self.assertEqual(self.matcher.release(2), "c")
+        self.assertEqual(self.matcher.release(4), "b")
+
+    def test_assign_many(self):
+        matcher = ResourceMatcher()
+        matcher.add_agent("a", cpus=4, ram=4)
+        matcher.add_agent("b", cpus=4, ram=4)
+        tasks = [(1, 1, 1), (2, 1, 1), (3, 3, 3), (4, 3, 3)]
+        assigned, unassigned = matcher.assign_many(tasks)
+        self.assertEqual(unassigned, [])
+        self.assertNotEqual(assigned[3], assigned[4])
+        self.assertEqual(matcher.capacity(), (8, 8, 0, 0))
+
+        # placed in the order given the small tasks fill one agent and
+        # leave no room for the second large task
+        tasks = [(1, 2, 2), (2, 2, 2), (3, 3, 3), (4, 3, 3)]
+        for decreasing, expected in ((False, [4]), (True, [])):
+            matcher = ResourceMatcher()
+            matcher.add_agent("a", cpus=5, ram=5)
+            matcher.add_agent("b", cpus=5, ram=5)
+            assigned, unassigned = matcher.assign_many(
+                tasks, decreasing=decreasing)
+            self.assertEqual(unassigned, expected)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        matcher = ResourceMatcher()
+        free = {}
+        for agent_id in range(50):
+            cpus, ram = rng.randint(1, 16), rng.randint(1, 64) * 1024
+            matcher.add_agent(agent_id, cpus, ram)
+            free[agent_id] = [cpus, ram]
+
+        tasks = {}
+        for task_id in range(2000):
+            if tasks and rng.random() < 0.4:
+                task = rng.choice(list(tasks))
+                agent_id, cpus, ram = tasks.pop(task)
+                self.assertEqual(matcher.release(task), agent_id)
+                free[agent_id][0] += cpus
+                free[agent_id][1] += ram
+                continue
+
+            cpus, ram = rng.randint(1, 8), rng.randint(1, 32) * 1024
+            fits = [
+                (values[0] - cpus, values[1] - ram)
+                for values in free.values()
+                if values[0] >= cpus and values[1] >= ram]
+            agent_id = matcher.assign(task_id, cpus, ram)
+            if not fits:
+                self.assertIsNone(agent_id)
+                continue
+            self.assertEqual(
+                (free[agent_id][0] - cpus, free[agent_id][1] - ram),
+                min(fits))
+            free[agent_id][0] -= cpus
+            free[agent_id][1] -= ram
+            tasks[task_id] = (agent_id, cpus, ram)
+
+        for agent_id, values in free.items():
+            self.assertEqual(list(matcher.free(agent_id)), values)
+
+    def test_assign_many_duplicate(self):
+        matcher = ResourceMatcher()
+        matcher.add_agent("a", cpus=4, ram=4)
+        for decreasing in (True, False):
+            with self.assertRaises(ValueError):
+                matcher.assign_many(
+                    [(1, 1, 1), (2, 2, 2), (1, 1, 1)], decreasing=decreasing)
+            self.assertEqual(matcher.capacity(), (4, 4, 4, 4))
+
+        matcher.assign(3, 1, 1)
+        with self.assertRaises(ValueError):
+            matcher.assign_many([(1, 1, 1), (3, 1, 1)])
+        self.assertEqual(matcher.capacity(), (4, 4, 3, 3))
+
+    def test_assign_many_matches_assign(self):
+        rng = random.Random(1)
+        agents = [(agent_id, rng.randint(1, 8), rng.randint(1, 8))
+                  for agent_id in range(20)]
+        tasks = [(task_id, rng.randint(1, 4), rng.randint(1, 4))
+                 for task_id in range(200)]
+        batch = ResourceMatcher()
+        single = ResourceMatcher()
+        for agent in agents:
+            batch.add_agent(*agent)
+            single.add_agent(*agent)
+
+        assigned, unassigned = batch.assign_many(tasks, decreasing=False)
+        expected = dict(
+            (task[0], single.assign(*task)) for task in tasks)
+        self.assertEqual(
+            unassigned,
+            [task_id for task_id, agent_id in sorted(expected.items())
+             if agent_id is None])
+        self.assertEqual(
+            assigned,
+            dict((task_id, agent_id) for task_id, agent_id in expected.items()
+                 if agent_id is not None))
@@ -0,0 +1,225 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+
+from pyfarm.core.enums import PY26, DBWorkState, WorkState, _WorkState
+
+if PY26:
+    from unittest2 import TestCase, skipIf
+else:
+    from unittest import TestCase, skipIf
+
+from pyfarm.core.rollup import (
+    QUEUED, JobRollup, JobStateAggregator, job_state, rollup, rollup_jobs,
+    numpy)
+
+PAUSED = DBWorkState.PAUSED
+RUNNING = DBWorkState.RUNNING
+DONE = DBWorkState.DONE
+FAILED = DBWorkState.FAILED
+
+
+class TestJobState(TestCase):
+    def test_empty(self):
+        self.assertIsNone(job_state(0, 0, 0, 0, 0))
+
+    def test_running(self):
+        self.assertEqual(job_state(1, 1, 1, 1, 1), RUNNING)
+
+    def test_done(self):
+        self.assertEqual(job_state(0, 0, 0, 5, 0), DONE)
+
+    def test_failed(self):
+        self.assertEqual(job_state(0, 0, 0, 5, 1), FAILED)
+        self.assertIsNone(job_state(1, 0, 0, 5, 1))
+
+    def test_paused(self):
+        self.assertEqual(job_state(0, 2, 0, 5, 0), PAUSED)
+        self.assertEqual(job_state(0, 2, 0, 5, 1), PAUSED)
+        self.assertIsNone(job_state(1, 2, 0, 5, 0))
+
+    def test_queued(self):
+        self.assertIsNone(job_state(3, 0, 0, 0, 0))
+
+
+class TestJobRollup(TestCase):
+    def test_properties(self):
+        result = JobRollup(1, 0, 1, 2, 0)
+        self.assertEqual(result.total, 4)
+        self.assertEqual(result.state, RUNNING)
+        self.assertEqual(result.progress, 0.5)
+
+    def test_empty_progress(self):
+        self.assertEqual(JobRollup(0, 0, 0, 0, 0).progress, 0.0)
+
+
+class RollupTestMixin(object):
+    def sequence(self, values):
+        raise NotImplementedError
+
+    def test_rollup(self):
+        states = self.sequence(
+            [QUEUED, PAUSED, RUNNING, DONE, DONE, FAILED, 42, -1])
+        self.assertEqual(rollup(states), JobRollup(3, 1, 1, 2, 1))
+
+    def test_rollup_empty(self):
+        result = rollup(self.sequence([]))
+        self.assertEqual(result, JobRollup(0, 0, 0, 0, 0))
+        self.assertIsNone(result.state)
+
+    def test_rollup_done(self):
+        result = rollup(self.sequence([DONE] * 10))
+        self.assertEqual(result.state, DONE)
+        self.assertEqual(result.progress, 1.0)
+
+    def test_rollup_jobs(self):
+        job_ids = self.sequence([1, 2, 1, 3, 2, 1])
+        states = self.sequence([DONE, RUNNING, DONE, FAILED, 42, FAILED])
+        self.assertEqual(
+            rollup_jobs(job_ids, states),
+            {1: JobRollup(0, 0, 0, 2, 1),
+             2: JobRollup(1, 0, 1, 0, 0),
+             3: JobRollup(0, 0, 0, 0, 1)})
+
+    def test_rollup_jobs_length_mismatch(self):
+        with self.assertRaises(ValueError):
+            rollup_jobs(self.sequence([1, 2]), self.sequence([DONE]))
+
+
+class TestRollupArray(RollupTestMixin, TestCase):
+    def sequence(self, values):
+        return array("i", values)
+
+
+class TestRollupList(RollupTestMixin, TestCase):
+    def sequence(self, values):
+        return list(values)
+
+
+@skipIf(numpy is None, "numpy is not installed")
+class TestRollupNumpy(RollupTestMixin, TestCase):
+    def sequence(self, values):
+        return numpy.array(values, dtype=numpy.int32)
+
+    def test_rollup_jobs_sparse_ids(self):
+        self.assertEqual(
+            rollup_jobs(numpy.array([10 ** 9, 1]), numpy.array([DONE, FAILED])),
+            {1: JobRollup(0, 0, 0, 0, 1), 10 ** 9: JobRollup(0, 0, 0, 1, 0)})
+
+    def test_rollup_jobs_string_ids(self):
+        self.assertEqual(
+            rollup_jobs(numpy.array(["a", "b", "a"]),
+                        numpy.array([DONE, FAILED, DONE])),
+            {"a": JobRollup(0, 0, 0, 2, 0), "b": JobRollup(0, 0, 0, 0, 1)})
+
+    def test_rollup_jobs_mixed_input(self):
+        self.assertEqual(
+            rollup_jobs([1, 1], numpy.array([DONE, FAILED])),
+            {1: JobRollup(0, 0, 0, 1, 1)})
+
+
+class TestJobStateAggregator(TestCase):
+    def setUp(self):
+        self.aggregator = JobStateAggregator()
+        self.aggregator.add(1, count=3)
+
+    def test_add(self):
+        self.aggregator.add(1, DONE)
+        self.aggregator.add(2, WorkState.FAILED, count=2)
+        self.assertEqual(self.aggregator.counts(1), JobRollup(3, 0, 0, 1, 0))
+        self.assertEqual(self.aggregator.counts(2), JobRollup(0, 0, 0, 0, 2))
+        self.assertIn(2, self.aggregator)
+        self.assertEqual(len(self.aggregator), 2)
+        self.assertEqual(set(self.aggregator), set([1, 2]))
+
+    def test_add_invalid_state(self):
+        with self.assertRaises(ValueError):
+            self.aggregator.add(1, "foo")
+
+        with self.assertRaises(ValueError):
+            self.aggregator.add(1, [])
+
+    def test_remove(self):
+        self.aggregator.remove(1, QUEUED, count=2)
+        self.assertEqual(self.aggregator.counts(1), JobRollup(1, 0, 0, 0, 0))
+
+        with self.assertRaises(ValueError):
+            self.aggregator.remove(1, DONE)
+
+    def test_discard(self):
+        self.aggregator.discard(1)
+        self.aggregator.discard(1)
+        self.assertNotIn(1, self.aggregator)
+
+    def test_apply(self):
+        self.assertEqual(
+            self.aggregator.apply(1, None, WorkState.RUNNING), RUNNING)
+        self.assertEqual(
+            self.aggregator.apply(1, RUNNING, _WorkState.DONE), None)
+        self.assertEqual(self.aggregator.counts(1), JobRollup(2, 0, 0, 1, 0))
+        self.aggregator.apply(1, QUEUED, DONE)
+        self.assertEqual(self.aggregator.apply(1, QUEUED, FAILED), FAILED)
+        self.assertEqual(self.aggregator.state(1), FAILED)
+        self.assertAlmostEqual(self.aggregator.progress(1), 2 / 3.0)
+
+    def test_apply_invalid(self):
+        with self.assertRaises(KeyError):
+            self.aggregator.apply(2, None, DONE)
+
+        with self.assertRaises(ValueError):
+            self.aggregator.apply(1, None, 42)
+
+        with self.assertRaises(ValueError):
+            self.aggregator.apply(1, DONE, FAILED)
+
+        self.assertEqual(self.aggregator.counts(1), JobRollup(3, 0, 0, 0, 0))
+
+    def test_apply_many(self):
+        self.aggregator.add(2, DONE)
+        failed = self.aggregator.apply_many([
+            (1, None, RUNNING),
+            (1, DONE, FAILED),
+            (3, None, DONE),
+            (1, RUNNING, DONE),
+            (2, DONE, "foo"),
+            (2, DONE, PAUSED)])
+        self.assertEqual(failed, [1, 2, 4])
+        self.assertEqual(self.aggregator.counts(1), JobRollup(2, 0, 0, 1, 0))
+        self.assertEqual(self.aggregator.counts(2), JobRollup(0, 1, 0, 0, 0))
+        self.assertEqual(self.aggregator.state(2), PAUSED)
+
+    def test_load_and_verify(self):
+        states = array("i", [QUEUED, RUNNING, DONE, DONE])
+        self.aggregator.load(1, states)
+        self.assertTrue(self.aggregator.verify(1, states))
+        self.aggregator.apply(1, RUNNING, DONE)
+        self.assertFalse(self.aggregator.verify(1, states))
+        states[1] = DONE
+        self.assertTrue(self.aggregator.verify(1, states))
+
+    def test_load_and_verify_strings(self):
+        states = [None, WorkState.RUNNING, WorkState.DONE, "done", FAILED]
+        self.aggregator.load(1, states)
+        self.assertEqual(self.aggregator.counts(1), (1, 0, 1, 2, 1))
+        self.assertTrue(self.aggregator.verify(1, states))
+        self.assertTrue(
+            self.aggregator.verify(1, [QUEUED, RUNNING, DONE, DONE, FAILED]))
+        self.aggregator.apply(1, WorkState.RUNNING, WorkState.DONE)
+        self.assertFalse(self.aggregator.verify(1, states))
+        with self.assertRaises(ValueError):
+            self.aggregator.load(2, ["foo"])
+        self.assertNotIn(2, self.aggregator)
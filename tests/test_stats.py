@@ -0,0 +1,196 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+from pyfarm.core.enums import PY26, OperatingSystem, DBOperatingSystem
+
+if PY26:
+    from unittest2 import TestCase
+else:
+    from unittest import TestCase
+
+from pyfarm.core.stats import (
+    RunningStats, QuantileSketch, DecayingRate, JobStatistics)
+
+
+class TestRunningStats(TestCase):
+    def test_empty(self):
+        stats = RunningStats()
+        self.assertEqual(stats.count, 0)
+        self.assertEqual(stats.variance, 0.0)
+        self.assertIsNone(stats.minimum)
+
+    def test_add(self):
+        rng = random.Random(0)
+        values = [rng.uniform(0, 100) for _ in range(1000)]
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+        mean = sum(values) / len(values)
+        variance = sum((value - mean) ** 2 for value in values) / len(values)
+        self.assertAlmostEqual(stats.mean, mean)
+        self.assertAlmostEqual(stats.variance, variance)
+        self.assertEqual(stats.minimum, min(values))
+        self.assertEqual(stats.maximum, max(values))
+
+    def test_merge(self):
+        rng = random.Random(1)
+        values = [rng.gauss(50, 10) for _ in range(1000)]
+        combined, first, second = RunningStats(), RunningStats(), RunningStats()
+        for index, value in enumerate(values):
+            combined.add(value)
+            (first if index % 3 else second).add(value)
+        first.merge(second)
+        first.merge(RunningStats())
+        self.assertEqual(first.count, combined.count)
+        self.assertAlmostEqual(first.mean, combined.mean)
+        self.assertAlmostEqual(first.variance, combined.variance)
+        self.assertEqual(first.minimum, combined.minimum)
+        self.assertEqual(first.maximum, combined.maximum)
+
+        empty = RunningStats()
+        empty.merge(combined)
+        self.assertAlmostEqual(empty.stddev, combined.stddev)
+
+
+class TestQuantileSketch(TestCase):
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(accuracy=0)
+        with self.assertRaises(ValueError):
+            QuantileSketch().quantile(2)
+        with self.assertRaises(ValueError):
+            QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+    def test_empty(self):
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_accuracy(self):
+        rng = random.Random(2)
+        values = sorted(rng.lognormvariate(3, 1) for _ in range(10000))
+        sketch = QuantileSketch(accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+        self.assertEqual(len(sketch), 10000)
+        for q in (0.0, 0.1, 0.5, 0.95, 0.99, 1.0):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(
+                abs(sketch.quantile(q) - expected), expected * 0.01)
+
+    def test_zero(self):
+        sketch = QuantileSketch()
+        for value in (0, 0, 0, 10):
+            sketch.add(value)
+        self.assertEqual(sketch.quantile(0.5), 0.0)
+        self.assertAlmostEqual(sketch.quantile(1), 10, delta=0.1)
+
+    def test_merge(self):
+        first, second, combined = (
+            QuantileSketch(), QuantileSketch(), QuantileSketch())
+        for value in range(1, 1001):
+            (first if value % 2 else second).add(value)
+            combined.add(value)
+        first.merge(second)
+        for q in (0.25, 0.5, 0.75):
+            self.assertEqual(first.quantile(q), combined.quantile(q))
+
+
+class TestDecayingRate(TestCase):
+    def test_steady_rate(self):
+        rate = DecayingRate(halflife=60, clock=lambda: 0)
+        for second in range(1, 1001):
+            rate.add(2, now=second)
+        self.assertAlmostEqual(rate.rate(now=1000), 2, delta=0.05)
+        self.assertAlmostEqual(rate.rate(now=1060), 1, delta=0.05)
+
+    def test_empty(self):
+        self.assertEqual(DecayingRate().rate(), 0.0)
+        with self.assertRaises(ValueError):
+            DecayingRate(halflife=0)
+
+    def test_merge(self):
+        first = DecayingRate(halflife=60)
+        second = DecayingRate(halflife=60)
+        for second_ in range(1, 601):
+            first.add(now=second_)
+            second.add(3, now=second_)
+        first.merge(second)
+        first.merge(DecayingRate(halflife=60))
+        self.assertAlmostEqual(first.rate(now=600), 4, delta=0.1)
+
+
+class TestJobStatistics(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.stats = JobStatistics(clock=lambda: self.now)
+
+    def test_empty(self):
+        self.assertNotIn(1, self.stats)
+        self.assertIsNone(self.stats.mean(1))
+        self.assertIsNone(self.stats.quantile(1, 0.5))
+        self.assertEqual(self.stats.throughput(1), 0.0)
+        self.assertIsNone(self.stats.eta(1, 10))
+        self.assertEqual(self.stats.eta(1, 0), 0.0)
+
+    def test_by_os(self):
+        for self.now in range(1, 101):
+            self.stats.add(1, 10, os=OperatingSystem.LINUX)
+            self.stats.add(1, 30, os="windows")
+        self.stats.add(2, 5)
+        self.assertEqual(sorted(self.stats), [1, 2])
+        self.assertAlmostEqual(self.stats.mean(1), 20)
+        self.assertAlmostEqual(self.stats.mean(1, os="linux"), 10)
+        self.assertAlmostEqual(
+            self.stats.mean(1, os=DBOperatingSystem.WINDOWS), 30)
+        self.assertIsNone(self.stats.mean(1, os="mac"))
+        self.assertAlmostEqual(
+            self.stats.quantile(1, 0.95, os="windows"), 30, delta=0.3)
+        self.assertEqual(self.stats.get(1).stats.count, 200)
+
+        # two tasks a second
+        self.assertAlmostEqual(self.stats.throughput(1), 2, delta=0.1)
+        self.assertAlmostEqual(self.stats.eta(1, 100), 50, delta=3)
+
+    def test_discard(self):
+        self.stats.add(1, 10, os="linux")
+        self.stats.discard(1)
+        self.assertNotIn(1, self.stats)
+        self.assertIsNone(self.stats.get(1, os="linux"))
+
+    def test_merge(self):
+        other = JobStatistics(clock=lambda: self.now)
+        for self.now in range(1, 101):
+            self.stats.add(1, self.now, os="linux")
+            other.add(1, self.now + 100, os="linux")
+            other.add(2, 1)
+        self.stats.merge(other)
+        self.assertAlmostEqual(self.stats.mean(1), 100.5)
+        self.assertAlmostEqual(self.stats.mean(1, os="linux"), 100.5)
+        self.assertEqual(self.stats.get(2).stats.count, 100)
+        self.assertEqual(other.get(2).stats.count, 100)
+
+    def test_merge_different_accuracy(self):
+        other = JobStatistics(accuracy=0.05, clock=lambda: self.now)
+        other.add(1, 10.0)
+        other.add(2, 10.0)
+        self.stats.add(1, 20.0)
+        with self.assertRaises(ValueError):
+            self.stats.merge(other)
+        self.assertEqual(self.stats.get(1).stats.count, 1)
+        self.assertEqual(self.stats.mean(1), 20.0)
+        self.assertNotIn(2, self.stats)
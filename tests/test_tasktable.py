@@ -0,0 +1,144 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from math import isnan
+
+from pyfarm.core.enums import (
+    PY26, WorkState, DBWorkState, _WorkState, StateSet)
+
+if PY26:
+    from unittest2 import TestCase, skipIf
+else:
+    from unittest import TestCase, skipIf
+
+from pyfarm.core import tasktable
+from pyfarm.core.rollup import QUEUED, JobRollup
+from pyfarm.core.tasktable import NO_AGENT, TaskRow, TaskTable
+
+
+class TaskTableTestMixin(object):
+    use_numpy = True
+
+    def setUp(self):
+        self.numpy = tasktable.numpy
+        if not self.use_numpy:
+            tasktable.numpy = None
+
+        self.table = TaskTable()
+        self.table.extend(range(1, 101))
+        self.table.update(
+            [10, 11, 12], state=WorkState.FAILED, agent=3, attempts=[1, 2, 3])
+        self.table.update([20, 21], state=DBWorkState.FAILED, agent=4)
+        self.table.update([30], state="done", agent=3, start=1.5, end=2.5)
+
+    def tearDown(self):
+        tasktable.numpy = self.numpy
+
+    def rows(self, **filters):
+        return list(self.table.where(**filters))
+
+    def test_append(self):
+        row = self.table.append(101, state=WorkState.RUNNING, agent=9)
+        self.assertEqual(row, 100)
+        self.assertEqual(len(self.table), 101)
+        task = self.table.get(row)
+        self.assertEqual(task[:4], (101.0, DBWorkState.RUNNING, 9, 0))
+        self.assertTrue(isnan(task.start) and isnan(task.end))
+
+    def test_get(self):
+        self.assertEqual(
+            self.table.get(30), TaskRow(31.0, DBWorkState.DONE, 3, 0, 1.5, 2.5))
+        self.assertEqual(self.table.get(0)[:4], (1.0, QUEUED, NO_AGENT, 0))
+        with self.assertRaises(IndexError):
+            self.table.get(100)
+
+    def test_extend(self):
+        self.table.extend([200, 201], state=["running", None], agent=5)
+        self.assertEqual(len(self.table), 102)
+        self.assertEqual(self.table.get(100).state, DBWorkState.RUNNING)
+        self.assertEqual(self.table.get(101).state, QUEUED)
+        self.assertEqual(self.table.get(101).agent, 5)
+
+    def test_extend_invalid(self):
+        with self.assertRaises(ValueError):
+            self.table.extend([1, 2], attempts=[1])
+        with self.assertRaises(ValueError):
+            self.table.extend([1, 2], state="bogus")
+        with self.assertRaises(TypeError):
+            self.table.extend([1, 2], bogus=1)
+        for name, _ in TaskTable.COLUMNS:
+            self.assertEqual(len(getattr(self.table, name)), 100)
+
+    def test_update_invalid(self):
+        with self.assertRaises(TypeError):
+            self.table.update([1], frame=5)
+        with self.assertRaises(ValueError):
+            self.table.update([1, 2], attempts=[1])
+
+    def test_where(self):
+        self.assertEqual(
+            self.rows(state=WorkState.FAILED, agent=3), [10, 11, 12])
+        self.assertEqual(self.rows(state="failed"), [10, 11, 12, 20, 21])
+        self.assertEqual(
+            self.rows(state=StateSet(_WorkState, ["failed", "done"]),
+                      agent=[3]), [10, 11, 12, 30])
+        self.assertEqual(self.rows(agent=4), [20, 21])
+        self.assertEqual(self.rows(state=QUEUED, frames=(9, 13)), [8, 9])
+        self.assertEqual(self.rows(frames=(99, 1000)), [98, 99])
+        self.assertEqual(len(self.rows(agent=NO_AGENT)), 94)
+        self.assertEqual(self.table.count(state=[QUEUED]), 94)
+
+    def test_delete_and_compact(self):
+        self.table.delete([10, 20])
+        self.assertEqual(len(self.table), 98)
+        self.assertEqual(self.rows(state="failed"), [11, 12, 21])
+        self.assertEqual(self.table.rollup(), JobRollup(94, 0, 0, 1, 3))
+        with self.assertRaises(IndexError):
+            self.table.delete(10)
+        with self.assertRaises(IndexError):
+            self.table.update(10, attempts=1)
+
+        kept = list(self.table.compact())
+        self.assertEqual(len(kept), 98)
+        self.assertEqual(kept[10], 11)
+        self.assertEqual(len(self.table.frame), 98)
+        self.assertEqual(self.rows(state="failed"), [10, 11, 19])
+        self.assertEqual(self.table.get(10).attempts, 2)
+        self.assertEqual(self.table.rollup(), JobRollup(94, 0, 0, 1, 3))
+
+    def test_rollup(self):
+        self.assertEqual(self.table.rollup(), JobRollup(94, 0, 0, 1, 5))
+
+    def test_memory(self):
+        table = TaskTable()
+        table.extend(range(100000))
+        self.assertLess(table.bytes_per_task(), 64)
+
+
+class TestTaskTable(TaskTableTestMixin, TestCase):
+    use_numpy = False
+
+
+@skipIf(tasktable.numpy is None, "numpy is not installed")
+class TestTaskTableNumpy(TaskTableTestMixin, TestCase):
+    def test_numpy_input(self):
+        numpy = tasktable.numpy
+        table = TaskTable()
+        table.extend(numpy.arange(5), attempts=numpy.arange(5))
+        table.update(numpy.array([1, 2]), agent=numpy.array([7, 8]))
+        self.assertEqual(list(table.where(agent=[7, 8])), [1, 2])
+        self.assertEqual(list(table.attempts), [0, 1, 2, 3, 4])
@@ -0,0 +1,175 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+
+from pyfarm.core.enums import (
+    PY26, Enum, Values, WorkState, DBWorkState, AgentState, DBAgentState,
+    _WorkState, _AgentState)
+
+if PY26:
+    from unittest2 import TestCase, skipIf
+else:
+    from unittest import TestCase, skipIf
+
+from pyfarm.core.rollup import QUEUED
+from pyfarm.core.transitions import (
+    WORK_STATE_TRANSITIONS, AGENT_STATE_TRANSITIONS, TransitionTable, numpy)
+
+
+class TestTransitionTable(TestCase):
+    def setUp(self):
+        Values.check_uniqueness = False
+        self.enum = Enum(
+            "Light", ON=Values(1, "on"), OFF=Values(2, "off"),
+            BROKEN=Values(3, "broken"))
+        self.table = TransitionTable(
+            self.enum, {
+                "on": ["off", self.enum.BROKEN],
+                2: [1]})
+
+    def tearDown(self):
+        Values.check_uniqueness = True
+
+    def test_allowed(self):
+        self.assertTrue(self.table.allowed("on", "off"))
+        self.assertTrue(self.table.allowed(1, 3))
+        self.assertTrue(self.table.allowed(self.enum.OFF, self.enum.ON))
+        self.assertFalse(self.table.allowed("off", "broken"))
+        self.assertFalse(self.table.allowed("broken", "on"))
+        self.assertFalse(self.table.allowed(["on"], "off"))
+        self.assertFalse(self.table.allowed("on", {}))
+        self.assertEqual(
+            self.table.illegal(["on", ["on"]], ["off", "off"]), [1])
+
+    def test_unchanged_allowed(self):
+        for value in self.enum:
+            self.assertTrue(self.table.allowed(value, value))
+
+    def test_unknown_state(self):
+        self.assertFalse(self.table.allowed("foo", "foo"))
+        self.assertFalse(self.table.allowed("on", 42))
+        self.assertFalse(self.table.allowed(None, "on"))
+
+    def test_validate(self):
+        self.table.validate("on", "off")
+        with self.assertRaises(ValueError):
+            self.table.validate("broken", "on")
+
+    def test_targets(self):
+        self.assertEqual(
+            self.table.targets("on"),
+            [self.enum.ON, self.enum.OFF, self.enum.BROKEN])
+        self.assertEqual(self.table.targets(3), [self.enum.BROKEN])
+
+        with self.assertRaises(ValueError):
+            self.table.targets("foo")
+
+    def test_invalid_transition_definition(self):
+        with self.assertRaises(ValueError):
+            TransitionTable(self.enum, {"on": ["foo"]})
+
+    def test_duplicate_extra_state(self):
+        with self.assertRaises(ValueError):
+            TransitionTable(self.enum, {}, extra_states=[(1, )])
+
+    def test_extra_states(self):
+        table = TransitionTable(
+            self.enum, {None: ["on"]}, extra_states=[(0, None)])
+        self.assertTrue(table.allowed(0, "on"))
+        self.assertTrue(table.allowed(None, 1))
+        self.assertFalse(table.allowed("on", None))
+
+    def test_illegal(self):
+        self.assertEqual(
+            self.table.illegal(
+                ["on", 2, "broken", "foo", 1],
+                ["off", "on", 1, "on", 1]),
+            [2, 3])
+
+    def test_illegal_array(self):
+        self.assertEqual(
+            self.table.illegal(array("i", [1, 2, 3]), array("i", [3, 3, 3])),
+            [1])
+
+    def test_illegal_length_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.table.illegal([1, 2], [1])
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_illegal_numpy(self):
+        result = self.table.illegal(
+            numpy.array([1, 2, 3, -1, 42, 1]),
+            numpy.array([3, 1, 1, 1, 1, 1]))
+        self.assertIsInstance(result, numpy.ndarray)
+        self.assertEqual(result.tolist(), [2, 3, 4])
+
+
+class TestWorkStateTransitions(TestCase):
+    def test_queued(self):
+        for queued in (None, QUEUED):
+            self.assertTrue(
+                WORK_STATE_TRANSITIONS.allowed(queued, WorkState.RUNNING))
+            self.assertTrue(
+                WORK_STATE_TRANSITIONS.allowed(DBWorkState.DONE, queued))
+            self.assertFalse(
+                WORK_STATE_TRANSITIONS.allowed(queued, WorkState.DONE))
+
+    def test_failed_to_running(self):
+        self.assertFalse(
+            WORK_STATE_TRANSITIONS.allowed(WorkState.FAILED, WorkState.RUNNING))
+        self.assertFalse(
+            WORK_STATE_TRANSITIONS.allowed(
+                DBWorkState.FAILED, DBWorkState.RUNNING))
+        self.assertFalse(
+            WORK_STATE_TRANSITIONS.allowed(
+                _WorkState.FAILED, _WorkState.RUNNING))
+
+    def test_running(self):
+        for state in (None, WorkState.PAUSED, WorkState.DONE,
+                      WorkState.FAILED):
+            self.assertTrue(
+                WORK_STATE_TRANSITIONS.allowed(WorkState.RUNNING, state))
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_illegal_numpy(self):
+        old = numpy.array(
+            [QUEUED, DBWorkState.FAILED, DBWorkState.RUNNING], dtype=numpy.int16)
+        new = numpy.array(
+            [DBWorkState.RUNNING, DBWorkState.RUNNING, DBWorkState.DONE],
+            dtype=numpy.int16)
+        self.assertEqual(WORK_STATE_TRANSITIONS.illegal(old, new).tolist(), [1])
+
+
+class TestAgentStateTransitions(TestCase):
+    def test_offline_to_running(self):
+        self.assertFalse(
+            AGENT_STATE_TRANSITIONS.allowed(
+                AgentState.OFFLINE, AgentState.RUNNING))
+        self.assertFalse(
+            AGENT_STATE_TRANSITIONS.allowed(
+                DBAgentState.OFFLINE, DBAgentState.RUNNING))
+
+    def test_online(self):
+        for state in (AgentState.OFFLINE, AgentState.DISABLED,
+                      AgentState.RUNNING):
+            self.assertTrue(
+                AGENT_STATE_TRANSITIONS.allowed(AgentState.ONLINE, state))
+
+    def test_work_states_not_valid(self):
+        self.assertFalse(AGENT_STATE_TRANSITIONS.allowed(None, "online"))
+        self.assertFalse(
+            AGENT_STATE_TRANSITIONS.allowed(_AgentState.ONLINE, "done"))
@@ -0,0 +1,243 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+from pyfarm.core.enums import PY26, WorkState, DBWorkState
+
+if PY26:
+    from unittest2 import skipIf
+else:
+    from unittest import skipIf
+
+from pyfarm.core.rollup import QUEUED, JobRollup, JobStateAggregator
+from pyfarm.core.testutil import TestCase
+from pyfarm.core.translog import (
+    DTYPE, HEADER, RECORD, NO_AGENT, Transition, TransitionLog, numpy)
+
+RUNNING = DBWorkState.RUNNING
+DONE = DBWorkState.DONE
+FAILED = DBWorkState.FAILED
+
+
+class TestTransitionLog(TestCase):
+    def setUp(self):
+        super(TestTransitionLog, self).setUp()
+        self.path = os.path.join(self.tempdir, "transitions.log")
+
+    def records(self, count):
+        return [(float(time), time % 10, None, WorkState.RUNNING, time % 3)
+                for time in range(count)]
+
+    def test_append(self):
+        with TransitionLog(self.path) as log:
+            log.append(1.5, 10, None, WorkState.RUNNING, agent=2)
+            log.append(2.5, 10, "running", DBWorkState.DONE)
+            self.assertEqual(len(log), 2)
+            self.assertEqual(list(log.records()), [
+                Transition(1.5, 10, QUEUED, RUNNING, 2),
+                Transition(2.5, 10, RUNNING, DONE, NO_AGENT)])
+        self.assertEqual(
+            os.path.getsize(self.path), HEADER.size + RECORD.size * 2)
+        self.assertEqual(RECORD.size, 26)
+
+    def test_time_order(self):
+        log = TransitionLog(self.path)
+        log.append(5, 1, None, "running")
+        with self.assertRaises(ValueError):
+            log.append(4, 1, "running", "done")
+        with self.assertRaises(ValueError):
+            log.extend([(6, 1, None, "running"), (5, 1, None, "running")])
+        with self.assertRaises(ValueError):
+            log.extend([(1, 1, None, "running")])
+        self.assertEqual(len(log), 1)
+
+    def test_invalid_state(self):
+        log = TransitionLog(self.path)
+        with self.assertRaises(ValueError):
+            log.append(1, 1, None, "bogus")
+        with self.assertRaises(ValueError):
+            log.extend([(1, 1, None, "running"), (2, 1, "bogus", None)])
+        self.assertEqual(len(log), 0)
+
+    def test_reopen(self):
+        with TransitionLog(self.path, index_interval=7) as log:
+            log.extend(self.records(100))
+
+        log = TransitionLog(self.path, index_interval=7)
+        self.assertEqual(len(log), 100)
+        self.assertEqual(log._index, [float(time) for time in range(0, 100, 7)])
+        with self.assertRaises(ValueError):
+            log.append(98, 1, None, "running")
+        log.append(99, 1, None, "running")
+        self.assertEqual(len(log), 101)
+
+    def test_partial_record(self):
+        with TransitionLog(self.path) as log:
+            log.extend(self.records(10))
+        with open(self.path, "ab") as stream:
+            stream.write(b"\x00" * 5)
+
+        log = TransitionLog(self.path)
+        self.assertEqual(len(log), 10)
+        self.assertEqual(
+            os.path.getsize(self.path), HEADER.size + RECORD.size * 10)
+
+    def test_repair(self):
+        with TransitionLog(self.path) as log:
+            log.extend(self.records(10))
+            self.assertFalse(log.repair())
+            log._file.write(b"\x00" * 5)
+            self.assertTrue(log.repair())
+            log.append(20.0, 1, None, "running")
+        self.assertEqual(len(TransitionLog(self.path, readonly=True)), 11)
+
+    def test_readonly(self):
+        with TransitionLog(self.path) as log:
+            log.extend(self.records(10))
+        with open(self.path, "ab") as stream:
+            stream.write(b"\x00" * 5)
+
+        log = TransitionLog(self.path, readonly=True)
+        self.assertEqual(len(log), 10)
+        self.assertEqual(
+            os.path.getsize(self.path), HEADER.size + RECORD.size * 10 + 5)
+        self.assertEqual(len(list(log.records(start=5))), 5)
+        for method, args in (
+                (log.append, (20.0, 1, None, "running")),
+                (log.extend, ([], )), (log.repair, ())):
+            with self.assertRaises(IOError):
+                method(*args)
+
+    def test_concurrent_reader(self):
+        writer = TransitionLog(self.path)
+        writer.extend(self.records(10))
+
+        # the writer's buffer is flushed part way through a record
+        record = RECORD.pack(10.0, 1, QUEUED, RUNNING, 1)
+        writer._file.write(record[:11])
+        writer._file.flush()
+
+        reader = TransitionLog(self.path, readonly=True)
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(
+            [record.time for record in reader.records(start=9)], [9.0])
+        reader.close()
+
+        writer._file.write(record[11:])
+        writer._indexed([10.0])
+        writer.append(11.0, 2, None, "running")
+        writer.close()
+
+        reader = TransitionLog(self.path, readonly=True)
+        self.assertEqual(
+            [record.time for record in reader.records()],
+            [float(time) for time in range(12)])
+        self.assertEqual(
+            os.path.getsize(self.path), HEADER.size + RECORD.size * 12)
+
+    def test_not_a_log(self):
+        with open(self.path, "wb") as stream:
+            stream.write(b"hello world, this is not a log")
+        with self.assertRaises(ValueError):
+            TransitionLog(self.path)
+
+    def test_seek(self):
+        log = TransitionLog(self.path, index_interval=16)
+        log.extend(
+            (time // 3, 1, None, "running", None) for time in range(1000))
+        self.assertEqual(log.seek(-1), 0)
+        self.assertEqual(log.seek(0), 0)
+        self.assertEqual(log.seek(0.5), 3)
+        self.assertEqual(log.seek(100), 300)
+        self.assertEqual(log.seek(333), 999)
+        self.assertEqual(log.seek(334), 1000)
+        self.assertEqual(TransitionLog(
+            os.path.join(self.tempdir, "empty.log")).seek(10), 0)
+
+    def test_seek_duplicate_times_across_blocks(self):
+        log = TransitionLog(self.path, index_interval=4)
+        log.extend(
+            (1.0 if task < 6 else 2.0, task, None, "running", None)
+            for task in range(12))
+        self.assertEqual(log.seek(1.0), 0)
+        self.assertEqual(log.seek(1.5), 6)
+        self.assertEqual(log.seek(2.0), 6)
+        self.assertEqual(log.seek(2.5), 12)
+        self.assertEqual(
+            [record.task for record in log.records(start=2.0)],
+            list(range(6, 12)))
+        self.assertEqual(
+            [record.task for record in log.records(1.0, 2.0)],
+            list(range(6)))
+
+    def test_records_range(self):
+        log = TransitionLog(self.path, index_interval=8)
+        log.extend(self.records(100))
+        times = [record.time for record in log.records(start=10.5, end=20)]
+        self.assertEqual(times, [float(time) for time in range(11, 20)])
+        self.assertEqual(list(log.records(start=50, end=50)), [])
+        self.assertEqual(list(log.records(start=60, end=50)), [])
+        self.assertEqual(len(list(log.records(start=95))), 5)
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        records = numpy.zeros(100, dtype=DTYPE)
+        records["time"] = numpy.arange(100)
+        records["task"] = numpy.arange(100) % 5
+        records["new"] = RUNNING
+        records["agent"] = NO_AGENT
+        log = TransitionLog(self.path, index_interval=8)
+        log.extend(records)
+        log.extend(self.records(0))
+        self.assertEqual(len(log), 100)
+        self.assertEqual(log._index, [float(time) for time in range(0, 100, 8)])
+
+        read = log.read(start=10, end=20)
+        self.assertEqual(read["time"].tolist(), list(range(10, 20)))
+        self.assertEqual(read["new"].tolist(), [RUNNING] * 10)
+        self.assertEqual(len(log.read(start=200)), 0)
+
+        records["time"] = numpy.arange(100)[::-1] + 100
+        with self.assertRaises(ValueError):
+            log.extend(records)
+
+        records["time"] = numpy.arange(100) + 100
+        for column in ("old", "new"):
+            invalid = records.copy()
+            invalid[column][50] = 42
+            with self.assertRaises(ValueError):
+                log.extend(invalid)
+        self.assertEqual(len(log), 100)
+
+    def test_replay(self):
+        log = TransitionLog(self.path)
+        log.extend([
+            (1, 1, None, "running", 1),
+            (2, 2, None, "running", 1),
+            (3, 1, "running", "done", 1),
+            (4, 2, "running", "failed", 1),
+            (5, 3, None, "running", 1),
+            (6, 9, None, "running", 1)])
+
+        aggregator = JobStateAggregator()
+        aggregator.add("job", count=3)
+        job_of = {1: "job", 2: "job", 3: "job"}
+        self.assertEqual(log.replay(aggregator, job_of, end=5), [])
+        self.assertEqual(aggregator.counts("job"), JobRollup(1, 0, 0, 1, 1))
+        self.assertEqual(log.replay(aggregator, job_of, start=5), [1])
+        self.assertEqual(aggregator.counts("job"), JobRollup(0, 0, 1, 1, 1))
@@ -16,11 +16,37 @@
 
 from __future__ import with_statement
 
+import json
+import os
+import pickle
+import random
+from array import array
 from json import loads
 
+try:
+    from StringIO import StringIO
+except ImportError:  # pragma: no cover
+    from io import StringIO
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
 from pyfarm.core.testutil import TestCase
-from pyfarm.core.enums import Values, BOOLEAN_TRUE, BOOLEAN_FALSE, NONE
-from pyfarm.core.utility import convert, dumps, ImmutableDict
+from pyfarm.core.enums import (
+    PY26, Values, BOOLEAN_TRUE, BOOLEAN_FALSE, NONE, Enum, WorkState,
+    DBWorkState, _WorkState, _AgentState, _OperatingSystem)
+from pyfarm.core import utility
+from pyfarm.core.utility import (
+    convert, dump, dumps, ImmutableDict, JSON_BACKENDS, StdlibJSONBackend,
+    OrjsonJSONBackend, get_json_backend, WireCodec, pack, unpack, FrozenDict,
+    record_type, FrameSet, FrameCost, chunk_frames, PyFarmJSONEncoder)
+
+if PY26:
+    from unittest2 import skipIf
+else:
+    from unittest import skipIf
 
 
 class ConvertSize(TestCase):
@@ -98,6 +124,91 @@ class ConvertList(TestCase):
         self.assertEqual(convert.list("a:b", sep=":"), ["a", "b"])
 
 
+class ConvertBatch(TestCase):
+    def test_bools(self):
+        values = ["yes", " N ", True, 0, "maybe", None, [], "YES"]
+        result = convert.bools(values)
+        self.assertEqual(result.values, array("b", [1, 0, 1, 0, 0, 0, 0, 1]))
+        self.assertEqual(result.errors, [4, 5, 6])
+        for index, value in enumerate(values):
+            if index not in result.errors:
+                self.assertEqual(result.values[index], convert.bool(value))
+
+    def test_nones(self):
+        result = convert.nones(iter(["null", "None ", None, "", "foo", 1]))
+        self.assertEqual(result.values, array("b", [1, 1, 1, 1, 0, 0]))
+        self.assertEqual(result.errors, [4, 5])
+
+    def test_stons(self):
+        result = convert.stons(["1", 2, "-3", "foo", None, "[]"])
+        self.assertEqual(result.values, array("q", [1, 2, -3, 0, 0, 0]))
+        self.assertEqual(result.errors, [3, 4, 5])
+
+    def test_stons_float(self):
+        result = convert.stons(["1", "1.5", 2])
+        self.assertEqual(result.values, array("d", [1.0, 1.5, 2.0]))
+        self.assertEqual(result.errors, [])
+
+    def test_stons_large(self):
+        result = convert.stons(["1", str(2 ** 70)])
+        self.assertEqual(result.values, [1, 2 ** 70])
+
+    def test_stons_types(self):
+        result = convert.stons(["1", "1.5"], types=int)
+        self.assertEqual(result.values, array("q", [1, 0]))
+        self.assertEqual(result.errors, [1])
+
+    def test_lists(self):
+        result = convert.lists(["a, b", "a, b", "c,,", 1])
+        self.assertEqual(result.values, [("a", "b"), ("a", "b"), ("c", ), ()])
+        self.assertEqual(result.errors, [3])
+        with self.assertRaises(TypeError):
+            convert.lists(["a"], sep=None)
+
+    def test_equal_values_of_different_types(self):
+        values = [1, 1.0, "2", True, "1"]
+        result = convert.stons(values)
+        self.assertEqual(result.values, array("d", [1.0, 1.0, 2.0, 1.0, 1.0]))
+        self.assertEqual(
+            [type(convert.ston(value)) for value in values[:2]],
+            [int, float])
+        self.assertEqual(convert.stons([1.0, 1]).values, array("d", [1, 1]))
+        self.assertEqual(convert.stons([1, True]).values, array("q", [1, 1]))
+        self.assertEqual(
+            convert.stons([1, 2 ** 70, 1.0]).values, [1, 2 ** 70, 1.0])
+        self.assertIs(convert.stons([1, 2 ** 70, 1.0]).values[2], 1.0)
+
+        values = [0, False, 0.0, "0", 1, 1.0, True, "1", "x", None]
+        for batch, scalar in ((convert.bools, convert.bool),
+                              (convert.nones, convert.none)):
+            result = batch(values)
+            for index, value in enumerate(values):
+                try:
+                    expected = scalar(value)
+                except ValueError:
+                    self.assertIn(index, result.errors)
+                else:
+                    self.assertNotIn(index, result.errors)
+                    if scalar is convert.none:
+                        expected = expected is None
+                    self.assertEqual(result.values[index], expected)
+
+    def test_unhashable(self):
+        result = convert.stons(["1", [1], "2"])
+        self.assertEqual(result.values, array("q", [1, 0, 2]))
+        self.assertEqual(result.errors, [1])
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        result = convert.bools(numpy.array(["y", "n", "x"]))
+        self.assertEqual(result.values.dtype, numpy.bool_)
+        self.assertEqual(result.values.tolist(), [True, False, False])
+        self.assertEqual(result.errors, [2])
+        result = convert.stons(numpy.array(["1", "2.5"]))
+        self.assertEqual(result.values.dtype, numpy.float64)
+        self.assertEqual(result.values.tolist(), [1.0, 2.5])
+
+
 class JSONDumper(TestCase):
     def setUp(self):
         Values.check_uniqueness = False
@@ -107,6 +218,282 @@ class JSONDumper(TestCase):
             loads(dumps({"data": Values(1, "A")})),
             loads(dumps({"data": "A"})))
 
+    def test_dump_nested_enum_value(self):
+        data = {"a": [_WorkState.RUNNING, {"b": (_WorkState.DONE, 1)}],
+                "c": _WorkState.FAILED}
+        self.assertEqual(
+            loads(dumps(data)),
+            {"a": ["running", {"b": ["done", 1]}], "c": "failed"})
+        self.assertEqual(dumps(_WorkState.PAUSED), '"paused"')
+
+        # the input is not modified
+        self.assertIs(data["c"], _WorkState.FAILED)
+
+    def test_dump_enum(self):
+        self.assertEqual(
+            loads(dumps(_WorkState)),
+            dict((name.upper(), name)
+                 for name in ("paused", "running", "done", "failed")))
+        self.assertEqual(loads(dumps(WorkState)), loads(dumps(_WorkState)))
+        self.assertEqual(
+            loads(dumps(DBWorkState))["RUNNING"], DBWorkState.RUNNING)
+
+    def test_dump_namedtuple(self):
+        point = Enum("Point", x=1, y=2)
+        self.assertEqual(sorted(loads(dumps(point))), [1, 2])
+
+    def test_dump_unsupported(self):
+        with self.assertRaises(TypeError):
+            dumps({"a": object()})
+
+    def test_dump_stream(self):
+        stream = StringIO()
+        dump({"data": [Values(1, "A")]}, stream)
+        self.assertEqual(loads(stream.getvalue()), {"data": ["A"]})
+
+    def test_dump_stream_large(self):
+        tasks = [{"id": index, "state": _WorkState.DONE, "tags": ("a", )}
+                 for index in range(1200)]
+        data = {"jobs": [{"id": 1, "tasks": tasks}, {"id": 2, "tasks": []}],
+                "ids": list(range(1100)), 1: _WorkState.RUNNING}
+        expected = {
+            "jobs": [{"id": 1, "tasks": [
+                {"id": index, "state": "done", "tags": ["a"]}
+                for index in range(1200)]}, {"id": 2, "tasks": []}],
+            "ids": list(range(1100)), "1": "running"}
+
+        for indent in (None, 2, "\t"):
+            encoder = PyFarmJSONEncoder(indent=indent)
+            self.assertEqual(
+                "".join(encoder.iterencode(data)),
+                json.dumps(expected, indent=indent))
+
+        stream = StringIO()
+        dump(data, stream)
+        self.assertEqual(loads(stream.getvalue()), expected)
+
+        # the input is not modified
+        self.assertIs(tasks[0]["state"], _WorkState.DONE)
+
+    def test_dump_stream_circular(self):
+        data = list(range(1000))
+        data.append(data)
+        with self.assertRaises(ValueError):
+            dump(data, StringIO())
+
+
+def job_payload():
+    return {
+        "id": 1, "title": u"r\u00e9nder", "state": WorkState.RUNNING,
+        "priority": -5, "ram": 2048, "ratio": 0.25, "tags": None,
+        "data": {"1": True, "2": False}, "requires": ("a", "b"),
+        "tasks": [
+            {"frame": 1.5, "state": DBWorkState.DONE, "agent": None},
+            {"frame": 2.0, "state": _WorkState.FAILED, "agent": 12}],
+        "states": WorkState}
+
+
+class JSONBackends(TestCase):
+    def setUp(self):
+        super(JSONBackends, self).setUp()
+        self.backends = [
+            backend for backend in JSON_BACKENDS if backend.available]
+
+    def test_default_backend(self):
+        # orjson is opt in through PYFARM_JSON_BACKEND only, it's not
+        # used just because it's installed
+        os.environ.pop("PYFARM_JSON_BACKEND", None)
+        self.assertIsInstance(get_json_backend(), StdlibJSONBackend)
+        self.assertIsInstance(utility.json_backend, StdlibJSONBackend)
+
+    def test_backend_from_environment(self):
+        if not OrjsonJSONBackend.available:
+            self.skipTest("orjson is not installed")
+        os.environ["PYFARM_JSON_BACKEND"] = "orjson"
+        self.assertIsInstance(get_json_backend(), OrjsonJSONBackend)
+
+    def test_default_output(self):
+        os.environ.pop("PYFARM_JSON_BACKEND", None)
+        data = [1, u"\u00e9", float("nan"), {"a": [0.25, None]}]
+        self.assertEqual(dumps(data), json.dumps(data))
+        self.assertEqual(dumps([1, u"\u00e9"]), '[1, "\\u00e9"]')
+        self.assertEqual(
+            get_json_backend(pretty=True).dumps(data),
+            json.dumps(data, indent=4))
+
+    def test_get_by_name(self):
+        backend = get_json_backend("json")
+        self.assertIsInstance(backend, StdlibJSONBackend)
+        self.assertFalse(backend.pretty)
+        self.assertTrue(get_json_backend("json", pretty=True).pretty)
+
+    def test_get_missing(self):
+        with self.assertRaises(ValueError):
+            get_json_backend("foo")
+
+    def test_identical_data(self):
+        for pretty in (False, True):
+            outputs = [
+                loads(backend(pretty=pretty).dumps(job_payload()))
+                for backend in self.backends]
+            for output in outputs:
+                self.assertEqual(output, loads(dumps(job_payload())))
+
+    def test_stdlib_output(self):
+        data = {"a": [1, 0.25, None], "b": u"r\u00e9nder", "c": {"d": True}}
+        self.assertEqual(StdlibJSONBackend().dumps(data), json.dumps(data))
+        self.assertEqual(
+            StdlibJSONBackend(pretty=True).dumps(data),
+            json.dumps(data, indent=4))
+        self.assertEqual(
+            StdlibJSONBackend().dumps({"a": [1, WorkState.DONE]}),
+            '{"a": [1, "done"]}')
+
+    def test_orjson_output(self):
+        if not OrjsonJSONBackend.available:
+            self.skipTest("orjson is not installed")
+        self.assertEqual(
+            OrjsonJSONBackend().dumps({"a": [1, WorkState.DONE]}),
+            '{"a":[1,"done"]}')
+
+    def test_loads_enums(self):
+        data = '{"state": "done", "tasks": [{"state": 106}, {"state": 1}]}'
+        for backend in self.backends:
+            result = backend().loads(data, enums={"state": WorkState})
+            self.assertIs(result["state"], _WorkState.DONE)
+            self.assertIs(result["tasks"][0]["state"], _WorkState.DONE)
+            self.assertEqual(result["tasks"][1]["state"], 1)
+            self.assertEqual(
+                backend().loads(data)["state"], "done")
+
+    def test_loads_uncast_enum(self):
+        for backend in self.backends:
+            result = backend().loads(
+                '{"state": "paused"}', enums={"state": _WorkState})
+            self.assertIs(result["state"], _WorkState.PAUSED)
+
+    def test_round_trip(self):
+        for backend in self.backends:
+            backend = backend()
+            result = backend.loads(
+                backend.dumps(job_payload()), enums={"state": WorkState})
+            self.assertIs(result["state"], _WorkState.RUNNING)
+            self.assertIs(result["tasks"][0]["state"], _WorkState.DONE)
+            self.assertIs(result["tasks"][1]["state"], _WorkState.FAILED)
+
+    def test_orjson_fallback(self):
+        if not OrjsonJSONBackend.available:
+            self.skipTest("orjson is not installed")
+        data = {"x": float("nan"), "y": [float("inf"), (-float("inf"), )],
+                "z": None}
+        self.assertEqual(OrjsonJSONBackend().dumps(data), json.dumps(data))
+        self.assertEqual(
+            OrjsonJSONBackend().dumps({"x": 1.5, "y": None}),
+            '{"x":1.5,"y":null}')
+        self.assertEqual(
+            OrjsonJSONBackend().dumps([2 ** 70]), "[%d]" % 2 ** 70)
+        with self.assertRaises(TypeError):
+            OrjsonJSONBackend().dumps({"a": object()})
+
+    def test_wide_integers(self):
+        data = [2 ** 70, -2 ** 63 - 1, 2 ** 63, 1, 0.5, {"a": -2 ** 100}]
+        for backend in self.backends:
+            backend = backend()
+            self.assertEqual(backend.loads(backend.dumps(data)), data)
+            self.assertEqual(
+                backend.loads(backend.dumps([2 ** 70]).encode("utf-8")),
+                [2 ** 70])
+            self.assertIsInstance(backend.loads(dumps([2 ** 70]))[0], int)
+
+    def test_kwargs_use_stdlib(self):
+        self.assertEqual(
+            dumps({"b": 1, "a": 2}, sort_keys=True), '{"a": 2, "b": 1}')
+
+
+def fleet_payload():
+    return [
+        {"hostname": "render%02d.example.com" % (index % 3),
+         "state": _AgentState.RUNNING, "os": _OperatingSystem.LINUX,
+         "free_ram": 1024 * index, "cpus": 16, "load": 0.5 * index,
+         "tasks": [{"id": -index, "state": _WorkState.RUNNING,
+                    "frame": 1.0, "title": u"r\u00e9nder"}],
+         "tags": ["a"] * 70 + ["tag%d" % i for i in range(70)]}
+        for index in range(5)]
+
+
+class Wire(TestCase):
+    def setUp(self):
+        super(Wire, self).setUp()
+        Values.check_uniqueness = False
+
+    def assertRoundTrip(self, data):
+        self.assertEqual(unpack(pack(data)), loads(dumps(data)))
+
+    def test_round_trip(self):
+        self.assertRoundTrip(fleet_payload())
+        self.assertRoundTrip(job_payload())
+
+    def test_scalars(self):
+        for value in (None, True, False, 0, 127, 128, -1, -129, 2 ** 70,
+                      -2 ** 70, 1.5, -0.0, 1e300, 2.0, -2.0, 2.0 ** 60,
+                      u"", u"\u00e9"):
+            self.assertRoundTrip(value)
+            self.assertRoundTrip([value, {"key": value}])
+
+    def test_keys(self):
+        self.assertRoundTrip({1: "a", 1.5: "b", True: "c", None: "d"})
+        with self.assertRaises(TypeError):
+            pack({(1, 2): 1})
+
+    def test_enum_as_code(self):
+        data = pack([_WorkState.RUNNING, _AgentState.RUNNING])
+        self.assertEqual(len(data), 1 + 2 + 2 + 3)
+        self.assertEqual(unpack(data), ["running", "running"])
+        self.assertEqual(
+            unpack(data, values=True),
+            [_WorkState.RUNNING, _AgentState.RUNNING])
+        self.assertIs(unpack(data, values=True)[1], _AgentState.RUNNING)
+
+    def test_enum(self):
+        self.assertRoundTrip({"states": _WorkState, "cast": WorkState})
+
+    def test_unknown_enum(self):
+        light = Enum("Light", ON=Values(1, "on"))
+        self.assertEqual(unpack(pack(light.ON)), "on")
+        codec = WireCodec(enums=[light])
+        self.assertEqual(len(codec.pack(light.ON)), 3)
+        self.assertEqual(codec.unpack(codec.pack(_WorkState.DONE)), "done")
+
+    def test_duplicate_codes(self):
+        with self.assertRaises(ValueError):
+            WireCodec(enums=[Enum("A", X=Values(1, "x")),
+                             Enum("B", X=Values(1, "y"))])
+
+    def test_strings_written_once(self):
+        data = pack(["render01.example.com"] * 100)
+        self.assertLess(len(data), len("render01.example.com") + 110)
+
+    def test_smaller_than_json(self):
+        data = fleet_payload()
+        self.assertLess(len(pack(data)), len(dumps(data)) / 2)
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            pack({"a": object()})
+
+    def test_corrupt(self):
+        data = pack(fleet_payload())
+        for bad in (b"", b"\x02" + data[1:], data[:-1], data + b"\x00",
+                    data[:1] + b"\x3f", data[:1] + b"\x07\x05"):
+            with self.assertRaises(ValueError):
+                unpack(bad)
+
+        # {"k": 1} with the key replaced by an empty list
+        data = pack({"k": 1})
+        self.assertEqual(data[3:6], b"\x06\x01k")
+        with self.assertRaises(ValueError):
+            unpack(data[:3] + b"\x08\x00" + data[6:])
+
 
 class TestImmutableDict(TestCase):
     def test_no_decorator(self):
@@ -145,3 +532,478 @@ class TestImmutableDict(TestCase):
             i.update(one=1)
 
         self.assertEqual(i, {"true": True})
+
+
+class Colliding(object):
+    """A key which has the same hash as every other key with the same
+    value modulo 3"""
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return self.value % 3
+
+    def __eq__(self, other):
+        return isinstance(other, Colliding) and other.value == self.value
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class TestFrozenDict(TestCase):
+    def test_mapping(self):
+        frozen = FrozenDict([("a", 1)], b=2)
+        self.assertEqual(len(frozen), 2)
+        self.assertEqual(frozen["a"], 1)
+        self.assertEqual(frozen.get("c", 3), 3)
+        self.assertIn("b", frozen)
+        self.assertNotIn("c", frozen)
+        self.assertEqual(sorted(frozen), ["a", "b"])
+        self.assertEqual(sorted(frozen.keys()), ["a", "b"])
+        self.assertEqual(sorted(frozen.values()), [1, 2])
+        self.assertEqual(sorted(frozen.items()), [("a", 1), ("b", 2)])
+        self.assertEqual(frozen.keys() & set(["a"]), set(["a"]))
+        self.assertEqual(FrozenDict(frozen), frozen)
+        self.assertIs(frozen.copy(), frozen)
+        with self.assertRaises(KeyError):
+            frozen["c"]
+        with self.assertRaises(TypeError):
+            FrozenDict({}, {})
+
+    def test_immutable(self):
+        frozen = FrozenDict(a=1)
+        with self.assertRaises(TypeError):
+            frozen["a"] = 2
+        with self.assertRaises(AttributeError):
+            frozen.x = 1
+
+    def test_set_delete(self):
+        base = FrozenDict(a=1, b=2)
+        changed = base.set("a", 3).set("c", 4)
+        self.assertEqual(base, {"a": 1, "b": 2})
+        self.assertEqual(changed, {"a": 3, "b": 2, "c": 4})
+        self.assertEqual(changed.delete("c").delete("a"), {"b": 2})
+        self.assertIs(base.set("a", 1), base)
+        self.assertIs(base.discard("c"), base)
+        self.assertEqual(base.discard("a"), {"b": 2})
+        self.assertEqual(base.delete("a").delete("b"), {})
+        with self.assertRaises(KeyError):
+            base.delete("c")
+
+    def test_merge(self):
+        base = FrozenDict(a=1)
+        self.assertIs(base.merge(), base)
+        self.assertIs(base.merge(a=1), base)
+        self.assertEqual(base.merge({"b": 2}, c=3), {"a": 1, "b": 2, "c": 3})
+        self.assertEqual(base, {"a": 1})
+
+    def test_matches_dict(self):
+        for key in (int, str, Colliding, lambda value: value << 58):
+            random.seed(0)
+            expected = {}
+            frozen = FrozenDict()
+            hash(frozen)
+            snapshots = []
+            for index in range(2000):
+                name = key(random.randrange(300))
+                if name in expected and random.random() < 0.4:
+                    del expected[name]
+                    frozen = frozen.delete(name)
+                else:
+                    expected[name] = random.randrange(5)
+                    frozen = frozen.set(name, expected[name])
+                self.assertEqual(len(frozen), len(expected))
+                if not index % 250:
+                    snapshots.append((dict(expected), frozen))
+
+            for snapshot, version in snapshots + [(expected, frozen)]:
+                self.assertEqual(version, snapshot)
+                self.assertEqual(dict(version.items()), snapshot)
+                self.assertEqual(hash(version), hash(FrozenDict(snapshot)))
+
+            for name in list(expected):
+                frozen = frozen.delete(name)
+            self.assertEqual(list(frozen), [])
+
+    def test_hash(self):
+        frozen = FrozenDict(a=1, b=2)
+        self.assertEqual(hash(frozen), hash(FrozenDict(b=2, a=1)))
+        self.assertEqual({frozen: 1}[FrozenDict(b=2, a=1)], 1)
+        self.assertNotEqual(frozen, frozen.set("a", 2))
+        self.assertNotEqual(frozen, {"a": 1})
+        self.assertNotEqual(frozen, None)
+        with self.assertRaises(TypeError):
+            hash(FrozenDict(a=[]))
+        self.assertEqual(FrozenDict(a=[]).set("b", 1), {"a": [], "b": 1})
+
+    def test_pickle(self):
+        frozen = FrozenDict(a=1, b=FrozenDict(c=2))
+        self.assertEqual(pickle.loads(pickle.dumps(frozen)), frozen)
+
+    def test_dumps(self):
+        frozen = FrozenDict(a=1, b=FrozenDict(c=[1]))
+        self.assertEqual(loads(dumps(frozen)), {"a": 1, "b": {"c": [1]}})
+        self.assertEqual(unpack(pack(frozen)), {"a": 1, "b": {"c": [1]}})
+
+
+class TestRecordType(TestCase):
+    def setUp(self):
+        super(TestRecordType, self).setUp()
+        self.Agent = record_type("Agent", ("hostname", "cpus", "ram"))
+
+    def test_cached(self):
+        self.assertIs(record_type("Agent", ["hostname", "cpus", "ram"]),
+                      self.Agent)
+        self.assertIsNot(record_type("Agent", ["hostname", "cpus"]),
+                         self.Agent)
+
+    def test_duplicate_keys(self):
+        with self.assertRaises(ValueError):
+            record_type("Foo", ("a", "a"))
+
+    def test_construct(self):
+        expected = {"hostname": "a", "cpus": 1, "ram": 2}
+        self.assertEqual(self.Agent("a", 1, 2), expected)
+        self.assertEqual(self.Agent._from_mapping(expected), expected)
+        self.assertEqual(self.Agent(**expected), expected)
+        self.assertEqual(self.Agent._make(["a", 1, 2]), expected)
+        self.assertEqual(self.Agent._make(iter(["a", 1, 2])), expected)
+
+    def test_construct_errors(self):
+        with self.assertRaises(TypeError):
+            self.Agent("a", 1)
+        with self.assertRaises(TypeError):
+            self.Agent(hostname="a", cpus=1)
+        with self.assertRaises(TypeError):
+            self.Agent(hostname="a", cpus=1, ram=2, foo=3)
+        with self.assertRaises(TypeError):
+            self.Agent._make(["a", 1, 2, 3])
+        with self.assertRaises(TypeError):
+            self.Agent({"hostname": "a", "cpus": 1, "ram": 2})
+        with self.assertRaises(TypeError):
+            self.Agent._from_mapping({"hostname": "a", "cpus": 1})
+        with self.assertRaises(TypeError):
+            self.Agent._from_mapping(
+                {"hostname": "a", "cpus": 1, "ram": 2, "foo": 3})
+
+    def test_single_key(self):
+        Options = record_type("Options", ("env", ))
+        env = {"env": "a"}
+        self.assertEqual(Options(env)["env"], env)
+        self.assertEqual(Options(env=env)["env"], env)
+        self.assertEqual(Options._from_mapping(env)["env"], "a")
+
+    def test_mapping(self):
+        agent = self.Agent("a", 1, 2)
+        self.assertEqual(list(agent), ["hostname", "cpus", "ram"])
+        self.assertEqual(list(agent.values()), ["a", 1, 2])
+        self.assertEqual(len(agent), 3)
+        self.assertEqual(agent["cpus"], 1)
+        self.assertEqual(agent.get("cpus"), 1)
+        self.assertIsNone(agent.get("foo"))
+        self.assertIn("ram", agent)
+        self.assertNotIn("foo", agent)
+        self.assertNotIn([], agent)
+        self.assertIs(agent.copy(), agent)
+        with self.assertRaises(KeyError):
+            agent["foo"]
+        with self.assertRaises(KeyError):
+            agent[[]]
+
+    def test_read_only(self):
+        agent = self.Agent("a", 1, 2)
+        with self.assertRaises(AttributeError):
+            agent.foo = 1
+        with self.assertRaises(AttributeError):
+            agent._0 = 1
+        with self.assertRaises(AttributeError):
+            del agent._0
+        with self.assertRaises(TypeError):
+            agent["cpus"] = 1
+        self.assertFalse(hasattr(agent, "__dict__"))
+
+    def test_equality_and_hash(self):
+        agent = self.Agent("a", 1, 2)
+        self.assertEqual(agent, self.Agent("a", 1, 2))
+        self.assertNotEqual(agent, self.Agent("a", 1, 3))
+        self.assertNotEqual(agent, {"hostname": "a"})
+        frozen = FrozenDict(agent)
+        self.assertEqual(agent, frozen)
+        self.assertEqual(hash(agent), hash(frozen))
+        self.assertEqual(hash(agent), hash(self.Agent("a", 1, 2)))
+
+    def test_pickle(self):
+        agent = self.Agent("a", 1, 2)
+        self.assertEqual(pickle.loads(pickle.dumps(agent)), agent)
+
+    def test_dumps(self):
+        agent = self.Agent("a", 1, 2)
+        self.assertEqual(loads(dumps(agent)), dict(agent))
+        self.assertEqual(unpack(pack(agent)), dict(agent))
+
+
+def expand(expression):
+    """Expands a frame range expression into a set the slow way"""
+    frames = set()
+    for token in expression.split(","):
+        if token:
+            start, _, rest = token.partition("-")
+            end, _, step = rest.partition("x")
+            frames.update(range(
+                int(start), int(end or start) + 1, int(step or 1)))
+    return frames
+
+
+class TestFrameSet(TestCase):
+    def random_expression(self):
+        tokens = []
+        for _ in range(random.randint(0, 5)):
+            start = random.randint(0, 120)
+            kind = random.random()
+            if kind < 0.3:
+                tokens.append(str(start))
+            elif kind < 0.6:
+                tokens.append("%d-%d" % (start, start + random.randint(0, 50)))
+            else:
+                tokens.append("%d-%dx%d" % (
+                    start, start + random.randint(0, 80),
+                    random.randint(1, 7)))
+        return ",".join(tokens)
+
+    def test_parse(self):
+        frames = FrameSet(" 1-10x3, 20 ,-5--3,,")
+        self.assertEqual(list(frames), [-5, -4, -3, 1, 4, 7, 10, 20])
+        self.assertEqual(frames.runs, ((-5, -3, 1), (1, 10, 3), (20, 20, 1)))
+        self.assertEqual(frames.start, -5)
+        self.assertEqual(frames.end, 20)
+        self.assertEqual(list(FrameSet("1-10x4")), [1, 5, 9])
+        self.assertEqual(FrameSet("1-10x4").runs, ((1, 9, 4), ))
+
+    def test_parse_overlapping(self):
+        self.assertEqual(str(FrameSet("5-20,1-10,1-30x2")), "1-20,21-29x2")
+
+    def test_parse_errors(self):
+        for expression in ("a", "1-", "10-1", "1-10x0", "1-10x-1", "1.5"):
+            with self.assertRaises(ValueError):
+                FrameSet(expression)
+
+    def test_other_inputs(self):
+        self.assertEqual(list(FrameSet(range(10, 0, -3))), [1, 4, 7, 10])
+        self.assertEqual(FrameSet(range(5, 6)).runs, ((5, 5, 1), ))
+        self.assertEqual(len(FrameSet(range(0))), 0)
+        self.assertEqual(str(FrameSet([9, 1, 5, 5])), "1-9x4")
+        frames = FrameSet("1-5")
+        self.assertEqual(FrameSet(frames), frames)
+        self.assertEqual(len(FrameSet()), 0)
+        self.assertFalse(FrameSet())
+        self.assertIsNone(FrameSet().start)
+
+    def test_large(self):
+        frames = FrameSet("1-100000000")
+        self.assertEqual(len(frames), 100000000)
+        self.assertIn(50000000, frames)
+        self.assertEqual(frames[-1], 100000000)
+        self.assertEqual(
+            str(frames - FrameSet("1-100000000x2")), "2-100000000x2")
+        self.assertEqual(
+            str(frames & FrameSet("50-150x50,99999999-200000000")),
+            "50-150x50,99999999-100000000")
+
+    def test_compress(self):
+        for frames, expected in (
+                ([], ""), ([1], "1"), ([1, 2], "1-2"), ([1, 3], "1,3"),
+                ([1, 2, 4, 6, 8], "1,2-8x2"),
+                ([1, 2, 3, 10, 20, 30], "1-3,10-30x10"),
+                ([1, 3, 4, 5], "1,3-5")):
+            self.assertEqual(str(FrameSet(frames)), expected)
+
+    def test_matches_sets(self):
+        random.seed(0)
+        for _ in range(500):
+            first, second = (self.random_expression(),
+                             self.random_expression())
+            frames_a, frames_b = FrameSet(first), FrameSet(second)
+            expected_a, expected_b = expand(first), expand(second)
+            self.assertEqual(list(frames_a), sorted(expected_a))
+            self.assertEqual(len(frames_a), len(expected_a))
+
+            for result, expected in (
+                    (frames_a | frames_b, expected_a | expected_b),
+                    (frames_a & frames_b, expected_a & expected_b),
+                    (frames_a - frames_b, expected_a - expected_b)):
+                self.assertEqual(list(result), sorted(expected))
+                self.assertEqual(len(result), len(expected))
+                self.assertEqual(FrameSet(str(result)), result)
+
+            for frame in range(-5, 210):
+                self.assertEqual(frame in frames_a, frame in expected_a)
+            for index, frame in enumerate(sorted(expected_a)):
+                self.assertEqual(frames_a[index], frame)
+
+    def test_methods(self):
+        frames = FrameSet("1-10")
+        self.assertEqual(str(frames.union("20")), "1-10,20")
+        self.assertEqual(str(frames.intersection([2, 3, 30])), "2-3")
+        self.assertEqual(str(frames.difference(range(1, 10))), "10")
+
+    def test_index_errors(self):
+        with self.assertRaises(IndexError):
+            FrameSet("1-5")[5]
+        with self.assertRaises(IndexError):
+            FrameSet("1-5")[-6]
+
+    def test_equality(self):
+        self.assertEqual(FrameSet([1, 3]), FrameSet("1,3"))
+        self.assertEqual(FrameSet("1-3,4-6"), FrameSet("1-6"))
+        self.assertNotEqual(FrameSet("1-3"), FrameSet("1-4"))
+        self.assertNotEqual(FrameSet("1-3"), "1-3")
+        with self.assertRaises(TypeError):
+            hash(FrameSet("1"))
+
+    def test_repr_pickle(self):
+        frames = FrameSet("1-10x2,20")
+        self.assertEqual(repr(frames), "FrameSet('1-9x2,20')")
+        self.assertEqual(pickle.loads(pickle.dumps(frames)), frames)
+
+    def test_slice(self):
+        frames = FrameSet("1-10x2,20-22")
+        self.assertEqual(str(frames[1:4]), "3-7x2")
+        self.assertEqual(str(frames[3:]), "7,9,20-22")
+        self.assertEqual(str(frames[-2:]), "21-22")
+        self.assertEqual(len(frames[5:2]), 0)
+        for start in range(-9, 10):
+            for stop in range(-9, 10):
+                self.assertEqual(
+                    list(frames[start:stop]), list(frames)[start:stop])
+        with self.assertRaises(ValueError):
+            frames[::2]
+
+
+class TestFrameCost(TestCase):
+    def test_call(self):
+        cost = FrameCost({"1-10": 3, (20, 29): 2.5, 50: 0}, default=1)
+        self.assertEqual(cost(1), 3)
+        self.assertEqual(cost(10), 3)
+        self.assertEqual(cost(11), 1)
+        self.assertEqual(cost(25), 2.5)
+        self.assertEqual(cost(50), 0)
+        self.assertEqual(cost(-5), 1)
+        self.assertEqual(FrameCost()(1), 1.0)
+        self.assertEqual(FrameCost([(5, 2)])(5), 2)
+
+    def test_errors(self):
+        for costs in ({"1-": 1}, {"1-10x2": 1}, {(5, 1): 1}, {1: -1},
+                      {"1-10": 1, "10-20": 1}):
+            with self.assertRaises(ValueError):
+                FrameCost(costs)
+        with self.assertRaises(ValueError):
+            FrameCost(default=-1)
+
+    def test_segments(self):
+        cost = FrameCost({"1-10": 3, "15-16": 0}, default=1)
+        frames = FrameSet("1-20x2,100-200")
+        self.assertEqual(
+            cost.segments(frames), [(0, 3), (5, 1), (7, 0), (8, 1)])
+        self.assertEqual(FrameCost().segments(frames), [(0, 1.0)])
+        self.assertEqual(FrameCost().segments(FrameSet()), [])
+
+    def test_segments_match_frames(self):
+        random.seed(1)
+        for _ in range(300):
+            frames = FrameSet(TestFrameSet().random_expression())
+            costs, first = {}, 0
+            for _ in range(random.randint(0, 4)):
+                first += random.randint(0, 30)
+                last = first + random.randint(0, 30)
+                costs[(first, last)] = random.choice((0, 0.5, 2, 5))
+                first = last + 1
+            cost = FrameCost(costs, default=random.choice((0, 1)))
+            expanded = []
+            segments = cost.segments(frames) + [(len(frames), None)]
+            for (position, value), (end, _) in zip(segments, segments[1:]):
+                expanded.extend([value] * (end - position))
+            self.assertEqual(expanded, [cost(frame) for frame in frames])
+
+
+class TestChunkFrames(TestCase):
+    def chunks(self, *args, **kwargs):
+        return [str(chunk) for chunk in chunk_frames(*args, **kwargs)]
+
+    def test_size(self):
+        self.assertEqual(
+            self.chunks("1-10x2,20-22", size=3), ["1-5x2", "7,9,20", "21-22"])
+        self.assertEqual(self.chunks("1-4", size=2), ["1-2", "3-4"])
+        self.assertEqual(self.chunks("1-4", size=10), ["1-4"])
+        self.assertEqual(self.chunks("", size=10), [])
+
+    def test_count(self):
+        self.assertEqual(self.chunks("1-10", count=3), ["1-3", "4-7", "8-10"])
+        self.assertEqual(self.chunks("1-2", count=4), ["1", "2"])
+        self.assertEqual(self.chunks("1-10", count=1), ["1-10"])
+
+    def test_count_cost(self):
+        cost = FrameCost({"1-10": 3.0})
+        self.assertEqual(
+            self.chunks("1-20", count=2, cost=cost), ["1-7", "8-20"])
+        self.assertEqual(
+            self.chunks("1-20", count=2, cost=lambda frame: cost(frame)),
+            ["1-7", "8-20"])
+        self.assertEqual(
+            self.chunks("1-6", count=3, cost=FrameCost(default=0)),
+            ["1-2", "3-4", "5-6"])
+
+    def test_max_cost(self):
+        self.assertEqual(
+            self.chunks("1-10", max_cost=4), ["1-4", "5-8", "9-10"])
+        cost = FrameCost({"3": 10, "6-7": 2})
+        self.assertEqual(
+            self.chunks("1-10", max_cost=4, cost=cost),
+            ["1-2", "3", "4-6", "7-9", "10"])
+        self.assertEqual(
+            self.chunks("1-10", max_cost=4, cost=lambda frame: cost(frame)),
+            ["1-2", "3", "4-6", "7-9", "10"])
+
+    def test_callable_matches_cost_model(self):
+        random.seed(2)
+        for _ in range(300):
+            frames = FrameSet(TestFrameSet().random_expression())
+            costs, first = {}, 0
+            for _ in range(random.randint(0, 4)):
+                first += random.randint(0, 30)
+                last = first + random.randint(0, 30)
+                costs[(first, last)] = random.choice((0, 0.5, 2, 5))
+                first = last + 1
+            model = FrameCost(costs, default=random.choice((0, 1, 2)))
+            function = lambda frame: model(frame)
+
+            for kwargs in ({"count": random.randint(1, 8)},
+                           {"max_cost": random.choice((0.5, 1, 3, 7))}):
+                chunks = list(chunk_frames(frames, cost=model, **kwargs))
+                self.assertEqual(chunks, list(
+                    chunk_frames(frames, cost=function, **kwargs)))
+                self.assertEqual(
+                    [frame for chunk in chunks for frame in chunk],
+                    list(frames))
+                self.assertTrue(all(chunks))
+                if "count" in kwargs:
+                    self.assertLessEqual(len(chunks), kwargs["count"])
+                else:
+                    for chunk in chunks:
+                        self.assertTrue(
+                            len(chunk) == 1 or
+                            sum(map(model, chunk)) <= kwargs["max_cost"])
+
+    def test_large(self):
+        chunks = chunk_frames("1-10000000", size=100)
+        self.assertEqual(str(next(chunks)), "1-100")
+        self.assertEqual(str(next(chunks)), "101-200")
+        chunks = list(chunk_frames("1-10000000", count=1000))
+        self.assertEqual(len(chunks), 1000)
+        self.assertTrue(all(len(chunk) == 10000 for chunk in chunks))
+
+    def test_errors(self):
+        for kwargs in ({}, {"size": 1, "count": 1}, {"size": 0},
+                       {"count": -1}, {"max_cost": 0},
+                       {"size": 1, "cost": FrameCost()}):
+            with self.assertRaises(ValueError):
+                list(chunk_frames("1-10", **kwargs))
@@ -0,0 +1,204 @@
+# No shebang line, this module is meant to be imported
+#
+# Copyright 2013 Oliver Palmer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+from pyfarm.core.enums import PY26, WorkState, DBWorkState
+
+if PY26:
+    from unittest2 import TestCase
+else:
+    from unittest import TestCase
+
+from pyfarm.core.rollup import QUEUED
+from pyfarm.core.workqueue import IndexedHeap, WorkQueue
+
+
+class TestIndexedHeap(TestCase):
+    def test_pop_order(self):
+        rng = random.Random(0)
+        keys = list(range(500))
+        rng.shuffle(keys)
+        heap = IndexedHeap()
+        for key in keys[:250]:
+            heap.push("item%d" % key, key)
+        heap.extend(("item%d" % key, key) for key in keys[250:])
+        self.assertEqual(len(heap), 500)
+        self.assertEqual(
+            [heap.pop()[1] for _ in range(500)], list(range(500)))
+        self.assertFalse(heap)
+
+    def test_update_and_remove(self):
+        rng = random.Random(1)
+        heap = IndexedHeap((item, item) for item in range(200))
+        expected = dict((item, item) for item in range(200))
+        for _ in range(500):
+            item = rng.choice(list(expected))
+            if rng.random() < 0.3:
+                self.assertEqual(heap.remove(item), expected.pop(item))
+            else:
+                expected[item] = rng.random() * 1000
+                heap.update(item, expected[item])
+            item = rng.choice(list(expected))
+            self.assertEqual(heap.key(item), expected[item])
+        result = []
+        while heap:
+            result.append(heap.pop())
+        self.assertEqual(
+            result, sorted(expected.items(), key=lambda item: item[1]))
+
+    def test_ties_in_insertion_order(self):
+        items = [object() for _ in range(20)]
+        heap = IndexedHeap((item, 1) for item in items[:10])
+        for item in items[10:]:
+            heap.push(item, 1)
+        heap.push("other type", 0)
+        heap.update(items[3], 1)
+        self.assertEqual(heap.pop(), ("other type", 0))
+        self.assertEqual([heap.pop()[0] for _ in range(20)], items)
+
+    def test_duplicate(self):
+        heap = IndexedHeap([("a", 1)])
+        with self.assertRaises(ValueError):
+            heap.push("a", 2)
+        with self.assertRaises(ValueError):
+            heap.extend([("b", 1), ("b", 2)])
+        self.assertEqual(len(heap), 1)
+
+    def test_empty(self):
+        heap = IndexedHeap()
+        with self.assertRaises(IndexError):
+            heap.pop()
+        with self.assertRaises(IndexError):
+            heap.peek()
+        with self.assertRaises(KeyError):
+            heap.remove("a")
+
+
+class TestWorkQueue(TestCase):
+    def setUp(self):
+        self.queue = WorkQueue(fair_share=False)
+
+    def drain(self, queue=None):
+        queue = queue or self.queue
+        result = []
+        while len(queue):
+            result.append(queue.pop()[0])
+        return result
+
+    def test_priority_then_age(self):
+        self.queue.push("low", 1, priority=1, queued_at=0)
+        self.queue.push("new", 2, priority=5, queued_at=10)
+        self.queue.push("old", 3, priority=5, queued_at=5)
+        self.queue.push("older", 2, priority=5, queued_at=1)
+        self.assertEqual(len(self.queue), 4)
+        self.assertEqual(self.queue.peek(), ("older", 2))
+        self.assertEqual(self.drain(), ["older", "old", "new", "low"])
+        with self.assertRaises(IndexError):
+            self.queue.pop()
+
+    def test_excluded_states(self):
+        self.queue.push("a", 1, queued_at=0, state=WorkState.PAUSED)
+        self.queue.push("b", 1, queued_at=1, state=DBWorkState.FAILED)
+        self.queue.push("c", 1, queued_at=2, state="done")
+        self.queue.push("d", 1, queued_at=3, state=QUEUED)
+        self.queue.push("e", 1, queued_at=4)
+        self.assertEqual(len(self.queue), 2)
+        self.queue.update("e", state=WorkState.PAUSED)
+        self.queue.update("b", state=QUEUED)
+        self.assertEqual(self.queue.state("e"), DBWorkState.PAUSED)
+        self.assertIsNone(self.queue.state("b"))
+        self.assertEqual(self.drain(), ["b", "d"])
+        self.assertEqual(self.queue.state("d"), DBWorkState.RUNNING)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.queue.push("a", 1, state="bogus")
+        self.queue.push("a", 1)
+        with self.assertRaises(ValueError):
+            self.queue.push("a", 1)
+        with self.assertRaises(ValueError):
+            self.queue.update("a", state=[])
+        with self.assertRaises(KeyError):
+            self.queue.update("b", priority=1)
+        with self.assertRaises(KeyError):
+            self.queue.remove("b")
+
+    def test_reprioritize(self):
+        self.queue.push("a", 1, priority=1, queued_at=0)
+        self.queue.push("b", 2, priority=1, queued_at=1)
+        self.queue.update("b", priority=2)
+        self.assertEqual(self.queue.peek(), ("b", 2))
+        self.queue.update("b", queued_at=-1, priority=1)
+        self.assertEqual(self.queue.peek(), ("b", 2))
+
+    def test_remove(self):
+        self.queue.push("a", 1, queued_at=0)
+        self.queue.push("b", 1, queued_at=1)
+        self.queue.push("c", 1, queued_at=2, state=WorkState.RUNNING)
+        self.assertEqual(self.queue.running(1), 1)
+        self.queue.remove("a")
+        self.queue.remove("c")
+        self.assertNotIn("a", self.queue)
+        self.assertEqual(self.queue.running(1), 0)
+        self.assertEqual(self.drain(), ["b"])
+
+    def test_fair_share(self):
+        queue = WorkQueue()
+        queue.extend(("a%d" % i, "a", 0, i) for i in range(10))
+        queue.extend(("b%d" % i, "b", 0, 100 + i) for i in range(10))
+        dispatched = [queue.pop()[1] for _ in range(6)]
+        self.assertEqual(sorted(dispatched), ["a"] * 3 + ["b"] * 3)
+
+        # finishing a's tasks gives a the next dispatch
+        for task_id in ("a0", "a1"):
+            queue.update(task_id, state=WorkState.DONE)
+        self.assertEqual(queue.running("a"), 1)
+        self.assertEqual(queue.pop()[1], "a")
+
+        # higher priority is always first
+        queue.push("c", "c", priority=1)
+        self.assertEqual(queue.pop(), ("c", "c"))
+
+    def test_fair_share_weight(self):
+        queue = WorkQueue()
+        queue.set_weight("a", 3)
+        queue.extend(("a%d" % i, "a", 0, i) for i in range(10))
+        queue.extend(("b%d" % i, "b", 0, i) for i in range(10))
+        dispatched = [queue.pop()[1] for _ in range(8)]
+        self.assertEqual(dispatched.count("a"), 6)
+        with self.assertRaises(ValueError):
+            queue.set_weight("a", 0)
+
+    def test_extend_matches_push(self):
+        rng = random.Random(2)
+        tasks = [
+            (task_id, rng.randrange(20), rng.randrange(3), rng.random(),
+             rng.choice([None, None, None, WorkState.PAUSED]))
+            for task_id in range(1000)]
+        pushed = WorkQueue(fair_share=False)
+        for task in tasks:
+            pushed.push(*task)
+        extended = WorkQueue(fair_share=False)
+        extended.extend(tasks[:10])
+        extended.extend(tasks[10:])
+        self.assertEqual(len(pushed), len(extended))
+        self.assertEqual(self.drain(pushed), self.drain(extended))
+
+        with self.assertRaises(ValueError):
+            extended.extend([("x", 1), ("x", 1)])
+        self.assertNotIn("x", extended)